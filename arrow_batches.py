@@ -0,0 +1,56 @@
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required for Arrow record batches. Install it with `pip install pyarrow`.")
+
+def is_arrow_table(data):
+    return pa is not None and isinstance(data, pa.Table)
+
+# Fixed schema of each source's record batches
+def shiphero_stock_levels_schema():
+    return pa.schema([
+        ('id', pa.string()),
+        ('sku', pa.string()),
+        ('on_hand', pa.int32()),
+        ('allocated', pa.int32()),
+        ('available', pa.int32()),
+        ('backorder', pa.int32()),
+        ('warehouse_id', pa.string())
+    ])
+
+def airtable_variants_schema(field_kinds):
+    return pa.schema([
+        (field, pa.float64() if kind == 'number' else pa.string())
+        for field, kind in field_kinds.items()
+    ])
+
+def shiphero_edges_to_batch(edges, schema):
+    """Convert one page of ShipHero edges into a record batch, one column at a time."""
+    nodes = [edge['node'] for edge in edges]
+    return pa.RecordBatch.from_arrays(
+        [pa.array([node.get(field.name) for node in nodes], type=field.type) for field in schema],
+        schema=schema
+    )
+
+def columns_to_batch(columns, schema):
+    """Convert a {field: values} page of columns into a record batch with the given schema."""
+    return pa.RecordBatch.from_arrays(
+        [pa.array(columns[field.name], type=field.type, from_pandas=True) for field in schema],
+        schema=schema
+    )
+
+def batches_to_table(batches, schema):
+    return pa.Table.from_batches(batches, schema=schema)
+
+def write_arrow_cache(table, path):
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+def read_arrow_cache(path):
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all()
@@ -0,0 +1,87 @@
+import json, re
+import pandas as pd
+
+class BulkOutput(list):
+    """
+    Rows of a Shopify bulk operation, with the window of the query that produced them:
+    window_start and window_end, the first and last date it covered, and fetched_at, the UTC
+    time it was submitted. Consumers replacing stored data with the rows replace only that
+    window, so older rows never wipe days they did not cover.
+    """
+
+    def __init__(self, rows=(), window_start=None, window_end=None, fetched_at=None):
+        super().__init__(rows)
+        self.window_start = window_start
+        self.window_end = window_end
+        self.fetched_at = fetched_at
+
+def gid_type(gid):
+    """Return the resource type of a Shopify GID, e.g. 'Order' for gid://shopify/Order/123."""
+    if not gid or not gid.startswith("gid://"):
+        return None
+    return gid.split("/")[3]
+
+# Our bulk queries select id first, so an output line starts with the GID of its resource
+LINE_ID_PATTERN = re.compile(r'\{"id":"([^"]+)"')
+
+def row_id(row):
+    """Return the GID of a bulk output row, given as a parsed dict or as its JSONL line."""
+    if isinstance(row, str):
+        match = LINE_ID_PATTERN.match(row)
+        if match:
+            return match.group(1)
+        row = json.loads(row)
+    return row.get("id")
+
+def extract(row, extractor):
+    if callable(extractor):
+        return extractor(row)
+    return row.get(extractor)
+
+def normalize_bulk_jsonl(rows, specs):
+    """
+    Normalize Shopify bulk operation output into one typed DataFrame per resource type, in a single pass.
+
+    rows is an iterable of JSONL lines or already parsed dicts. Each row is routed by the type
+    of its GID to the spec of that type:
+      columns         - {column: key or callable(row)} values extracted from the row
+      parent          - resource type of the row's parent (__parentId), for child rows
+      parent_columns  - {column: parent column} values copied from the row's parent
+      require_parent  - drop rows whose parent was not emitted (as an inner join would)
+      dtypes          - {column: dtype} applied to the finished table
+    Shopify writes parents before their children, so each child is joined to its parent through
+    a hash index of parent rows as it arrives. Rows of types without a spec are skipped.
+    """
+    tables = {resource_type: {column: [] for column in list(spec.get('columns', {})) + list(spec.get('parent_columns', {}))} for resource_type, spec in specs.items()}
+    parent_index = {}
+    indexed_types = {spec['parent'] for spec in specs.values() if spec.get('parent')}
+
+    for row in rows:
+        if isinstance(row, str):
+            row = json.loads(row)
+        resource_type = gid_type(row.get("id"))
+        spec = specs.get(resource_type)
+        if spec is None:
+            continue
+
+        values = {column: extract(row, extractor) for column, extractor in spec.get('columns', {}).items()}
+
+        parent_columns = spec.get('parent_columns')
+        if parent_columns:
+            parent = parent_index.get(row.get("__parentId"))
+            if parent is None and spec.get('require_parent'):
+                continue
+            for column, parent_column in parent_columns.items():
+                values[column] = parent.get(parent_column) if parent else None
+
+        if resource_type in indexed_types:
+            parent_index[row["id"]] = values
+
+        table = tables[resource_type]
+        for column, value in values.items():
+            table[column].append(value)
+
+    return {
+        resource_type: pd.DataFrame(columns).astype(specs[resource_type].get('dtypes', {}))
+        for resource_type, columns in tables.items()
+    }
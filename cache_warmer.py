@@ -0,0 +1,189 @@
+import os, pickle, threading, time
+from datetime import datetime
+import config
+from fetch_data import fetch_shiphero_stock_levels, fetch_airtable_incoming_stock, fetch_airtable_product_metadata, fetch_shopify_inventory_data, fetch_shopify_sales_data
+from shiphero_scheduler import shiphero_priority, PRIORITY_BACKGROUND
+
+WARM_CACHE_DIR = 'cache/warm'
+
+# Seconds between background refreshes of each source, and the age after which a read
+# starts a revalidation. Override per source with CACHE_WARMER_SETTINGS in config.py.
+WARM_SOURCE_SETTINGS = {
+    'shiphero_stock_levels': {'interval': 15 * 60, 'stale_after': 15 * 60},
+    'airtable_incoming_stock': {'interval': 15 * 60, 'stale_after': 15 * 60},
+    'shopify_committed_stock': {'interval': 15 * 60, 'stale_after': 15 * 60},
+    'airtable_product_metadata': {'interval': 60 * 60, 'stale_after': 60 * 60},
+    'shopify_sales': {'interval': 24 * 60 * 60, 'stale_after': 24 * 60 * 60}
+}
+
+WARM_SOURCE_FETCHERS = {
+    'shiphero_stock_levels': fetch_shiphero_stock_levels,
+    'airtable_incoming_stock': fetch_airtable_incoming_stock,
+    'shopify_committed_stock': fetch_shopify_inventory_data,
+    'airtable_product_metadata': fetch_airtable_product_metadata,
+    'shopify_sales': fetch_shopify_sales_data
+}
+
+# How often the warmer checks for sources due a refresh
+WARMER_TICK_SECONDS = 30
+
+# Seconds before the first retry of a failed refresh; doubled after each further failure,
+# up to the source's interval
+WARMER_RETRY_SECONDS = 60
+
+class CacheWarmer:
+    """
+    Keeps a pickled copy of each source in cache/warm and refreshes it in the background.
+    Reads return the cached copy at once; a copy older than its stale_after threshold is
+    still returned, and a refresh is started for the next read (stale-while-revalidate).
+    Shopify sales are cached as the fetch's BulkOutput, so they keep the window they cover.
+    """
+
+    def __init__(self, settings=None, cache_dir=WARM_CACHE_DIR):
+        self.settings = {name: {**source_settings, **(settings or {}).get(name, {})} for name, source_settings in WARM_SOURCE_SETTINGS.items()}
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        self.refreshing = {}
+        self.failures = {}
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def cache_path(self, name):
+        return os.path.join(self.cache_dir, f"{name}.pkl")
+
+    def age(self, name):
+        """Seconds since the source was last refreshed, or None when it was never cached."""
+        path = self.cache_path(name)
+        if not os.path.exists(path):
+            return None
+        return time.time() - os.path.getmtime(path)
+
+    def claim(self, name):
+        """Return the event set when the source's refresh ends, and whether the caller owns the refresh."""
+        with self.lock:
+            event = self.refreshing.get(name)
+            if event is not None:
+                return event, False
+            event = self.refreshing[name] = threading.Event()
+            return event, True
+
+    def refresh(self, name):
+        """Fetch the source and replace its cached copy. Concurrent refreshes of one source wait for the first."""
+        event, owner = self.claim(name)
+        if owner:
+            self.fetch(name, event)
+        else:
+            event.wait()
+
+    def refresh_in_background(self, name):
+        """Start a refresh of the source on a background thread, unless one is already running."""
+        event, owner = self.claim(name)
+        if not owner:
+            return
+        def run():
+            with shiphero_priority(PRIORITY_BACKGROUND):
+                self.fetch(name, event)
+        threading.Thread(target=run, daemon=True).start()
+
+    def fetch(self, name, event):
+        """Run a refresh claimed with claim, recording its failures for the retry backoff."""
+        try:
+            started_at = time.perf_counter()
+            data = WARM_SOURCE_FETCHERS[name]()
+            # Fetchers report some failures by returning None; keep the previous copy then
+            if data is None:
+                raise RuntimeError("the fetch returned no data")
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{self.cache_path(name)}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(data, f)
+            os.replace(tmp_path, self.cache_path(name))
+            with self.lock:
+                self.failures.pop(name, None)
+            print(f"Warm cache {name} refreshed in {time.perf_counter() - started_at:.1f}s")
+        except Exception as e:
+            with self.lock:
+                failures, _ = self.failures.get(name, (0, None))
+                self.failures[name] = (failures + 1, time.time())
+            print(f"Warm cache {name} refresh failed ({failures + 1} in a row, retrying in {self.retry_delay(name):.0f}s): {e}")
+        finally:
+            with self.lock:
+                del self.refreshing[name]
+            event.set()
+
+    def retry_delay(self, name):
+        """Seconds to wait after the source's last failed refresh before the warmer retries it."""
+        failures, _ = self.failures.get(name, (0, None))
+        if not failures:
+            return 0
+        return min(WARMER_RETRY_SECONDS * 2 ** (failures - 1), self.settings[name]['interval'])
+
+    def backing_off(self, name):
+        """Whether the source's last refresh failed less than its retry delay ago."""
+        _, failed_at = self.failures.get(name, (0, None))
+        return failed_at is not None and time.time() - failed_at < self.retry_delay(name)
+
+    def due(self, name):
+        """Whether the warmer should refresh the source now."""
+        age = self.age(name)
+        if age is not None and age < self.settings[name]['interval']:
+            return False
+        return not self.backing_off(name)
+
+    def get(self, name):
+        """
+        Return the cached copy of the source, fetching it first only when it was never cached.
+        A copy older than stale_after is returned as well, and revalidated in the background.
+        """
+        age = self.age(name)
+        if age is None:
+            self.refresh(name)
+            age = self.age(name)
+            if age is None:
+                raise RuntimeError(f"No cached data for {name} and the fetch failed")
+        elif age > self.settings[name]['stale_after'] and not self.backing_off(name):
+            print(f"Warm cache {name} is {age / 60:.0f} minutes old, revalidating in the background")
+            self.refresh_in_background(name)
+
+        with open(self.cache_path(name), 'rb') as f:
+            data = pickle.load(f)
+        print(f"Loaded {name} from the warm cache ({age / 60:.0f} minutes old)")
+        return data
+
+    def status(self):
+        """Age, settings and refresh state of every source."""
+        return {
+            name: {**settings, 'age': self.age(name), 'refreshing': name in self.refreshing, 'failures': self.failures.get(name, (0, None))[0]}
+            for name, settings in self.settings.items()
+        }
+
+    def run(self):
+        while not self.stopped.is_set():
+            for name in self.settings:
+                if self.due(name):
+                    self.refresh_in_background(name)
+            self.stopped.wait(WARMER_TICK_SECONDS)
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+            print(f"Cache warmer started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    def stop(self):
+        self.stopped.set()
+
+_cache_warmer = None
+_cache_warmer_lock = threading.Lock()
+
+def get_cache_warmer():
+    """Return the app's cache warmer, created with CACHE_WARMER_SETTINGS from config.py on first use."""
+    global _cache_warmer
+    with _cache_warmer_lock:
+        if _cache_warmer is None:
+            _cache_warmer = CacheWarmer(getattr(config, 'CACHE_WARMER_SETTINGS', None))
+        return _cache_warmer
+
+def start_cache_warmer():
+    get_cache_warmer().start()
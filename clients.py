@@ -0,0 +1,42 @@
+import threading, time
+
+# Google service account used for Sheets and Drive
+SCOPES = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/spreadsheets']
+SERVICE_ACCOUNT_FILE = 'service-account.json'  # Update this path
+
+def create_gspread_client():
+    import gspread
+    from google.oauth2.service_account import Credentials
+    credentials = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+    return gspread.authorize(credentials)
+
+def create_airtable_api():
+    from pyairtable import Api
+    import config
+    return Api(config.AIRTABLE_API_KEY)
+
+# Shared clients, created on first use by get_client
+CLIENT_FACTORIES = {
+    'gspread': create_gspread_client,
+    'airtable': create_airtable_api
+}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(name):
+    """Return the shared client registered under name, creating it on first use."""
+    with _clients_lock:
+        if name not in _clients:
+            started_at = time.perf_counter()
+            _clients[name] = CLIENT_FACTORIES[name]()
+            print(f"Initialized {name} client in {time.perf_counter() - started_at:.2f}s")
+        return _clients[name]
+
+def get_gspread_client():
+    return get_client('gspread')
+
+def get_airtable_table(table_name):
+    """Return a table of the Production base from the shared Airtable client."""
+    import config
+    return get_client('airtable').table(config.AIRTABLE_PRODUCTION_DEV_BASE_ID, table_name)
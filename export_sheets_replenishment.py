@@ -1,24 +1,28 @@
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
 import re
+from clients import get_gspread_client
+from replenishment_snapshots import load_replenishment_snapshot
 
-# Define the scope
-SCOPES = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/spreadsheets']
+REPLENISHMENT_FILE_ID = '1L35Drb5FZfPsV7kk73wZzsqCQ9k6x7KSoKJMYFhefeQ'  # Google Drive file name: PO BUILDER 3.0
 
-# Path to your service account key file
-SERVICE_ACCOUNT_FILE = 'service-account.json'  # Update this path
+def to_sheet_values(replenishment_df):
+    """
+    Convert replenishment_df to strings as written to the sheet, with empty cells for missing values.
+    Columns are converted one at a time so that only one column's intermediate copies are alive at once.
+    """
+    sheet_df = pd.DataFrame(index=replenishment_df.index)
+    for column in replenishment_df.columns:
+        # Replace NaN and Infinity values with an empty string
+        values = replenishment_df[column].replace([pd.NA, pd.NaT, float('inf'), float('-inf')], '')
 
-# Authenticate and create the service
-credentials = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-gc = gspread.authorize(credentials)
+        # Ensure all values are strings to avoid JSON serialization issues, and replace all "nan" values with an empty string
+        sheet_df[column] = values.astype(str).replace("nan", "")
+    return sheet_df
 
 def export_sheets_replenishment(replenishment_df):
-    file_id = '1L35Drb5FZfPsV7kk73wZzsqCQ9k6x7KSoKJMYFhefeQ'  # Google Drive file name: PO BUILDER 3.0
-
     # Open the template file with gspread
-    sh = gc.open_by_key(file_id)
+    gc = get_gspread_client()
+    sh = gc.open_by_key(REPLENISHMENT_FILE_ID)
 
     # Get the "Data" worksheet
     worksheet_data = sh.worksheet("Data")
@@ -31,14 +35,7 @@ def export_sheets_replenishment(replenishment_df):
         [replenishment_df.iloc[[i]] if i == 0 or replenishment_df.iloc[i]['product_num'] == replenishment_df.iloc[i-1]['product_num'] else pd.concat([pd.DataFrame([[''] * len(replenishment_df.columns)], columns=replenishment_df.columns), replenishment_df.iloc[[i]]]) for i in range(len(replenishment_df))]
     ).reset_index(drop=True)
 
-    # Replace NaN and Infinity values with an empty string
-    replenishment_df = replenishment_df.replace([pd.NA, pd.NaT, float('inf'), float('-inf')], '')
-
-    # Ensure all values are strings to avoid JSON serialization issues
-    replenishment_df = replenishment_df.astype(str)
-
-    # Replace all "nan" values with an empty string
-    replenishment_df = replenishment_df.replace("nan", "")
+    replenishment_df = to_sheet_values(replenishment_df)
 
     # Debugging: Print the DataFrame to verify its contents
     print("DataFrame to be written to Google Sheet:")
@@ -64,13 +61,60 @@ def export_sheets_replenishment(replenishment_df):
     # Clear all data from the "To Order Qty" column 
     worksheet_replenishment.batch_clear([f"{to_order_qty_col}2:{to_order_qty_col}"])
 
+def column_runs(column_numbers):
+    """Split sorted 1-based column numbers into (first, last) runs of adjacent columns."""
+    runs = []
+    for column in column_numbers:
+        if runs and column == runs[-1][1] + 1:
+            runs[-1][1] = column
+        else:
+            runs.append([column, column])
+    return runs
+
+def patch_sheets_replenishment(replenishment_df, columns=None):
+    """
+    Overwrite the rows of the "Data" worksheet whose SKU is in replenishment_df, leaving the
+    rest of the sheet and the "Replenishment" worksheet untouched.
+    Values are written in the order of the sheet's header row; with columns, only the cells
+    of those columns are written.
+    Returns the SKUs that are not in the sheet yet; they are added by the next full export.
+    """
+    from gspread.utils import rowcol_to_a1
+
+    gc = get_gspread_client()
+    worksheet_data = gc.open_by_key(REPLENISHMENT_FILE_ID).worksheet("Data")
+
+    header = worksheet_data.row_values(1)
+    sku_col = header.index('sku') + 1
+    sheet_rows = {sku: row for row, sku in enumerate(worksheet_data.col_values(sku_col)[1:], start=2) if sku}
+
+    values_df = to_sheet_values(replenishment_df.reindex(columns=header))
+    column_numbers = range(1, len(header) + 1) if columns is None else sorted(header.index(column) + 1 for column in columns if column in header)
+    runs = column_runs(column_numbers)
+    updates = []
+    missing_skus = []
+    for sku, values in zip(replenishment_df['sku'], values_df.values.tolist()):
+        row = sheet_rows.get(sku)
+        if row is None:
+            missing_skus.append(sku)
+            continue
+        for first, last in runs:
+            updates.append({'range': f"{rowcol_to_a1(row, first)}:{rowcol_to_a1(row, last)}", 'values': [values[first - 1:last]]})
+
+    if updates:
+        worksheet_data.batch_update(updates)
+    print(f"Patched {len(replenishment_df) - len(missing_skus)} rows of the replenishment sheet")
+    if missing_skus:
+        print(f"SKUs not in the replenishment sheet yet, run a full export to add them: {', '.join(missing_skus)}")
+    return missing_skus
+
 # Test the function
 if __name__ == "__main__":
-    # Load the CSV file for testing
-    replenishment_df = pd.read_csv("output/replenishment_2025-01-24 06-37-28.csv")
+    # Load the latest replenishment snapshot for testing
+    replenishment_df = load_replenishment_snapshot()
     
     # Debugging: Print the DataFrame to verify its contents
-    print("Loaded DataFrame from CSV:")
+    print("Loaded DataFrame from snapshot:")
     print(replenishment_df)
 
     export_sheets_replenishment(replenishment_df)
\ No newline at end of file
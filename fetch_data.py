@@ -1,15 +1,38 @@
 import requests, time, json, os, pickle
 from urllib.parse import urlencode
-from config import AIRTABLE_API_KEY, AIRTABLE_VARIANTS_ENDPOINT, AIRTABLE_PRODUCTION_DEV_BASE_ID, SHIPHERO_WAREHOUSE_ID
+from config import AIRTABLE_API_KEY, AIRTABLE_VARIANTS_ENDPOINT, SHIPHERO_WAREHOUSE_ID
 import pandas as pd
-from pyairtable import Table
-from datetime import datetime, timedelta
-from utils import fetch_shiphero_paginated_data, fetch_shopify_bulk_operation
+from clients import get_airtable_table
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from utils import airtable_string, fetch_shiphero_paginated_data, fetch_shiphero_with_throttling, fetch_shopify_bulk_operation
+from transform_data import AIRTABLE_VARIANT_FIELDS, normalize_airtable_column
+from arrow_batches import require_pyarrow, shiphero_stock_levels_schema, airtable_variants_schema, shiphero_edges_to_batch, columns_to_batch, batches_to_table, write_arrow_cache, read_arrow_cache
+from shiphero_scheduler import runs_at_shiphero_priority, current_priority
+from sku_dictionary import normalize_sku
+from stock_locations import get_stock_locations
+from bulk_jsonl import BulkOutput, row_id
 
 
 # Airtable functions
 
-def fetch_airtable_incoming_stock():
+# Values matched per Airtable formula or Shopify search filter; longer filters exceed the
+# request URL and search query length limits, so larger lists are fetched one chunk at a time
+FILTER_CHUNK_SIZE = 50
+
+def chunked(values, size=FILTER_CHUNK_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def airtable_in_formula(field, values):
+    """
+    Airtable formula matching records whose field (text or lookup) equals any of values.
+    Pass at most FILTER_CHUNK_SIZE values; see chunked.
+    """
+    return "OR(" + ", ".join(f"{{{field}}} & '' = {airtable_string(value)}" for value in values) + ")"
+
+def fetch_airtable_incoming_stock(skus=None):
     """
     Fetches incoming stock data from Airtable and processes it into a pandas DataFrame.
     This function retrieves records from the "Line Items" table in Airtable where the 
@@ -18,15 +41,23 @@ def fetch_airtable_incoming_stock():
     and groups the data by SKU to sum the incoming stock for each SKU.
     Returns:
       pandas.DataFrame: A DataFrame containing the SKU and the summed incoming stock for each SKU.
+    With skus, only the line items of those SKUs are fetched, FILTER_CHUNK_SIZE SKUs per request.
     """
 
     print("Fetching incoming stock data from Airtable...")
     
     # print("Initializing Airtable table...")
-    line_items_table = Table(AIRTABLE_API_KEY, AIRTABLE_PRODUCTION_DEV_BASE_ID, "Line Items")
+    line_items_table = get_airtable_table("Line Items")
 
     # print("Fetching records with PO Status = 'Open'...")
-    records = line_items_table.all(formula="OR({PO Status} = 'Open', {PO Status} = 'Draft')", fields=['Position - PO # - SKU', 'sku', 'Quantity Ordered', 'Quantity Received'])
+    formula = "OR({PO Status} = 'Open', {PO Status} = 'Draft')"
+    fields = ['Position - PO # - SKU', 'sku', 'Quantity Ordered', 'Quantity Received']
+    if skus is None:
+        records = line_items_table.all(formula=formula, fields=fields)
+    else:
+        records = []
+        for sku_chunk in chunked(skus):
+            records.extend(line_items_table.all(formula=f"AND({formula}, {airtable_in_formula('sku', sku_chunk)})", fields=fields))
     # print(f"Fetched {len(records)} records.")
     # print("First 5 records:")
     # for record in records[:5]:
@@ -45,12 +76,12 @@ def fetch_airtable_incoming_stock():
     # print(f"Extracted data for {len(data)} records.")
 
     # print("Converting data to DataFrame...")
-    df = pd.DataFrame(data)
+    df = pd.DataFrame(data, columns=['Position - PO # - SKU', 'sku', 'ordered', 'received'])
     # print("DataFrame created:")
     # print(df.head())
 
     # print("Ensuring 'sku' column contains only strings and cleaning 'sku' values...")
-    df['sku'] = df['sku'].apply(lambda x: str(x[0]) if isinstance(x, list) and len(x) > 0 else str(x) if not isinstance(x, str) else x)
+    df['sku'] = df['sku'].apply(normalize_sku)
 
     # print("Calculating 'pending' field...")
     df['incoming'] = df['ordered'] - df['received']
@@ -64,43 +95,32 @@ def fetch_airtable_incoming_stock():
 
     return grouped_df
 
-def fetch_airtable_product_metadata():
+def fetch_airtable_product_metadata(as_arrow=False, formula=None):
     """
     Fetches product metadata from Airtable and processes it into a pandas DataFrame.
     This function retrieves records from the "Variants" table in Airtable and extracts
     relevant fields from these records. It then converts the data into a DataFrame.
+    With as_arrow=True each page is normalized into an Arrow record batch with a fixed
+    schema as it arrives, and a pyarrow.Table of all pages is returned.
+    formula is an optional Airtable filterByFormula restricting the records fetched.
     Returns:
-      pandas.DataFrame: A DataFrame containing the relevant product metadata fields.
+      list: The fields of each record, or a pyarrow.Table when as_arrow is set.
     """
 
+    if as_arrow:
+        require_pyarrow()
+        schema = airtable_variants_schema(AIRTABLE_VARIANT_FIELDS)
+        batches = []
+
     headers = {
         'Authorization': f'Bearer {AIRTABLE_API_KEY}'
     }
     params = {
         'view': 'Data for PO Builder',
-        'fields[]': [
-            'SKU', 
-            'Product Number',
-            'Product Name', 
-            'Option1 Value', 
-            'Position',
-            'Supplier (Plain Text)', 
-            'Status Shopify (Shopify)',
-            'Stocked Status',
-            'Decoration Group (Plain Text)',
-            'Artwork (Title)',
-            'Cost-Production: Total', 
-            'Category', 
-            'Subcategory', 
-            'Product Type (Internal)',
-            'Component Brand',
-            'Component Style Number',
-            'Component Style Name',
-            'Component Color',
-            'Blank Preferred Supplier',
-            'Blank Backup Supplier(s)'
-        ]
+        'fields[]': list(AIRTABLE_VARIANT_FIELDS)
     }
+    if formula:
+        params['filterByFormula'] = formula
     
     all_records = []
     offset = None
@@ -116,7 +136,13 @@ def fetch_airtable_product_metadata():
         if response.status_code == 200:
             data = response.json()
             records = data.get('records', [])
-            all_records.extend([record['fields'] for record in records])
+            if as_arrow:
+                batches.append(columns_to_batch({
+                    field: normalize_airtable_column([record['fields'].get(field) for record in records], kind)
+                    for field, kind in AIRTABLE_VARIANT_FIELDS.items()
+                }, schema))
+            else:
+                all_records.extend([record['fields'] for record in records])
             offset = data.get('offset')
             if not offset:
                 break
@@ -125,61 +151,128 @@ def fetch_airtable_product_metadata():
             print("Response Content:", response.content)
             return None
 
+    if as_arrow:
+        return batches_to_table(batches, schema)
+
     return all_records
 
 
 # Shiphero functions
 
-def fetch_shiphero_stock_levels(use_cache=False):
+SHIPHERO_STOCK_LEVELS_QUERY = """
+query ($first: Int!, $after: String, $warehouse_id: String) {
+  warehouse_products(warehouse_id: $warehouse_id, active: true) { 
+    complexity 
+    request_id 
+    data(first: $first, after: $after) { 
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+      edges { 
+        node { 
+          id 
+          sku
+          on_hand
+          allocated
+          available
+          backorder
+        }
+      }
+    }
+  }
+}
+"""
+
+# SKUs looked up per ShipHero request by fetch_shiphero_stock_levels_for_skus
+SHIPHERO_SKU_BATCH_SIZE = 25
+
+def shiphero_sku_stock_levels_query(sku_count):
+    """
+    Query looking up sku_count SKUs of one warehouse at once, as aliased warehouse_products
+    fields sku_0, sku_1, ... filtered by the variables $sku_0, $sku_1, ...
+    A SKU has at most one product per warehouse, so the fields are not paginated.
+    """
+    variables = ", ".join(f"$sku_{i}: String" for i in range(sku_count))
+    fields = "".join(f"""
+  sku_{i}: warehouse_products(warehouse_id: $warehouse_id, active: true, sku: $sku_{i}) {{
+    data(first: 10) {{
+      edges {{
+        node {{
+          id
+          sku
+          on_hand
+          allocated
+          available
+          backorder
+        }}
+      }}
+    }}
+  }}""" for i in range(sku_count))
+    return f"query ($warehouse_id: String, {variables}) {{{fields}\n}}"
+
+def tag_warehouse(edges, warehouse_id):
+    """Record the warehouse each stock level was fetched from on its node."""
+    for edge in edges:
+        edge['node']['warehouse_id'] = warehouse_id
+    return edges
+
+def fetch_shiphero_stock_levels(use_cache=False, as_arrow=False, locations=None):
     """
     Fetches stock levels data from ShipHero and processes it into a list of dictionaries.
     This function retrieves stock levels data from the ShipHero GraphQL API and paginates
     through the results to fetch all available data. It then processes the data into a list
     of dictionaries, where each dictionary represents a product and contains relevant fields.
+    The warehouses of all configured stock locations are fetched in parallel, and each node
+    is tagged with the warehouse_id it came from.
+    With as_arrow=True each page is converted into an Arrow record batch as it arrives and
+    a pyarrow.Table is returned (and cached as an Arrow IPC file).
     Returns:
-      list: A list of dictionaries containing the stock levels data for each product.
+      list: A list of dictionaries containing the stock levels data for each product,
+      or a pyarrow.Table when as_arrow is set.
     """
     
     CACHE_FILE = 'cache/shiphero_stock_levels.pkl'
+    ARROW_CACHE_FILE = 'cache/shiphero_stock_levels.arrow'
+
+    if as_arrow:
+        require_pyarrow()
+        if use_cache and os.path.exists(ARROW_CACHE_FILE):
+            print("Loading cached stock levels data...")
+            return read_arrow_cache(ARROW_CACHE_FILE)
 
-    if use_cache and os.path.exists(CACHE_FILE):
+    elif use_cache and os.path.exists(CACHE_FILE):
         print("Loading cached stock levels data...")
         with open(CACHE_FILE, 'rb') as f:
           return pickle.load(f)
         
-    print("Fetching fresh stock levels data from ShipHero...")
+    warehouse_ids = [location['shiphero_warehouse_id'] for location in locations or get_stock_locations()]
+    print(f"Fetching fresh stock levels data from ShipHero for {len(warehouse_ids)} warehouses...")
 
-    query = """
-    query ($first: Int!, $after: String) {
-      warehouse_products(warehouse_id: "V2FyZWhvdXNlOjEwMTU4Mw==", active: true) { 
-        complexity 
-        request_id 
-        data(first: $first, after: $after) { 
-          pageInfo {
-            hasNextPage
-            endCursor
-          }
-          edges { 
-            node { 
-              id 
-              sku
-              on_hand
-              allocated
-              available
-              backorder
-            }
-          }
-        }
-      }
-    }
-    """
-    
-    variables = {
-        "first": 100,
-        "after": None
-    }
-    
-    stock_levels = fetch_shiphero_paginated_data(query, variables, "warehouse_products")
+    schema = shiphero_stock_levels_schema() if as_arrow else None
+
+    # Worker threads inherit the caller's ShipHero scheduler priority
+    @runs_at_shiphero_priority(current_priority())
+    def fetch_warehouse(warehouse_id):
+        if as_arrow:
+            page_handler = lambda edges: shiphero_edges_to_batch(tag_warehouse(edges, warehouse_id), schema)
+        else:
+            page_handler = lambda edges: tag_warehouse(edges, warehouse_id)
+        variables = {"first": 100, "after": None, "warehouse_id": warehouse_id}
+        return fetch_shiphero_paginated_data(SHIPHERO_STOCK_LEVELS_QUERY, variables, "warehouse_products", page_handler=page_handler)
+
+    pages = []
+    with ThreadPoolExecutor(max_workers=min(len(warehouse_ids), PO_FETCH_MAX_WORKERS)) as executor:
+        for warehouse_pages in executor.map(fetch_warehouse, warehouse_ids):
+            pages.extend(warehouse_pages)
+
+    if as_arrow:
+        stock_levels = batches_to_table(pages, schema)
+        os.makedirs(os.path.dirname(ARROW_CACHE_FILE), exist_ok=True)
+        write_arrow_cache(stock_levels, ARROW_CACHE_FILE)
+        return stock_levels
+
+    stock_levels = [edge for page in pages for edge in page]
 
     # Save the fetched data to cache
     os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
@@ -188,22 +281,69 @@ def fetch_shiphero_stock_levels(use_cache=False):
         
     return stock_levels
 
-def fetch_purchase_orders_from_shiphero(created_from: str = None):
-  """Fetch active purchase orders from ShipHero."""
-  
-  if not created_from:
-    raise ValueError("The 'created_from' parameter is required.")
-  
-  # Convert created_from to ISODateTime format
+def fetch_shiphero_stock_levels_for_skus(skus, locations=None):
+    """
+    Fetches ShipHero stock levels for the given SKUs only, one request per warehouse and
+    SHIPHERO_SKU_BATCH_SIZE SKUs (see shiphero_sku_stock_levels_query).
+    Returns the same list of edges as fetch_shiphero_stock_levels; the cache is left untouched.
+    """
+
+    warehouse_ids = [location['shiphero_warehouse_id'] for location in locations or get_stock_locations()]
+    print(f"Fetching stock levels data from ShipHero for {len(skus)} SKUs in {len(warehouse_ids)} warehouses...")
+
+    # Worker threads inherit the caller's ShipHero scheduler priority
+    @runs_at_shiphero_priority(current_priority())
+    def fetch_sku_batch(warehouse_batch):
+        warehouse_id, sku_batch = warehouse_batch
+        variables = {"warehouse_id": warehouse_id, **{f"sku_{i}": sku for i, sku in enumerate(sku_batch)}}
+        result = fetch_shiphero_with_throttling(shiphero_sku_stock_levels_query(len(sku_batch)), variables)
+        data = (result or {}).get("data") or {}
+        edges = [edge for i in range(len(sku_batch)) for edge in (((data.get(f"sku_{i}") or {}).get("data") or {}).get("edges") or [])]
+        return tag_warehouse(edges, warehouse_id)
+
+    batches = [(warehouse_id, sku_batch) for warehouse_id in warehouse_ids for sku_batch in chunked(skus, SHIPHERO_SKU_BATCH_SIZE)]
+    stock_levels = []
+    with ThreadPoolExecutor(max_workers=PO_FETCH_MAX_WORKERS) as executor:
+        for edges in executor.map(fetch_sku_batch, batches):
+            stock_levels.extend(edges)
+    return stock_levels
+
+# Date-sharded purchase order fetches: window size and number of windows fetched at once
+PO_FETCH_WINDOW_DAYS = 30
+PO_FETCH_MAX_WORKERS = 4
+
+def to_shiphero_datetime(value, name):
+  """Convert a YYYY-MM-DD string or a datetime to ShipHero's ISODateTime format."""
+  if isinstance(value, datetime):
+    return value.strftime("%Y-%m-%dT%H:%M:%S") + "Z"
   try:
-    created_from_iso = datetime.strptime(created_from, "%Y-%m-%d").isoformat()
-    created_from = created_from_iso + "Z"
+    return datetime.strptime(value, "%Y-%m-%d").isoformat() + "Z"
   except ValueError as e:
-    raise ValueError(f"Invalid date format for 'created_from': {created_from}. Expected format: YYYY-MM-DD") from e
+    raise ValueError(f"Invalid date format for '{name}': {value}. Expected format: YYYY-MM-DD") from e
+
+def fetch_purchase_orders_from_shiphero(created_from: str = None, updated_from=None, created_to=None, parallel: bool = False):
+  """
+  Fetch purchase orders from ShipHero.
+  Either created_from (YYYY-MM-DD) or updated_from (YYYY-MM-DD or datetime, UTC) is required;
+  with updated_from only the purchase orders changed since then are returned.
+  With parallel=True the created date range is split into windows fetched concurrently
+  (see fetch_purchase_orders_from_shiphero_sharded).
+  """
+  
+  if not created_from and not updated_from:
+    raise ValueError("The 'created_from' or 'updated_from' parameter is required.")
+
+  if parallel and created_from:
+    return fetch_purchase_orders_from_shiphero_sharded(created_from, created_to=created_to, updated_from=updated_from)
+  
+  # Convert the date filters to ISODateTime format
+  created_from = to_shiphero_datetime(created_from, 'created_from') if created_from else None
+  created_to = to_shiphero_datetime(created_to, 'created_to') if created_to else None
+  updated_from = to_shiphero_datetime(updated_from, 'updated_from') if updated_from else None
 
   query = """
-  query ($first: Int!, $after: String, $created_from: ISODateTime, $warehouse_id: String){
-    purchase_orders(created_from: $created_from, warehouse_id: $warehouse_id) {
+  query ($first: Int!, $after: String, $created_from: ISODateTime, $created_to: ISODateTime, $updated_from: ISODateTime, $warehouse_id: String){
+    purchase_orders(created_from: $created_from, created_to: $created_to, updated_from: $updated_from, warehouse_id: $warehouse_id) {
       complexity
       request_id
       data(first: $first, after: $after) {
@@ -237,6 +377,8 @@ def fetch_purchase_orders_from_shiphero(created_from: str = None):
     "first": 10,
     "after": None,
     "created_from": created_from,
+    "created_to": created_to,
+    "updated_from": updated_from,
     "warehouse_id": SHIPHERO_WAREHOUSE_ID
   }
 
@@ -247,35 +389,151 @@ def fetch_purchase_orders_from_shiphero(created_from: str = None):
   
   return purchase_orders
 
+def fetch_purchase_orders_from_shiphero_sharded(created_from, created_to=None, updated_from=None, window_days=PO_FETCH_WINDOW_DAYS, max_workers=PO_FETCH_MAX_WORKERS):
+  """
+  Fetch purchase orders created between created_from and created_to (default: now) by splitting
+  the range into windows of window_days days, each paginated in its own thread.
+  Requests share the ShipHero credit scheduler. Results are merged and deduplicated by PO id.
+  """
+
+  start = created_from if isinstance(created_from, datetime) else datetime.strptime(created_from, "%Y-%m-%d")
+  if created_to is None:
+    end = datetime.now(timezone.utc).replace(tzinfo=None)
+  else:
+    end = created_to if isinstance(created_to, datetime) else datetime.strptime(created_to, "%Y-%m-%d")
+
+  windows = []
+  window_start = start
+  while window_start < end:
+    window_end = min(window_start + timedelta(days=window_days), end)
+    windows.append((window_start, window_end))
+    window_start = window_end
+  print(f"Fetching ShipHero purchase orders in {len(windows)} windows of {window_days} days...")
+
+  # Worker threads inherit the caller's ShipHero scheduler priority
+  fetch_window = runs_at_shiphero_priority(current_priority())(fetch_purchase_orders_from_shiphero)
+
+  purchase_orders = {}
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    futures = [
+      executor.submit(fetch_window, created_from=window_start, created_to=window_end, updated_from=updated_from)
+      for window_start, window_end in windows
+    ]
+    for future in futures:
+      for purchase_order in future.result() or []:
+        purchase_orders[purchase_order['node']['id']] = purchase_order
+
+  print(f"Fetched {len(purchase_orders)} unique purchase orders from ShipHero")
+  return list(purchase_orders.values())
+
+def fetch_purchase_order_from_shiphero(po_id):
+  """Fetch a single purchase order, with its line items, from ShipHero by its ID."""
+
+  query = """
+  query ($id: String!){
+    purchase_order(id: $id) {
+      complexity
+      request_id
+      data {
+        id
+        po_number
+        fulfillment_status
+        line_items {
+          edges {
+            node {
+              id
+              sku
+              quantity
+              quantity_received
+            }
+          }
+        }
+      }
+    }
+  }
+  """
+
+  result = fetch_shiphero_with_throttling(query, {"id": po_id})
+  return (((result or {}).get("data") or {}).get("purchase_order") or {}).get("data")
+
 # Shopify functions
 
-def fetch_shopify_sales_data(use_cache=False):
+def shopify_search_value(value):
+    """Quote value as one literal term of Shopify search syntax, so quotes and operators in it match as text."""
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+def graphql_string_content(text):
+    """Escape text for use inside a double-quoted GraphQL string, e.g. a bulk query's search argument."""
+    return text.replace("\\", "\\\\").replace('"', '\\"')
+
+def shopify_sku_filter(skus):
+    """
+    Shopify search syntax matching any of the given SKUs, escaped to replace SKU_FILTER inside
+    the double-quoted query argument of a bulk query.
+    Pass at most FILTER_CHUNK_SIZE SKUs; see fetch_shopify_bulk_operation_for_skus.
+    """
+    return graphql_string_content("(" + " OR ".join(f"sku:{shopify_search_value(sku)}" for sku in skus) + ")")
+
+def fetch_shopify_bulk_operation_for_skus(inner_query, skus):
     """
-    Fetches sales data from Shopify and processes it into a list of dictionaries.
-    This function retrieves sales data from the Shopify GraphQL API and paginates
-    through the results to fetch all available data. It then processes the data into
-    a list of dictionaries, where each dictionary represents an order or a line item
-    within an order and contains relevant fields.
+    Run the bulk query inner_query once per FILTER_CHUNK_SIZE SKUs, with SKU_FILTER replaced by
+    the chunk's shopify_sku_filter, and return the rows of all runs. A resource matching SKUs of
+    several chunks (e.g. an order with line items of both) is kept once, with its children.
+    Returns None when any run failed.
+    """
+    rows = []
+    seen_ids = set()
+    for sku_chunk in chunked(skus):
+        chunk_rows = fetch_shopify_bulk_operation(inner_query.replace("SKU_FILTER", shopify_sku_filter(sku_chunk)))
+        if chunk_rows is None:
+            return None
+        for row in chunk_rows:
+            gid = row_id(row)
+            if gid in seen_ids:
+                continue
+            if gid:
+                seen_ids.add(gid)
+            rows.append(row)
+    return rows
+
+def fetch_shopify_sales_data(use_cache=False, weeks=9, skus=None, until=None):
+    """
+    Fetches sales data from Shopify with a bulk operation.
+    Each row is the JSONL line of an order or of a line item within an order, with its
+    relevant fields; caches written by earlier versions hold parsed dicts instead, which
+    every consumer accepts as well.
+    A larger `weeks` backfills a longer history into the sales cube.
+    With skus, only orders containing those SKUs are fetched, FILTER_CHUNK_SIZE SKUs per bulk
+    operation, and the cache is left untouched.
+    With until, a datetime, the `weeks` weeks before it are fetched instead, also bypassing the cache.
     Returns:
-      list: A list of dictionaries containing the sales data for each order and line item.
+      BulkOutput: The rows of the sales data for each order and line item,
+      with the first date and the fetch time of the window it covers, or None when the fetch failed.
     """
     
     CACHE_FILE = 'cache/shopify_sales_data.pkl'
 
-    if use_cache and os.path.exists(CACHE_FILE):
+    if use_cache and skus is None and until is None and os.path.exists(CACHE_FILE):
         print("Loading cached sales data...")
         with open(CACHE_FILE, 'rb') as f:
-          return pickle.load(f)
+          sales_data = pickle.load(f)
+        if not isinstance(sales_data, BulkOutput):
+            # Caches written before the fetch window was recorded were fetched at the latest when the file was written
+            fetched_at = datetime.fromtimestamp(os.path.getmtime(CACHE_FILE), timezone.utc)
+            sales_data = BulkOutput(sales_data, window_end=fetched_at.date(), fetched_at=fetched_at)
+        return sales_data
         
     print("Fetching fresh sales data from Shopify...")
 
-    # Calculate the date 9 weeks before today
-    nine_weeks_ago = datetime.now() - timedelta(weeks=9)
-    formatted_date = nine_weeks_ago.strftime("%Y-%m-%d")
+    # Calculate the date `weeks` weeks before today
+    created_from = (until or datetime.now()) - timedelta(weeks=weeks)
+    formatted_date = created_from.strftime("%Y-%m-%d")
+    sku_filter = " AND SKU_FILTER" if skus is not None else ""
+    until_filter = f" AND created_at:<{until.strftime('%Y-%m-%d')}" if until is not None else ""
     
     inner_query = f"""
     {{
-      orders(query: "created_at:>={formatted_date} AND (fulfillment_status:shipped OR fulfillment_status:unfulfilled OR fulfillment_status:partial) AND (financial_status:paid OR financial_status:pending) AND -tag:'Exclude from Forecast'") {{
+      orders(query: "created_at:>={formatted_date} AND (fulfillment_status:shipped OR fulfillment_status:unfulfilled OR fulfillment_status:partial) AND (financial_status:paid OR financial_status:pending) AND -tag:'Exclude from Forecast'{until_filter}{sku_filter}") {{
         edges {{
           node {{
             id
@@ -302,7 +560,18 @@ def fetch_shopify_sales_data(use_cache=False):
     }}
     """
     
-    sales_data = fetch_shopify_bulk_operation(inner_query)
+    fetched_at = datetime.now(timezone.utc)
+    window_end = fetched_at.date() if until is None else until.date() - timedelta(days=1)
+    if skus is None:
+        sales_data = fetch_shopify_bulk_operation(inner_query)
+    else:
+        sales_data = fetch_shopify_bulk_operation_for_skus(inner_query, skus)
+    if sales_data is None:
+        print("Failed to fetch sales data from Shopify")
+        return None
+    sales_data = BulkOutput(sales_data, window_start=created_from.date(), window_end=window_end, fetched_at=fetched_at)
+    if skus is not None or until is not None:
+        return sales_data
 
     # Save the fetched data to cache
     os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
@@ -311,7 +580,7 @@ def fetch_shopify_sales_data(use_cache=False):
 
     return sales_data
 
-def fetch_shopify_inventory_data(use_cache=False):
+def fetch_shopify_inventory_data(use_cache=False, skus=None):
     """
     Fetches inventory data from Shopify and processes it into a pandas DataFrame.
     This function retrieves inventory data from the Shopify GraphQL API and processes
@@ -321,20 +590,26 @@ def fetch_shopify_inventory_data(use_cache=False):
     location name, and inventory quantities (available, incoming, committed, on hand).
     Returns:
       pandas.DataFrame: A DataFrame containing the inventory data for products and variants.
+    With skus, only products with those SKUs are fetched, FILTER_CHUNK_SIZE SKUs per bulk
+    operation, and the cache is left untouched.
     """
     
-    CACHE_FILE = 'cache/shopify_inventory_data.pkl'
+    # Versioned since the InventoryLevel id was added to the query: older caches lack it, so
+    # their inventory levels would not be routed by normalize_bulk_jsonl
+    CACHE_FILE = 'cache/shopify_inventory_data_v2.pkl'
 
-    if use_cache and os.path.exists(CACHE_FILE):
+    if use_cache and skus is None and os.path.exists(CACHE_FILE):
         print("Loading cached inventory data...")
         with open(CACHE_FILE, 'rb') as f:
           return pickle.load(f)
         
     print("Fetching fresh inventory data from Shopify...")
 
+    product_filter = "status:ACTIVE" if skus is None else "status:ACTIVE AND SKU_FILTER"
+
     query = """
     query GetCommittedInventory {
-      products(first:50, query: "status:ACTIVE") {
+      products(first:50, query: "PRODUCT_FILTER") {
         edges {
           node {
             id
@@ -350,6 +625,7 @@ def fetch_shopify_inventory_data(use_cache=False):
                     inventoryLevels(first: 10) {
                       edges {
                         node {
+                          id
                           location {
                             id
                             name
@@ -371,6 +647,9 @@ def fetch_shopify_inventory_data(use_cache=False):
     }
     """
     
+    query = query.replace("PRODUCT_FILTER", product_filter)
+    if skus is not None:
+        return fetch_shopify_bulk_operation_for_skus(query, skus)
     inventory_data = fetch_shopify_bulk_operation(query)
 
     # Save the fetched data to cache
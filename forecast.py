@@ -0,0 +1,92 @@
+import re
+import numpy as np
+from sku_dictionary import join_on_sku
+
+# Defaults for the reorder engine
+TARGET_WEEKS_OF_COVER = 8
+EWMA_ALPHA = 0.3
+
+def order_sales_columns(sales_columns):
+    """Return (weeks_ago, sales_columns) pairs ordered oldest week first."""
+    weeks_ago = [int(re.search(r'sales_(\d+)_weeks_ago', column).group(1)) for column in sales_columns]
+    return sorted(zip(weeks_ago, sales_columns), reverse=True)
+
+def sales_matrix(replenishment_df, sales_columns):
+    """
+    Return the sales columns as a SKU-by-week float matrix, oldest week first.
+    """
+    ordered_columns = [column for _, column in order_sales_columns(sales_columns)]
+    return replenishment_df[ordered_columns].to_numpy(dtype=np.float64)
+
+def moving_average(sales, weeks):
+    """Average weekly sales over the most recent `weeks` weeks."""
+    weeks = min(weeks, sales.shape[1])
+    if weeks == 0:
+        return np.zeros(sales.shape[0])
+    return sales[:, -weeks:].mean(axis=1)
+
+def ewma_velocity(sales, alpha=EWMA_ALPHA):
+    """Exponentially weighted weekly velocity, weighting the most recent week highest."""
+    if sales.shape[1] == 0:
+        return np.zeros(sales.shape[0])
+    weights = alpha * (1 - alpha) ** np.arange(sales.shape[1])[::-1]
+    return sales @ (weights / weights.sum())
+
+def weeks_of_cover(stock, velocity):
+    """Weeks the given stock lasts at the given velocity; NaN when nothing sells."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(velocity > 0, stock / velocity, np.nan)
+
+def suggested_order_qty(stock, velocity, target_weeks_of_cover=TARGET_WEEKS_OF_COVER):
+    """Units needed to reach the target weeks of cover, rounded up to whole units."""
+    shortfall = np.maximum(target_weeks_of_cover * velocity - stock, 0)
+    return np.ceil(np.round(shortfall, 6)).astype(np.int32)
+
+def add_reorder_columns(replenishment_df, sales_columns, target_weeks_of_cover=TARGET_WEEKS_OF_COVER, alpha=EWMA_ALPHA):
+    """
+    Compute demand and reorder columns for every SKU at once and add them to replenishment_df:
+    sales_avg_4_weeks, sales_avg_8_weeks, velocity_ewma, weeks_of_cover and suggested_order_qty.
+    Stock on hand for cover and reorder purposes is available plus incoming.
+    """
+    sales = sales_matrix(replenishment_df, sales_columns)
+    velocity = ewma_velocity(sales, alpha)
+
+    replenishment_df['sales_avg_4_weeks'] = moving_average(sales, 4).round(2)
+    replenishment_df['sales_avg_8_weeks'] = moving_average(sales, 8).round(2)
+    replenishment_df['velocity_ewma'] = velocity.round(2)
+    add_cover_columns(replenishment_df, velocity, target_weeks_of_cover)
+
+    return replenishment_df
+
+def add_cover_columns(replenishment_df, velocity, target_weeks_of_cover=TARGET_WEEKS_OF_COVER):
+    """
+    Compute the stock-dependent columns, weeks_of_cover and suggested_order_qty, from the
+    current stock of replenishment_df and the given weekly velocity.
+    """
+    stock = replenishment_df['available'].to_numpy(dtype=np.float64) + replenishment_df['incoming'].to_numpy(dtype=np.float64)
+
+    replenishment_df['weeks_of_cover'] = weeks_of_cover(stock, velocity).round(1)
+    replenishment_df['suggested_order_qty'] = suggested_order_qty(stock, velocity, target_weeks_of_cover)
+
+    return replenishment_df
+
+def add_stockout_adjusted_velocity(replenishment_df, sales_columns, in_stock_days_df):
+    """
+    Add velocity_stockout_adjusted: units sold per in-stock day over the sales weeks, scaled to a week.
+    in_stock_days_df comes from stock_history.in_stock_days; SKUs or weeks without stock
+    history count as in stock every day, so the result falls back to the plain average.
+    """
+    ordered = order_sales_columns(sales_columns)
+    sales = replenishment_df[[column for _, column in ordered]].to_numpy(dtype=np.float64)
+    stock_columns = [f"in_stock_days_{weeks_ago}_weeks_ago" for weeks_ago, _ in ordered]
+    stock_columns = [column for column in stock_columns if column in in_stock_days_df.columns]
+
+    joined_df = join_on_sku(replenishment_df[['sku']], in_stock_days_df[['sku'] + stock_columns], how='left')
+    days = joined_df.reindex(columns=[f"in_stock_days_{weeks_ago}_weeks_ago" for weeks_ago, _ in ordered]).fillna(7).to_numpy(dtype=np.float64)
+
+    total_days = days.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        velocity = np.where(total_days > 0, sales.sum(axis=1) / total_days * 7, np.nan)
+    replenishment_df['velocity_stockout_adjusted'] = velocity.round(2)
+
+    return replenishment_df
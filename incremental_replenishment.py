@@ -0,0 +1,100 @@
+import os, json, hashlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sku_dictionary import join_on_sku, normalize_sku
+from prepare_merged_replenishment_df import STOCK_LEVEL_COLUMN_NAMES, STOCK_COUNT_COLUMNS
+from forecast import add_cover_columns, add_stockout_adjusted_velocity, ewma_velocity, sales_matrix
+from sales_cube import most_recent_sunday
+from stock_locations import location_stock_columns
+
+REPLENISHMENT_STATE_FILE = 'cache/replenishment_state.json'
+
+# Columns derived from the stock counts, rewritten with them by an incremental refresh.
+# velocity_stockout_adjusted is among them because the stock history records today's stock,
+# and on a Sunday today is part of the last complete sales week.
+STOCK_DERIVED_COLUMNS = ['weeks_of_cover', 'suggested_order_qty', 'velocity_stockout_adjusted', 'updated_at']
+
+def stock_count_columns(replenishment_df):
+    """Total and per-location stock count columns of a merged frame."""
+    return STOCK_COUNT_COLUMNS + [column for column in location_stock_columns() if column in replenishment_df.columns]
+
+def stock_derived_columns(replenishment_df):
+    """Every column an incremental refresh rewrites."""
+    return stock_count_columns(replenishment_df) + [column for column in STOCK_DERIVED_COLUMNS if column in replenishment_df.columns]
+
+def frame_fingerprint(df):
+    """Content hash of a DataFrame, independent of its index."""
+    if df is None or df.empty:
+        return None
+    return hashlib.sha1(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()
+
+def stock_skus_fingerprint(stock_levels_df):
+    """Hash of the set of SKUs ShipHero reports stock for; a new or dropped SKU changes the rows of the frame."""
+    skus = sorted(set(stock_levels_df['SKU'].map(normalize_sku)))
+    return hashlib.sha1("\n".join(skus).encode()).hexdigest()
+
+def sales_week_end():
+    """End date of the last complete sales week, which the sales columns of the frame cover."""
+    return most_recent_sunday().strftime("%Y-%m-%d")
+
+def replenishment_fingerprints(stock_levels_df, product_metadata_df):
+    """Fingerprints of the inputs a stock-only refresh relies on being unchanged."""
+    return {
+        'sales_week_end': sales_week_end(),
+        'product_metadata': frame_fingerprint(product_metadata_df),
+        'stock_skus': stock_skus_fingerprint(stock_levels_df)
+    }
+
+def load_replenishment_state():
+    """Return the state of the last replenishment run, or None before the first run."""
+    if not os.path.exists(REPLENISHMENT_STATE_FILE):
+        return None
+    with open(REPLENISHMENT_STATE_FILE, 'r') as f:
+        return json.load(f)
+
+def save_replenishment_state(snapshot_path, fingerprints):
+    """Record the snapshot of the last merged frame and the fingerprints of its inputs."""
+    os.makedirs(os.path.dirname(REPLENISHMENT_STATE_FILE), exist_ok=True)
+    state = {'snapshot': snapshot_path, 'fingerprints': fingerprints, 'saved_at': datetime.now().isoformat()}
+    tmp_path = f"{REPLENISHMENT_STATE_FILE}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, REPLENISHMENT_STATE_FILE)
+
+def changed_inputs(state, fingerprints):
+    """Return the names of the inputs whose fingerprint differs from the last run."""
+    if state is None or not os.path.exists(state.get('snapshot') or ''):
+        return list(fingerprints)
+    return [name for name, fingerprint in fingerprints.items() if state['fingerprints'].get(name) != fingerprint]
+
+def refresh_stock_columns(previous_df, stock_levels_df, sales_columns, in_stock_days_df=None):
+    """
+    Re-derive the stock columns of the last merged frame from fresh stock levels.
+    Only rows whose stock counts changed are recomputed; sales and metadata columns are kept.
+    With in_stock_days_df, their velocity_stockout_adjusted is recomputed too: a SKU's in-stock
+    days only change with its stock counts.
+    Returns the refreshed frame and a boolean mask of the changed rows.
+    """
+    count_columns = stock_count_columns(previous_df)
+    stock_df = stock_levels_df.rename(columns=STOCK_LEVEL_COLUMN_NAMES)
+    stock_df = stock_df.assign(sku=stock_df['sku'].map(normalize_sku)).reindex(columns=['sku'] + count_columns)
+    new_counts = join_on_sku(previous_df[['sku']], stock_df, how='left')[count_columns].fillna(0).astype('int32')
+
+    changed = (new_counts.to_numpy() != previous_df[count_columns].to_numpy()).any(axis=1)
+    replenishment_df = previous_df.copy()
+    if not changed.any():
+        return replenishment_df, changed
+
+    affected_df = replenishment_df.loc[changed].copy()
+    affected_df[count_columns] = new_counts.loc[changed].to_numpy()
+    add_cover_columns(affected_df, ewma_velocity(sales_matrix(affected_df, sales_columns)))
+    if in_stock_days_df is not None and 'velocity_stockout_adjusted' in affected_df.columns:
+        add_stockout_adjusted_velocity(affected_df, sales_columns, in_stock_days_df)
+    affected_df['updated_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    rows = np.flatnonzero(changed)
+    for column in stock_derived_columns(replenishment_df):
+        column_index = replenishment_df.columns.get_loc(column)
+        replenishment_df.iloc[rows, column_index] = affected_df[column].to_numpy()
+    return replenishment_df, changed
@@ -1,44 +1,126 @@
+import time
+startup_started_at = time.perf_counter()
+
 from flask import Flask, request, jsonify, render_template
-import threading
-from prepare_replenishment import prepare_replenishment
-from populate_production import populate_production
-from sync_shiphero import push_pos_to_shiphero
-from sync_shiphero import sync_shiphero_purchase_orders_to_airtable
-from packing_slips import packing_slips
+import threading, importlib
 
 app = Flask(__name__)
 
+def load_job(module_name, function_name):
+    """Import a job's module on first use, so heavy libraries are only loaded by the jobs that need them."""
+    started_at = time.perf_counter()
+    module = importlib.import_module(module_name)
+    elapsed = time.perf_counter() - started_at
+    if elapsed >= 0.01:
+        print(f"Loaded {module_name} in {elapsed:.2f}s")
+    return getattr(module, function_name)
+
+def start_job(module_name, function_name, *args):
+    def run():
+        load_job(module_name, function_name)(*args)
+    threading.Thread(target=run).start()
+
 @app.route('/webhook/prepare_replenishment', methods=['GET', 'POST'])
 def webhook_prepare_replenishment():
     use_cache_stock_levels = request.args.get('use_cache_stock_levels', 'false').lower() == 'true'
     use_cache_sales = request.args.get('use_cache_sales', 'false').lower() == 'true'
-    threading.Thread(target=prepare_replenishment, args=(use_cache_stock_levels, use_cache_sales)).start()
+    use_arrow = request.args.get('use_arrow', 'false').lower() == 'true'
+    incremental = request.args.get('incremental', 'false').lower() == 'true'
+    use_warm_cache = request.args.get('use_warm_cache', 'false').lower() == 'true'
+    start_job('prepare_replenishment', 'prepare_replenishment', use_cache_stock_levels, use_cache_sales, use_arrow, incremental, use_warm_cache)
     return jsonify({"status": "Task prepare_replenishment started"}), 200
 
+@app.route('/webhook/prepare_replenishment_scoped', methods=['GET', 'POST'])
+def webhook_prepare_replenishment_scoped():
+    def comma_list(name):
+        value = request.args.get(name) or request.form.get(name)
+        return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+    supplier = request.args.get('supplier') or request.form.get('supplier')
+    product_nums = comma_list('product_nums')
+    skus = comma_list('skus')
+    if not (supplier or product_nums or skus):
+        return jsonify({"error": "supplier, product_nums or skus is required"}), 400
+    start_job('scoped_replenishment', 'prepare_replenishment_scoped', supplier, product_nums, skus)
+    return jsonify({"status": "Task prepare_replenishment_scoped started"}), 200
+
 @app.route('/webhook/populate_production', methods=['GET', 'POST'])
 def webhook_populate_production():
-    threading.Thread(target=populate_production).start()
+    start_job('populate_production', 'populate_production')
     return jsonify({"status": "Task populate_production started"}), 200
 
 @app.route('/webhook/push_pos_to_shiphero', methods=['GET', 'POST'])
 def webhook_push_pos_to_shiphero():
-    threading.Thread(target=push_pos_to_shiphero).start()
+    start_job('sync_shiphero', 'push_pos_to_shiphero')
     return jsonify({"status": "Task push_pos_to_shiphero started"}), 200
 
 @app.route('/webhook/packing_slips', methods=['GET', 'POST'])
 def webhook_packing_slips():
-    threading.Thread(target=packing_slips).start()
+    start_job('packing_slips', 'packing_slips')
     return jsonify({"status": "Task packing_slips started"}), 200
 
 @app.route('/webhook/sync_shiphero_purchase_orders_to_airtable', methods=['GET', 'POST'])
 def webhook_sync_shiphero_purchase_orders_to_airtable():
     created_from = request.args.get('created_from') or request.form.get('created_from')
-    threading.Thread(target=sync_shiphero_purchase_orders_to_airtable, args=(created_from,)).start()
+    full_sweep = request.args.get('full_sweep', 'false').lower() == 'true'
+    start_job('sync_shiphero', 'sync_shiphero_purchase_orders_to_airtable', created_from, full_sweep)
     return jsonify({"status": "Task sync_shiphero_purchase_orders_to_airtable started"}), 200
 
+@app.route('/webhook/shiphero/purchase_order_update', methods=['POST'])
+def webhook_shiphero_purchase_order_update():
+    signature = request.headers.get('X-Shiphero-Hmac-Sha256')
+    handle_po_update_webhook = load_job('shiphero_webhooks', 'handle_po_update_webhook')
+    response, status_code = handle_po_update_webhook(request.get_data(), signature)
+    return jsonify(response), status_code
+
+def query_list(name):
+    value = request.args.get(name)
+    return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+def replenishment_response(filters):
+    index = load_job('replenishment_api', 'get_replenishment_index')()
+    if index is None:
+        return jsonify({"error": "No replenishment snapshot available yet"}), 503
+
+    try:
+        result = index.query(filters, query_list('fields'), request.args.get('offset', type=int), request.args.get('limit', type=int))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Responses only change when a new snapshot is published
+    response = jsonify(result)
+    response.set_etag(index.etag)
+    return response.make_conditional(request)
+
+@app.route('/api/replenishment', methods=['GET'])
+def api_replenishment():
+    # Indexed columns are comma-separated filters, e.g. ?supplier=Acme&product_num=P1,P2; other
+    # query arguments, such as cache busters, are ignored
+    indexed_columns = load_job('replenishment_api', 'INDEXED_COLUMNS')
+    filters = {name: query_list(name) for name in request.args if name in indexed_columns}
+    return replenishment_response({name: values for name, values in filters.items() if values})
+
+@app.route('/api/replenishment/<path:sku>', methods=['GET'])
+def api_replenishment_sku(sku):
+    return replenishment_response({'sku': [sku]})
+
+@app.route('/cache_warmer/status', methods=['GET'])
+def cache_warmer_status():
+    return jsonify(load_job('cache_warmer', 'get_cache_warmer')().status()), 200
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+# Worker processes started with spawn or forkserver (see transform_data.sales_process_context)
+# import this module as __mp_main__; only the app itself runs the background workers
+if __name__ != '__mp_main__':
+    # Drain webhook events queued before a restart without waiting for the next webhook
+    start_job('shiphero_webhooks', 'get_webhook_worker')
+    # Keep every source's cache warm in the background while the app runs, however it is served
+    start_job('cache_warmer', 'start_cache_warmer')
+
+print(f"App ready in {time.perf_counter() - startup_started_at:.2f}s")
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5001)
\ No newline at end of file
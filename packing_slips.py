@@ -1,9 +1,8 @@
 import os
 import sys
-from pyairtable import Api
+from clients import get_airtable_table
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
-import config
 import json
 from reportlab.lib import colors
 from reportlab.lib.units import inch
@@ -13,12 +12,9 @@ from reportlab.platypus import Paragraph
 
 def fetch_purchase_orders_to_generate():
     
-    # Initialize Airtable API client
-    api = Api(config.AIRTABLE_API_KEY)
-    
-    # Initialize Airtable client
-    purchase_orders_table = api.table(config.AIRTABLE_PRODUCTION_DEV_BASE_ID, "Purchase Orders")
-    line_items_table = api.table(config.AIRTABLE_PRODUCTION_DEV_BASE_ID, "Line Items")
+    # Initialize Airtable tables from the shared client
+    purchase_orders_table = get_airtable_table("Purchase Orders")
+    line_items_table = get_airtable_table("Line Items")
     
     # Fetch purchase orders with the formula field "Generate packing slips?" set to True
     purchase_orders = purchase_orders_table.all(formula="{Generate packing slip?}", fields = ["PO #", "Supplier Name", "Shipping Address", "Ship Date"])
@@ -124,11 +120,8 @@ def generate_packing_slip(order):
 
 def upload_packing_slip(order, filename):
     
-    # Initialize Airtable API client
-    api = Api(config.AIRTABLE_API_KEY)
-
-    # Initialize Airtable client
-    purchase_orders_table = api.table(config.AIRTABLE_PRODUCTION_DEV_BASE_ID, "Purchase Orders")
+    # Initialize Airtable table from the shared client
+    purchase_orders_table = get_airtable_table("Purchase Orders")
 
     # Remove any existing attachments in the 'Packing slip' field and set the 'Generate packing slip?' field to False
     purchase_orders_table.update(order['id'], {"Packing slip": [], "Generate packing slip?": False})
@@ -1,21 +1,11 @@
-import gspread
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from pyairtable import Table
 import pandas as pd
-import config
+import hashlib, json
+from clients import get_airtable_table, get_gspread_client
+from utils import airtable_string
+from write_journal import WriteJournal, StepInDoubt
 
-# Initialize gspread and authenticate with Google Sheets
-
-# Define the scope
-SCOPES = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/spreadsheets']
-
-# Path to your service account key file
-SERVICE_ACCOUNT_FILE = 'service-account.json'  # Update this path
-
-# Authenticate and create the service
-credentials = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-gc = gspread.authorize(credentials)
+# Airtable accepts at most 10 records per batch request
+AIRTABLE_BATCH_SIZE = 10
 
 def get_record_ids_by_value(table, field, values):
     """Fetch the record IDs for the given field values from the specified table."""
@@ -31,10 +21,35 @@ def get_record_ids_by_value(table, field, values):
     
     return record_ids
 
+def field_text(value):
+    """Text of an Airtable field value as a formula `{field} & ''` sees it; lookups hold one value here."""
+    if isinstance(value, list):
+        value = value[0] if value else ''
+    return '' if value is None else str(value)
+
+def find_created_records(table, keys):
+    """
+    Recover a batch_create of an earlier run from the key fields of its records.
+    Returns the record IDs in the order of keys when every record is found, None when none is.
+    """
+    conditions = [
+        "AND(" + ", ".join(f"{{{field}}} & '' = {airtable_string(value)}" for field, value in key.items()) + ")"
+        for key in keys
+    ]
+    records = table.all(formula="OR(" + ", ".join(conditions) + ")")
+    if not records:
+        return None
+    record_ids = {tuple(field_text(record['fields'].get(field)) for field in keys[0]): record['id'] for record in records}
+    missing = [key for key in keys if tuple(str(value) for value in key.values()) not in record_ids]
+    if missing:
+        raise StepInDoubt(f"Only {len(keys) - len(missing)} of {len(keys)} records of a batch were found in {table.name}")
+    return [record_ids[tuple(str(value) for value in key.values())] for key in keys]
+
 def populate_production():
     file_id = '1L35Drb5FZfPsV7kk73wZzsqCQ9k6x7KSoKJMYFhefeQ'  # Google Drive file name: PO BUILDER 3.0
 
     # Open the template file with gspread
+    gc = get_gspread_client()
     sh = gc.open_by_key(file_id)
     worksheet = sh.worksheet("Replenishment")
 
@@ -56,31 +71,42 @@ def populate_production():
     # Print first 5 rows of the DataFrame
     print(replenishment_df.head())
 
-    # Get the most recent PO # from the Purchase Orders table in the Production base
-    print("Fetching the most recent PO #...")
-    purchase_orders_table = Table(config.AIRTABLE_API_KEY, config.AIRTABLE_PRODUCTION_DEV_BASE_ID, "Purchase Orders")
-    purchase_orders = purchase_orders_table.all(view='Active')
-    po_numbers = [int(po['fields']['PO #']) for po in purchase_orders]
-    po_numbers.sort()
-    latest_po_number = po_numbers[-1] if po_numbers else 0
-    print(f"Most recent PO #: {latest_po_number}")
-
-    # Initialize the Line Items table and Products table
-    line_items_table = Table(config.AIRTABLE_API_KEY, config.AIRTABLE_PRODUCTION_DEV_BASE_ID, "Line Items")
-    variants_table = Table(config.AIRTABLE_API_KEY, config.AIRTABLE_PRODUCTION_DEV_BASE_ID, "Variants")
-    products_table = Table(config.AIRTABLE_API_KEY, config.AIRTABLE_PRODUCTION_DEV_BASE_ID, "Products")
-
-    # Get the record IDs for the SKUs in the Variants table
-    print("Fetching record IDs for SKUs from the Variants table...")
-    skus = replenishment_df['sku'].unique()
-    variant_record_ids = get_record_ids_by_value(variants_table, 'SKU', skus)
-    print(f"Found record IDs for {len(variant_record_ids)} SKUs.")
-
-    # Get the record IDs for the product numbers in the Products table
-    print("Fetching record IDs for product numbers from the Products table...")
-    product_nums = replenishment_df['product_num'].unique()
-    product_record_ids = get_record_ids_by_value(products_table, 'Product Number', product_nums)
-    print(f"Found record IDs for {len(product_record_ids)} product numbers.")
+    # Resume the journal of an earlier run of the same release, if it did not finish
+    release = replenishment_df[['product_num', 'sku', 'To Order Qty']].values.tolist()
+    journal = WriteJournal('populate_production', hashlib.sha1(json.dumps(release, default=str).encode()).hexdigest())
+
+    purchase_orders_table = get_airtable_table("Purchase Orders")
+    line_items_table = get_airtable_table("Line Items")
+    variants_table = get_airtable_table("Variants")
+    products_table = get_airtable_table("Products")
+
+    def fetch_lookups():
+        # Get the most recent PO # from the Purchase Orders table in the Production base
+        print("Fetching the most recent PO #...")
+        purchase_orders = purchase_orders_table.all(view='Active')
+        po_numbers = [int(po['fields']['PO #']) for po in purchase_orders]
+        po_numbers.sort()
+        latest_po_number = po_numbers[-1] if po_numbers else 0
+        print(f"Most recent PO #: {latest_po_number}")
+
+        # Get the record IDs for the SKUs in the Variants table
+        print("Fetching record IDs for SKUs from the Variants table...")
+        variant_record_ids = get_record_ids_by_value(variants_table, 'SKU', replenishment_df['sku'].unique())
+        print(f"Found record IDs for {len(variant_record_ids)} SKUs.")
+
+        # Get the record IDs for the product numbers in the Products table
+        print("Fetching record IDs for product numbers from the Products table...")
+        product_record_ids = get_record_ids_by_value(products_table, 'Product Number', replenishment_df['product_num'].unique())
+        print(f"Found record IDs for {len(product_record_ids)} product numbers.")
+
+        return {'latest_po_number': latest_po_number, 'variants': variant_record_ids, 'products': product_record_ids}
+
+    # The PO numbers are taken from the journal on a resumed run, so they are not assigned twice.
+    # A lookup that did not finish wrote nothing, so a resumed run simply fetches again.
+    lookups = journal.run_step('lookups', fetch_lookups, recover=lambda payload: fetch_lookups())
+    latest_po_number = lookups['latest_po_number']
+    variant_record_ids = {str(sku): record_id for sku, record_id in lookups['variants'].items()}
+    product_record_ids = {str(product_num): record_id for product_num, record_id in lookups['products'].items()}
 
     # Create new purchase orders for each unique product_num
     new_po_records = []
@@ -93,24 +119,29 @@ def populate_production():
         # Create a new purchase order record
         new_po_record = {
             "PO #": str(po_number),
-            "Product": [product_record_ids.get(product_num)],
+            "Product": [product_record_ids.get(str(product_num))],
             "Line Items": []  # This will be populated later
         }
         new_po_records.append(new_po_record)
 
-    # Add new purchase order records to the Purchase Orders table
+    # Add new purchase order records to the Purchase Orders table, one journaled batch at a time
     print("Adding new purchase order records to the Purchase Orders table...")
-    purchase_orders_table.batch_create(new_po_records)
-    print("Added new purchase order records.")
-
-    # Fetch the newly created purchase order records to get their IDs
-    print("Fetching newly created purchase order records...")
-    new_po_numbers = [po['PO #'] for po in new_po_records]
-    new_po_record_ids = get_record_ids_by_value(purchase_orders_table, 'PO #', new_po_numbers)
-    print(f"Found record IDs for {len(new_po_record_ids)} new purchase orders.")
+    new_po_record_ids = {}
+    for i, start in enumerate(range(0, len(new_po_records), AIRTABLE_BATCH_SIZE)):
+        batch = new_po_records[start:start + AIRTABLE_BATCH_SIZE]
+        created = journal.run_step(
+            f"purchase_orders:{i}",
+            lambda: [record['id'] for record in purchase_orders_table.batch_create(batch)],
+            payload=batch,
+            recover=lambda batch: find_created_records(purchase_orders_table, [{'PO #': record['PO #']} for record in batch])
+        )
+        new_po_record_ids.update(zip([record['PO #'] for record in batch], created))
+    print(f"Added {len(new_po_record_ids)} new purchase order records.")
 
     # Create new line items
+    new_po_numbers = [po['PO #'] for po in new_po_records]
     new_line_item_records = []
+    line_item_keys = []
     for index, row in replenishment_df.iterrows():
         product_num = row['product_num']
         sku = row['sku']
@@ -123,16 +154,26 @@ def populate_production():
         # Create a new line item record
         new_line_item_record = {
             "Purchase Order": [po_record_id],
-            "Variant": [variant_record_ids.get(sku)],
+            "Variant": [variant_record_ids.get(str(sku))],
             "Quantity Ordered": to_order_qty
         }
         new_line_item_records.append(new_line_item_record)
+        line_item_keys.append({'PO #': po_number, 'sku': str(sku)})
 
     # Print the first 5 new line item records
     print(new_line_item_records[:5])
 
-    # Add new line item records to the Line Items table
+    # Add new line item records to the Line Items table, one journaled batch at a time
     print("Adding new line item records to the Line Items table...")
-    line_items_table.batch_create(new_line_item_records)
+    for i, start in enumerate(range(0, len(new_line_item_records), AIRTABLE_BATCH_SIZE)):
+        batch = new_line_item_records[start:start + AIRTABLE_BATCH_SIZE]
+        keys = line_item_keys[start:start + AIRTABLE_BATCH_SIZE]
+        journal.run_step(
+            f"line_items:{i}",
+            lambda: [record['id'] for record in line_items_table.batch_create(batch)],
+            payload=batch,
+            recover=lambda batch: find_created_records(line_items_table, keys)
+        )
     print("Added new line item records.")
 
+    journal.complete()
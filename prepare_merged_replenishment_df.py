@@ -2,17 +2,41 @@ import pandas as pd
 import os
 from datetime import datetime
 import re
+from sku_dictionary import join_on_sku
+from forecast import add_reorder_columns, add_stockout_adjusted_velocity
+from stock_locations import location_stock_columns
 
-def prepare_merged_replenishment_df(stock_levels_df, sales_df, product_metadata_df):
+# Metadata columns holding text, already flattened by transform_product_metadata
+METADATA_TEXT_COLUMNS = [
+    'option1_value', 'position', 'product_name', 'category', 'subcategory', 'product_num',
+    'product_type_internal', 'supplier', 'status_shopify', 'stocked_status', 'decoration_group',
+    'artwork_title', 'component_brand', 'component_style_number', 'component_style_name',
+    'component_color', 'blank_preferred_supplier', 'blank_backup_suppliers'
+]
+
+# Text dimensions with few distinct values, stored as categoricals
+CATEGORICAL_COLUMNS = ['supplier', 'category', 'decoration_group', 'product_type_internal']
+
+# Stock counts, stored as fixed-width integers alongside the sales columns
+STOCK_COUNT_COLUMNS = ['on_hand', 'committed', 'available', 'backorder', 'incoming']
+
+# Columns of transform_stock_levels renamed to the standardized convention
+STOCK_LEVEL_COLUMN_NAMES = {
+    'SKU': 'sku',
+    'On Hand': 'on_hand',
+    'committed': 'committed',
+    'Available': 'available',
+    'Backorder': 'backorder',
+    'Incoming Stock': 'incoming'
+}
+
+def prepare_merged_replenishment_df(stock_levels_df, sales_df, product_metadata_df, in_stock_days_df=None, history_sales_df=None):
+    """
+    Merge stock levels, weekly sales and product metadata into the replenishment DataFrame.
+    history_sales_df, from SalesHistory.history_sales, adds the year-over-year and monthly sales columns.
+    """
     # Rename columns to a standardized convention
-    stock_levels_df.rename(columns={
-        'SKU': 'sku',
-        'On Hand': 'on_hand',
-        'committed': 'committed',
-        'Available': 'available',
-        'Backorder': 'backorder',
-        'Incoming Stock': 'incoming'
-    }, inplace=True)
+    stock_levels_df.rename(columns=STOCK_LEVEL_COLUMN_NAMES, inplace=True)
 
     product_metadata_df.rename(columns={
         'SKU': 'sku',
@@ -37,20 +61,26 @@ def prepare_merged_replenishment_df(stock_levels_df, sales_df, product_metadata_
         'Blank Backup Supplier(s)': 'blank_backup_suppliers'
     }, inplace=True)
 
-    # Inner merge stock_levels_df and product_metadata_df on SKU
-    replenishment_df = stock_levels_df.merge(product_metadata_df, on='sku', how='inner')
+    # Inner join stock_levels_df and product_metadata_df by SKU code
+    replenishment_df = join_on_sku(stock_levels_df, product_metadata_df, how='inner')
 
-    # Left merge with sales_df on SKU, filling missing sales data with 0
-    replenishment_df = replenishment_df.merge(sales_df, on='sku', how='left').fillna(0)
+    # Left join with sales_df by SKU code; missing sales are filled per column below
+    replenishment_df = join_on_sku(replenishment_df, sales_df, how='left')
+    if history_sales_df is not None:
+        replenishment_df = join_on_sku(replenishment_df, history_sales_df, how='left')
 
-    # Fill missing values in specific columns with empty strings
-    columns_to_fill = ['option1_value', 'product_name', 'category', 'subcategory', 
-                       'supplier', 'status_shopify', 'decoration_group', 'artwork_title']
-    replenishment_df[columns_to_fill] = replenishment_df[columns_to_fill].fillna('')
+    # Fill missing values in text columns with empty strings
+    text_columns = [column for column in METADATA_TEXT_COLUMNS if column in replenishment_df.columns]
+    replenishment_df[text_columns] = replenishment_df[text_columns].fillna('')
 
-    # Convert columns to strings to avoid unhashable type errors
-    for column in ['decoration_group', 'product_type_internal', 'product_num', 'position']:
-        replenishment_df[column] = replenishment_df[column].apply(lambda x: str(x))
+    # Fill missing numeric values with 0 and store counts as fixed-width integers
+    count_columns = [column for column in STOCK_COUNT_COLUMNS + location_stock_columns() if column in replenishment_df.columns]
+    count_columns += [column for column in sales_df.columns if column != 'sku']
+    if history_sales_df is not None:
+        count_columns += [column for column in history_sales_df.columns if column != 'sku']
+    replenishment_df[count_columns] = replenishment_df[count_columns].fillna(0).astype('int32')
+    if 'cost_production_total' in replenishment_df.columns:
+        replenishment_df['cost_production_total'] = replenishment_df['cost_production_total'].fillna(0)
 
     # Sort replenishment_df by decoration_group, product_type_internal, product_num, and position
     replenishment_df.sort_values(by=['decoration_group', 'product_type_internal', 'product_num', 'position'], inplace=True)
@@ -77,13 +107,16 @@ def prepare_merged_replenishment_df(stock_levels_df, sales_df, product_metadata_
     # Remove position field
     replenishment_df.drop(columns=['position'], inplace=True)
 
-    # Remove extra characters from all columns with type string
-    for column in replenishment_df.select_dtypes(include='object').columns:
-        replenishment_df[column] = replenishment_df[column].apply(
-           lambda x: re.sub(r"[\[\]\'\"]", "", x) if isinstance(x, str) else x
-        )
-    print("After removing extra characters from string columns:")
-    print(replenishment_df.head())
+    # Add demand forecast and reorder quantity columns so the sheet does not compute them
+    add_reorder_columns(replenishment_df, sales_columns_sorted)
+    if in_stock_days_df is not None:
+        add_stockout_adjusted_velocity(replenishment_df, sales_columns_sorted, in_stock_days_df)
+
+    # Store low-cardinality text dimensions as categoricals
+    for column in CATEGORICAL_COLUMNS:
+        replenishment_df[column] = replenishment_df[column].astype('category')
+    print("After compacting column types:")
+    print(replenishment_df.dtypes)
 
     # Add "Updated At" field with the current timestamp
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
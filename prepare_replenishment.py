@@ -1,25 +1,123 @@
 # prepare_replenishment.py
+from concurrent.futures import ThreadPoolExecutor
 from fetch_data import fetch_shiphero_stock_levels, fetch_airtable_incoming_stock, fetch_shopify_sales_data, fetch_airtable_product_metadata, fetch_shopify_inventory_data
 from transform_data import transform_stock_levels, transform_sales_data, transform_product_metadata
 from prepare_merged_replenishment_df import prepare_merged_replenishment_df
-from export_sheets_replenishment import export_sheets_replenishment
+from export_sheets_replenishment import export_sheets_replenishment, patch_sheets_replenishment
+from stock_history import append_stock_snapshot, in_stock_days
+from replenishment_snapshots import save_replenishment_snapshot, load_replenishment_snapshot, snapshot_retention_days
+from incremental_replenishment import stock_derived_columns, sales_week_end, replenishment_fingerprints, load_replenishment_state, save_replenishment_state, changed_inputs, refresh_stock_columns
+from sales_cube import SalesCube
+from sales_history import SalesHistory
+from replenishment_api import publish_replenishment_snapshot
+from cache_warmer import get_cache_warmer
+from profiling import stage, report_live_objects
 
-def prepare_replenishment(use_cache_stock_levels=False, use_cache_sales=False):
-    
-    # Prepare stock levels
-    stock_levels_data = fetch_shiphero_stock_levels(use_cache=use_cache_stock_levels)
-    incoming_stock_data = fetch_airtable_incoming_stock()
-    committed_stock_data = fetch_shopify_inventory_data()
-    stock_levels_df = transform_stock_levels(stock_levels_data, incoming_stock_data, committed_stock_data)
+def fetch_sources(use_cache_stock_levels=False, use_cache_sales=False, use_arrow=False, fetch_sales=True):
+    """Fetch every source of the replenishment data from the APIs (or their caches)."""
 
-    # Prepare sales and product metadata
-    sales_data = fetch_shopify_sales_data(use_cache=use_cache_sales)
-    sales_df = transform_sales_data(sales_data)
+    # Start the Shopify bulk operations; the bulk operation scheduler runs them one at a time
+    # while ShipHero and Airtable are fetched below
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        committed_stock_future = executor.submit(fetch_shopify_inventory_data)
+        sales_future = executor.submit(fetch_shopify_sales_data, use_cache=use_cache_sales) if fetch_sales else None
+
+        # Prepare stock levels
+        stock_levels_data = fetch_shiphero_stock_levels(use_cache=use_cache_stock_levels, as_arrow=use_arrow)
+        incoming_stock_data = fetch_airtable_incoming_stock()
+
+        # Fetch product metadata
+        product_metadata = fetch_airtable_product_metadata(as_arrow=use_arrow)
+
+        committed_stock_data = committed_stock_future.result()
+        sales_data = sales_future.result() if sales_future else None
+
+    return stock_levels_data, incoming_stock_data, product_metadata, committed_stock_data, sales_data
+
+def prepare_replenishment(use_cache_stock_levels=False, use_cache_sales=False, use_arrow=False, incremental=False, use_warm_cache=False):
+    """
+    Fetch, merge and export the replenishment data.
+    With use_warm_cache=True, every source is read at once from the background cache warmer,
+    which revalidates the sources older than their threshold for the next run.
+    With incremental=True, Shopify sales are not refetched while the last complete sales week is the
+    same as in the last run. When the product metadata and the set of stocked SKUs are unchanged too,
+    only the stock columns of the last merged frame are re-derived and only their changed rows are
+    pushed to the sheet; otherwise the frame is rebuilt and exported in full.
+    """
+
+    state = load_replenishment_state() if incremental else None
+    fetch_sales = state is None or bool(changed_inputs(state, {'sales_week_end': sales_week_end()}))
+
+    with stage('fetch_sources'):
+        if use_warm_cache:
+            warmer = get_cache_warmer()
+            stock_levels_data = warmer.get('shiphero_stock_levels')
+            incoming_stock_data = warmer.get('airtable_incoming_stock')
+            product_metadata = warmer.get('airtable_product_metadata')
+            committed_stock_data = warmer.get('shopify_committed_stock')
+            sales_data = warmer.get('shopify_sales') if fetch_sales else None
+        else:
+            stock_levels_data, incoming_stock_data, product_metadata, committed_stock_data, sales_data = fetch_sources(use_cache_stock_levels, use_cache_sales, use_arrow, fetch_sales)
+
+    with stage('transform_stock_levels'):
+        stock_levels_df = transform_stock_levels(stock_levels_data, incoming_stock_data, committed_stock_data)
+        # Only stock fetched by this run is recorded; cached stock would be dated today
+        if use_cache_stock_levels or use_warm_cache:
+            print("Stock levels were read from a cache, not recording a stock snapshot")
+        else:
+            append_stock_snapshot(stock_levels_df)
+    report_live_objects('transform_stock_levels', stock_levels_data=stock_levels_data, incoming_stock_data=incoming_stock_data, committed_stock_data=committed_stock_data, stock_levels_df=stock_levels_df)
+    # Release the raw API responses as soon as their stage has consumed them
+    del stock_levels_data, incoming_stock_data, committed_stock_data
 
     # Prepare product metadata
-    product_metadata = fetch_airtable_product_metadata()
-    product_metadata_df = transform_product_metadata(product_metadata)
+    with stage('transform_product_metadata'):
+        product_metadata_df = transform_product_metadata(product_metadata)
+        fingerprints = replenishment_fingerprints(stock_levels_df, product_metadata_df)
+    report_live_objects('transform_product_metadata', product_metadata=product_metadata, product_metadata_df=product_metadata_df)
+    del product_metadata
+
+    # Refresh only the stock columns when nothing else changed since the last run
+    if incremental and not changed_inputs(state, fingerprints):
+        with stage('refresh_stock_columns'):
+            previous_df = load_replenishment_snapshot(path=state['snapshot'])
+            sales_columns = [column for column in previous_df.columns if column.startswith('sales_') and '_weeks_ago_' in column]
+            replenishment_df, changed_rows = refresh_stock_columns(previous_df, stock_levels_df, sales_columns, in_stock_days())
+            del previous_df
+        print(f"Stock changed for {changed_rows.sum()} of {len(replenishment_df)} SKUs")
+        if not changed_rows.any():
+            return
+        with stage('export'):
+            snapshot_path = save_replenishment_snapshot(replenishment_df, retention_days=snapshot_retention_days())
+            publish_replenishment_snapshot(replenishment_df, snapshot_path)
+            patch_sheets_replenishment(replenishment_df[changed_rows], columns=stock_derived_columns(replenishment_df))
+            save_replenishment_state(snapshot_path, fingerprints)
+        return
+
+    # Prepare sales; within the same sales week the cube already holds the last run's weeks
+    with stage('transform_sales_data'):
+        sales_df = transform_sales_data(sales_data) if sales_data is not None else SalesCube().weekly_sales()
+    report_live_objects('transform_sales_data', sales_data=sales_data, sales_df=sales_df)
+
+    # Ingest the fetched orders into the on-disk sales history and aggregate its long-range columns
+    with stage('sales_history'):
+        sales_history = SalesHistory()
+        if sales_data is not None:
+            sales_history.ingest(sales_data)
+        del sales_data
+        history_sales_df = sales_history.history_sales()
+
+    # Count in-stock days per SKU and week from the stock history
+    with stage('in_stock_days'):
+        in_stock_days_df = in_stock_days()
 
     # Prepare merged replenishment DataFrame and export to Google Sheets
-    replenishment_df = prepare_merged_replenishment_df(stock_levels_df, sales_df, product_metadata_df)
-    export_sheets_replenishment(replenishment_df)
\ No newline at end of file
+    with stage('merge'):
+        replenishment_df = prepare_merged_replenishment_df(stock_levels_df, sales_df, product_metadata_df, in_stock_days_df, history_sales_df)
+    report_live_objects('merge', stock_levels_df=stock_levels_df, sales_df=sales_df, product_metadata_df=product_metadata_df, in_stock_days_df=in_stock_days_df, history_sales_df=history_sales_df, replenishment_df=replenishment_df)
+    del stock_levels_df, sales_df, product_metadata_df, in_stock_days_df, history_sales_df
+    with stage('export'):
+        snapshot_path = save_replenishment_snapshot(replenishment_df, retention_days=snapshot_retention_days())
+        publish_replenishment_snapshot(replenishment_df, snapshot_path)
+        export_sheets_replenishment(replenishment_df)
+        save_replenishment_state(snapshot_path, fingerprints)
@@ -0,0 +1,183 @@
+import os, sys, cProfile, threading, time, itertools, tracemalloc, resource
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_DIR = 'output/profiles'
+
+# Seconds between stack samples for the collapsed stack files
+SAMPLE_INTERVAL = 0.005
+
+# Allocation sites listed per stage in memory profiling mode
+TOP_ALLOCATIONS = 15
+
+_profile_run_dir = None
+_profile_cpu = False
+_profile_memory = False
+_memory_stages = []
+_stage_counter = itertools.count(1)
+_active = threading.local()
+
+def enable_profiling(profile_dir=PROFILE_DIR, cpu=True, memory=False):
+    """
+    Profile every stage that follows; each run writes its files to its own timestamped directory.
+    cpu writes cProfile stats and collapsed stacks per stage; memory traces allocations with
+    tracemalloc and records the traced peak and process RSS per stage.
+    """
+    global _profile_run_dir, _profile_cpu, _profile_memory
+    _profile_run_dir = os.path.join(profile_dir, datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
+    _profile_cpu = cpu
+    _profile_memory = memory
+    os.makedirs(_profile_run_dir, exist_ok=True)
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    print(f"Profiling enabled, writing stage profiles to {_profile_run_dir}")
+    return _profile_run_dir
+
+def memory_profiling_enabled():
+    return _profile_memory
+
+def current_rss():
+    """Resident set size of the process in bytes; the peak RSS where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return peak_rss()
+
+def peak_rss():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+def megabytes(size):
+    return f"{size / 2**20:,.1f} MB"
+
+def object_size(obj):
+    """
+    Approximate deep size of obj in bytes: DataFrames and Series report their deep memory usage,
+    Arrow tables their buffers, and containers are walked down to their leaves.
+    """
+    if hasattr(obj, 'memory_usage') and hasattr(obj, 'columns'):
+        return int(obj.memory_usage(deep=True).sum())
+    if hasattr(obj, 'memory_usage') and hasattr(obj, 'dtype'):
+        return int(obj.memory_usage(deep=True))
+    if hasattr(obj, 'nbytes') and hasattr(obj, 'schema'):
+        return int(obj.nbytes)
+
+    size = 0
+    seen = set()
+    pending = [obj]
+    while pending:
+        item = pending.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            pending.extend(item)
+    return size
+
+def report_live_objects(stage_name, **objects):
+    """In memory profiling mode, print the size of the named objects still alive after a stage, largest first."""
+    if not _profile_memory:
+        return
+    sizes = sorted(((object_size(obj), name) for name, obj in objects.items() if obj is not None), reverse=True)
+    print(f"Live objects after {stage_name}:")
+    for size, name in sizes:
+        print(f"  {name}: {megabytes(size)}")
+
+def memory_report():
+    """Print the traced peak and RSS of every profiled stage."""
+    if not _memory_stages:
+        return
+    lines = [f"{'stage':<32} {'traced peak':>14} {'traced after':>14} {'RSS after':>14} {'peak RSS':>14}"]
+    for name, peak, traced, rss, max_rss in _memory_stages:
+        lines.append(f"{name:<32} {megabytes(peak):>14} {megabytes(traced):>14} {megabytes(rss):>14} {megabytes(max_rss):>14}")
+    report = "\n".join(lines)
+    print(report)
+    with open(os.path.join(_profile_run_dir, 'memory.txt'), 'w') as f:
+        f.write(report + "\n")
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+class StackSampler(threading.Thread):
+    """
+    Samples the call stacks of every thread at a fixed interval and counts them in the
+    collapsed format read by flamegraph.pl and speedscope: one "thread;outer;...;inner" line per stack.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        thread_names = {}
+        while not self.stopped.wait(self.interval):
+            for thread in threading.enumerate():
+                thread_names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(frame_label(frame))
+                    frame = frame.f_back
+                labels.append(thread_names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(labels))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+@contextmanager
+def stage(name):
+    """
+    Mark a stage of a pipeline. While CPU profiling is enabled, the stage is run under cProfile and
+    a stack sampler, and <n>_<name>.prof and <n>_<name>.collapsed are written for it. While memory
+    profiling is enabled, its traced allocation peak and RSS are recorded, and the allocation
+    sites still holding the most memory afterwards are written to <n>_<name>.memory.txt.
+    Stages do not nest: a stage inside another one is profiled as part of it.
+    """
+    if _profile_run_dir is None or getattr(_active, 'stage', None):
+        yield
+        return
+
+    prefix = os.path.join(_profile_run_dir, f"{next(_stage_counter):02d}_{name}")
+    _active.stage = name
+    started_at = time.perf_counter()
+    if _profile_memory:
+        tracemalloc.reset_peak()
+    if _profile_cpu:
+        profiler = cProfile.Profile()
+        sampler = StackSampler()
+        sampler.start()
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if _profile_cpu:
+            profiler.disable()
+            sampler.stop()
+            profiler.dump_stats(f"{prefix}.prof")
+            sampler.write(f"{prefix}.collapsed")
+        _active.stage = None
+        print(f"Stage {name} took {time.perf_counter() - started_at:.2f}s")
+        if _profile_memory:
+            traced, peak = tracemalloc.get_traced_memory()
+            _memory_stages.append((name, peak, traced, current_rss(), peak_rss()))
+            print(f"Stage {name} traced peak {megabytes(peak)}, {megabytes(traced)} still allocated, RSS {megabytes(current_rss())}")
+            with open(f"{prefix}.memory.txt", 'w') as f:
+                for statistic in tracemalloc.take_snapshot().statistics('lineno')[:TOP_ALLOCATIONS]:
+                    f.write(f"{statistic}\n")
@@ -0,0 +1,119 @@
+import os, threading, hashlib
+from datetime import datetime
+import numpy as np
+from replenishment_snapshots import load_replenishment_snapshot, find_snapshot
+
+# Columns with a value-to-rows index; other columns cannot be filtered on
+INDEXED_COLUMNS = ['sku', 'product_num', 'supplier', 'decoration_group']
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def snapshot_mtime(path):
+    """Modification time of a snapshot file, or None when there is no such file."""
+    try:
+        return os.path.getmtime(path) if path else None
+    except OSError:
+        return None
+
+class ReplenishmentIndex:
+    """
+    Read-only, JSON-ready copy of one replenishment frame.
+    Rows are converted to dicts once, and each indexed column maps its values to row positions,
+    so a query is a few dict lookups and an intersection of small position arrays.
+    """
+
+    def __init__(self, replenishment_df, source=None):
+        self.columns = list(replenishment_df.columns)
+        self.source = source
+        self.source_mtime = snapshot_mtime(source)
+        self.loaded_at = datetime.now().isoformat()
+
+        json_df = replenishment_df.astype(object)
+        self.records = json_df.where(replenishment_df.notna(), None).to_dict('records')
+        for record in self.records:
+            for column, value in record.items():
+                if isinstance(value, np.generic):
+                    record[column] = value.item()
+
+        self.indexes = {}
+        for column in INDEXED_COLUMNS:
+            if column in replenishment_df.columns:
+                values = replenishment_df[column].astype(str)
+                self.indexes[column] = {value: positions for value, positions in values.groupby(values, sort=False).indices.items()}
+
+        self.etag = hashlib.sha1(f"{source}|{self.source_mtime}|{self.loaded_at}|{len(self.records)}".encode()).hexdigest()
+
+    def is_current(self, path):
+        """Whether this index was built from the snapshot file at path as it is now on disk."""
+        return path == self.source and snapshot_mtime(path) == self.source_mtime
+
+    def positions(self, filters):
+        """Row positions matching every {column: [values]} filter, in frame order."""
+        positions = None
+        for column, values in filters.items():
+            index = self.indexes[column]
+            matched = [index[value] for value in values if value in index]
+            matched = np.unique(np.concatenate(matched)) if matched else np.array([], dtype=np.int64)
+            positions = matched if positions is None else np.intersect1d(positions, matched, assume_unique=True)
+        return np.arange(len(self.records)) if positions is None else positions
+
+    def query(self, filters=None, fields=None, offset=0, limit=None):
+        """
+        Return one page of rows matching filters, projected to fields (default: all columns).
+        Raises ValueError for columns that are not indexed or do not exist.
+        """
+        filters = filters or {}
+        offset = max(offset or 0, 0)
+        limit = min(max(limit or DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+        unknown = [column for column in filters if column not in self.indexes]
+        if unknown:
+            raise ValueError(f"Cannot filter on {', '.join(unknown)}; filterable columns are {', '.join(self.indexes)}")
+        unknown = [field for field in fields or [] if field not in self.columns]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+        positions = self.positions(filters)
+        page = positions[offset:offset + limit]
+        if fields:
+            rows = [{field: self.records[position][field] for field in fields} for position in page]
+        else:
+            rows = [self.records[position] for position in page]
+
+        return {
+            'total': len(positions),
+            'offset': offset,
+            'limit': limit,
+            'rows': rows,
+            'snapshot': {'source': self.source, 'loaded_at': self.loaded_at, 'rows': len(self.records)}
+        }
+
+# The index currently served; replaced as a whole so readers never see a partial snapshot
+_current_index = None
+_index_lock = threading.Lock()
+
+def publish_replenishment_snapshot(replenishment_df, source=None):
+    """Build an index of replenishment_df and swap it in for the queries that follow."""
+    global _current_index
+    index = ReplenishmentIndex(replenishment_df, source)
+    with _index_lock:
+        _current_index = index
+    print(f"Replenishment query index updated with {len(index.records)} rows")
+    return index
+
+def get_replenishment_index():
+    """
+    Return the served index, loaded from the latest snapshot on disk. Snapshots saved by other
+    processes (run.py, cron) replace the index once find_snapshot returns a newer file.
+    None without snapshots.
+    """
+    global _current_index
+    path = find_snapshot()
+    index = _current_index
+    if path is None or (index is not None and index.is_current(path)):
+        return index
+    with _index_lock:
+        if _current_index is None or not _current_index.is_current(path):
+            _current_index = ReplenishmentIndex(load_replenishment_snapshot(path=path), path)
+            print(f"Replenishment query index loaded from {path}")
+        return _current_index
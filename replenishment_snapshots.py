@@ -0,0 +1,166 @@
+import os, glob, json, sys
+from datetime import datetime, timedelta
+import pandas as pd
+from arrow_batches import pa, require_pyarrow
+
+SNAPSHOT_DIR = 'output/snapshots'
+SNAPSHOT_TIMESTAMP_FORMAT = "%Y-%m-%d_%H-%M-%S"
+SNAPSHOT_METADATA_KEY = b'replenishment_snapshot'
+
+# Snapshots older than this are deleted after each save of a run; override with
+# SNAPSHOT_RETENTION_DAYS in config.py (None keeps every snapshot)
+DEFAULT_SNAPSHOT_RETENTION_DAYS = 30
+
+# Snapshots are Parquet files when pyarrow is installed and pickles otherwise
+SNAPSHOT_EXTENSIONS = ('.parquet', '.pkl')
+
+def snapshot_path(label, created_at, snapshot_dir=SNAPSHOT_DIR):
+    extension = '.parquet' if pa is not None else '.pkl'
+    return os.path.join(snapshot_dir, f"{label}_{created_at.strftime(SNAPSHOT_TIMESTAMP_FORMAT)}{extension}")
+
+def snapshot_retention_days():
+    """Days snapshots are kept, from SNAPSHOT_RETENTION_DAYS in config.py; None keeps every snapshot."""
+    import config
+    days = getattr(config, 'SNAPSHOT_RETENTION_DAYS', DEFAULT_SNAPSHOT_RETENTION_DAYS)
+    if days is not None and (isinstance(days, bool) or not isinstance(days, (int, float)) or days <= 0):
+        raise ValueError(f"SNAPSHOT_RETENTION_DAYS in config.py must be a positive number of days or None, not {days!r}")
+    return days
+
+def save_replenishment_snapshot(replenishment_df, label='replenishment', snapshot_dir=SNAPSHOT_DIR, retention_days=None):
+    """
+    Save replenishment_df as a zstd-compressed Parquet snapshot, or as a pickle when pyarrow
+    is not installed. The snapshot metadata records when it was taken, its row count and
+    the pandas dtype of each column, so the exact frame can be reloaded later.
+    With retention_days, snapshots of the label older than that are deleted once it is saved.
+    """
+    created_at = datetime.now()
+    path = snapshot_path(label, created_at, snapshot_dir)
+    os.makedirs(snapshot_dir, exist_ok=True)
+
+    snapshot_metadata = {
+        'label': label,
+        'created_at': created_at.isoformat(),
+        'rows': len(replenishment_df),
+        'columns': {column: str(dtype) for column, dtype in replenishment_df.dtypes.items()}
+    }
+    # Written under a temporary name first, so the API never loads a half-written snapshot
+    temp_path = path + '.tmp'
+    if pa is None:
+        snapshot_df = replenishment_df.copy(deep=False)
+        snapshot_df.attrs[SNAPSHOT_METADATA_KEY.decode()] = snapshot_metadata
+        snapshot_df.to_pickle(temp_path, compression=None)
+    else:
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(replenishment_df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), SNAPSHOT_METADATA_KEY: json.dumps(snapshot_metadata).encode()})
+        pq.write_table(table, temp_path, compression='zstd')
+    os.replace(temp_path, path)
+
+    print(f"{label} snapshot saved to {path}")
+    if retention_days is not None:
+        prune_snapshots(created_at - timedelta(days=retention_days), label, snapshot_dir)
+    return path
+
+def prune_snapshots(before, label='replenishment', snapshot_dir=SNAPSHOT_DIR):
+    """Delete the snapshots taken before the given datetime, always keeping the latest one. Returns the deleted paths."""
+    snapshots = list_snapshots(label, snapshot_dir)
+    deleted = []
+    for created_at, path in snapshots[:-1]:
+        if created_at < before:
+            os.remove(path)
+            deleted.append(path)
+    if deleted:
+        print(f"Deleted {len(deleted)} {label} snapshots taken before {before:%Y-%m-%d %H:%M}")
+    return deleted
+
+def list_snapshots(label='replenishment', snapshot_dir=SNAPSHOT_DIR):
+    """Return (created_at, path) pairs of the saved snapshots, oldest first."""
+    snapshots = []
+    for extension in SNAPSHOT_EXTENSIONS:
+        for path in glob.glob(os.path.join(snapshot_dir, f"{label}_*{extension}")):
+            timestamp = os.path.basename(path)[len(label) + 1:-len(extension)]
+            try:
+                snapshots.append((datetime.strptime(timestamp, SNAPSHOT_TIMESTAMP_FORMAT), path))
+            except ValueError:
+                continue
+    return sorted(snapshots)
+
+def find_snapshot(as_of=None, label='replenishment', snapshot_dir=SNAPSHOT_DIR):
+    """Return the path of the latest snapshot taken at or before as_of (default: now), or None."""
+    as_of = as_of or datetime.now()
+    candidates = [path for created_at, path in list_snapshots(label, snapshot_dir) if created_at <= as_of]
+    return candidates[-1] if candidates else None
+
+def read_snapshot(path):
+    """Read a snapshot file written by save_replenishment_snapshot."""
+    if path.endswith('.pkl'):
+        return pd.read_pickle(path)
+    require_pyarrow()
+    return pd.read_parquet(path)
+
+def read_snapshot_metadata(path):
+    if path.endswith('.pkl'):
+        return pd.read_pickle(path).attrs.get(SNAPSHOT_METADATA_KEY.decode(), {})
+    require_pyarrow()
+    import pyarrow.parquet as pq
+    metadata = pq.read_schema(path).metadata or {}
+    return json.loads(metadata.get(SNAPSHOT_METADATA_KEY, b'{}'))
+
+def load_replenishment_snapshot(as_of=None, label='replenishment', snapshot_dir=SNAPSHOT_DIR, path=None):
+    """
+    Load the latest snapshot, or the latest one taken at or before as_of.
+    Returns None when no snapshot matches.
+    """
+    path = path or find_snapshot(as_of, label, snapshot_dir)
+    if not path:
+        print(f"No {label} snapshot found")
+        return None
+    print(f"Loading {label} snapshot from {path}")
+    return read_snapshot(path)
+
+def diff_snapshots(old_df, new_df, key='sku'):
+    """
+    Compare two snapshots column by column, matching rows on key.
+    Returns a DataFrame with one row per changed value (key, column, old, new);
+    added and removed rows are reported with column '<added>' / '<removed>'.
+    """
+    old_df = old_df.drop_duplicates(subset=key).set_index(key)
+    new_df = new_df.drop_duplicates(subset=key).set_index(key)
+
+    changes = []
+    added = new_df.index.difference(old_df.index)
+    removed = old_df.index.difference(new_df.index)
+    changes.append(pd.DataFrame({key: added, 'column': '<added>', 'old': None, 'new': None}))
+    changes.append(pd.DataFrame({key: removed, 'column': '<removed>', 'old': None, 'new': None}))
+
+    common = old_df.index.intersection(new_df.index)
+    for column in old_df.columns.union(new_df.columns, sort=False):
+        old_values = old_df[column].reindex(common).astype(object) if column in old_df.columns else pd.Series(None, index=common, dtype=object)
+        new_values = new_df[column].reindex(common).astype(object) if column in new_df.columns else pd.Series(None, index=common, dtype=object)
+        changed = ~((old_values == new_values) | (old_values.isna() & new_values.isna()))
+        if changed.any():
+            changes.append(pd.DataFrame({
+                key: common[changed.to_numpy()],
+                'column': column,
+                'old': old_values[changed].to_numpy(),
+                'new': new_values[changed].to_numpy()
+            }))
+
+    return pd.concat(changes, ignore_index=True)
+
+# Compare two snapshots from the command line:
+#   python replenishment_snapshots.py [OLD_PATH NEW_PATH]
+# Without paths, the two most recent snapshots are compared.
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        old_path, new_path = sys.argv[1], sys.argv[2]
+    else:
+        snapshots = list_snapshots()
+        if len(snapshots) < 2:
+            sys.exit("At least two snapshots are needed for a diff")
+        old_path, new_path = snapshots[-2][1], snapshots[-1][1]
+
+    differences = diff_snapshots(read_snapshot(old_path), read_snapshot(new_path))
+    differences = differences[differences['column'] != 'updated_at']
+    print(f"Differences between {old_path} and {new_path}:")
+    print(differences.to_string(index=False))
@@ -0,0 +1,97 @@
+# Run the pipelines without the web server, e.g. from cron:
+#   python run.py prepare_replenishment --use-warm-cache
+#   python run.py --profile prepare_replenishment --use-cache-sales
+#   python run.py --profile-memory prepare_replenishment
+#   python run.py sync --full-sweep
+#   python run.py sales_history --backfill-weeks 104
+import argparse, importlib, sys, time
+from profiling import enable_profiling, memory_report, stage, PROFILE_DIR
+
+def comma_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+def load_job(module_name, function_name):
+    return getattr(importlib.import_module(module_name), function_name)
+
+def run_prepare_replenishment(args):
+    if args.supplier or args.product_nums or args.skus:
+        # Scoped refreshes fetch and patch only the selected SKUs
+        with stage('prepare_replenishment_scoped'):
+            load_job('scoped_replenishment', 'prepare_replenishment_scoped')(args.supplier, args.product_nums, args.skus)
+        return
+    load_job('prepare_replenishment', 'prepare_replenishment')(
+        use_cache_stock_levels=args.use_cache or args.use_cache_stock_levels,
+        use_cache_sales=args.use_cache or args.use_cache_sales,
+        use_arrow=args.use_arrow,
+        incremental=args.incremental,
+        use_warm_cache=args.use_warm_cache
+    )
+
+def run_populate_production(args):
+    with stage('populate_production'):
+        load_job('populate_production', 'populate_production')()
+
+def run_push_pos_to_shiphero(args):
+    with stage('push_pos_to_shiphero'):
+        load_job('sync_shiphero', 'push_pos_to_shiphero')()
+
+def run_sync(args):
+    with stage('sync_shiphero_purchase_orders_to_airtable'):
+        load_job('sync_shiphero', 'sync_shiphero_purchase_orders_to_airtable')(args.created_from, args.full_sweep)
+
+def run_packing_slips(args):
+    with stage('packing_slips'):
+        load_job('packing_slips', 'packing_slips')()
+
+def run_sales_history(args):
+    with stage('backfill_sales_history'):
+        load_job('sales_history', 'backfill_sales_history')(args.backfill_weeks)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run a pipeline without the web server.")
+    parser.add_argument('--profile', action='store_true', help="write cProfile stats and collapsed stacks for each stage")
+    parser.add_argument('--profile-memory', action='store_true', help="record the traced allocation peak and RSS of each stage, and the objects still alive after it")
+    parser.add_argument('--profile-dir', default=PROFILE_DIR, help=f"directory for profile output (default: {PROFILE_DIR})")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    prepare = commands.add_parser('prepare_replenishment', help="fetch, merge and export the replenishment data")
+    prepare.add_argument('--use-cache', action='store_true', help="use cached stock levels and sales data")
+    prepare.add_argument('--use-cache-stock-levels', action='store_true', help="use cached ShipHero stock levels")
+    prepare.add_argument('--use-cache-sales', action='store_true', help="use cached Shopify sales data")
+    prepare.add_argument('--use-arrow', action='store_true', help="hand off ShipHero stock and Airtable variants as Arrow record batches")
+    prepare.add_argument('--use-warm-cache', action='store_true', help="read every source from the warm cache under cache/warm; sources never cached are fetched first and stale ones are revalidated in the background only while this command runs, so keep the web server running to keep the cache warm")
+    prepare.add_argument('--incremental', action='store_true', help="only re-derive stock columns when sales and metadata are unchanged")
+    prepare.add_argument('--supplier', help="refresh only the SKUs of this supplier")
+    prepare.add_argument('--product-nums', type=comma_list, help="refresh only the SKUs of these comma-separated product numbers")
+    prepare.add_argument('--skus', type=comma_list, help="refresh only these comma-separated SKUs")
+    prepare.set_defaults(run=run_prepare_replenishment)
+
+    commands.add_parser('populate_production', help="create purchase orders from the Replenishment worksheet").set_defaults(run=run_populate_production)
+    commands.add_parser('push_pos_to_shiphero', help="push queued purchase orders to ShipHero").set_defaults(run=run_push_pos_to_shiphero)
+
+    sync = commands.add_parser('sync', help="sync purchase orders from ShipHero to Airtable")
+    sync.add_argument('--created-from', help="only purchase orders created from this date (YYYY-MM-DD); forces a full sweep")
+    sync.add_argument('--full-sweep', action='store_true', help="sweep from the oldest open purchase order instead of the watermark")
+    sync.set_defaults(run=run_sync)
+
+    history = commands.add_parser('sales_history', help="backfill the on-disk sales history from Shopify")
+    history.add_argument('--backfill-weeks', type=int, default=104, help="weeks of orders to fetch and ingest (default: 104)")
+    history.set_defaults(run=run_sales_history)
+
+    commands.add_parser('packing_slips', help="generate packing slips for the selected purchase orders").set_defaults(run=run_packing_slips)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.profile or args.profile_memory:
+        enable_profiling(args.profile_dir, cpu=args.profile, memory=args.profile_memory)
+
+    started_at = time.perf_counter()
+    args.run(args)
+    print(f"{args.command} finished in {time.perf_counter() - started_at:.1f}s")
+    if args.profile_memory:
+        memory_report()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import os, json
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from sku_dictionary import SkuDictionary
+
+SALES_CUBE_FILE = 'cache/sales_cube.npy'
+SALES_CUBE_INDEX_FILE = 'cache/sales_cube_index.json'
+
+# Capacity is allocated in blocks so appending days or SKUs rarely reallocates the file
+DAY_BLOCK = 64
+SKU_BLOCK = 1024
+
+def most_recent_sunday(today=None):
+    """Return the end date of the most recent sales week (today when today is Sunday)."""
+    today = today or datetime.now().date()
+    if today.weekday() == 6:
+        return today
+    return today - timedelta(days=today.weekday() + 1)
+
+def round_up(value, block):
+    return max(block, -(-value // block) * block)
+
+class SalesCube:
+    """
+    Dense day-by-SKU quantity cube stored on disk as a memory-mapped NumPy array.
+    Row i holds the units sold on start_date + i days, column j the SKU at position j
+    of the sidecar SKU index. Days without sales are zero.
+    """
+
+    def __init__(self, path=SALES_CUBE_FILE, index_path=SALES_CUBE_INDEX_FILE):
+        self.path = path
+        self.index_path = index_path
+        self.start_date = None
+        self.num_days = 0
+        self.skus = SkuDictionary()
+        self.data = None
+        self.fetched_at = None
+
+        if os.path.exists(self.index_path) and os.path.exists(self.path):
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            self.start_date = datetime.strptime(index['start_date'], "%Y-%m-%d").date()
+            self.num_days = index['num_days']
+            self.fetched_at = datetime.fromisoformat(index['fetched_at']) if index.get('fetched_at') else None
+            self.skus = SkuDictionary(index['skus'])
+            self.data = np.load(self.path, mmap_mode='r+')
+
+    @property
+    def end_date(self):
+        if self.start_date is None or self.num_days == 0:
+            return None
+        return self.start_date + timedelta(days=self.num_days - 1)
+
+    def save_index(self):
+        index = {
+            'start_date': self.start_date.strftime("%Y-%m-%d"),
+            'num_days': self.num_days,
+            'fetched_at': self.fetched_at.isoformat() if self.fetched_at else None,
+            'skus': self.skus.skus
+        }
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def reallocate(self, start_date, num_days, num_skus):
+        """Grow the memory-mapped array so it covers start_date and num_days days of num_skus SKUs."""
+        shift = (self.start_date - start_date).days if self.start_date else 0
+        capacity_days = self.data.shape[0] if self.data is not None else 0
+        capacity_skus = self.data.shape[1] if self.data is not None else 0
+        if shift == 0 and num_days <= capacity_days and num_skus <= capacity_skus:
+            return
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        shape = (round_up(max(num_days, capacity_days + shift), DAY_BLOCK), round_up(max(num_skus, capacity_skus), SKU_BLOCK))
+        tmp_path = f"{self.path}.tmp.npy"
+        data = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.int32, shape=shape)
+        data[:] = 0
+        if self.data is not None:
+            data[shift:shift + self.num_days, :capacity_skus] = self.data[:self.num_days]
+        data.flush()
+        del data
+        self.data = None
+        os.replace(tmp_path, self.path)
+        self.data = np.load(self.path, mmap_mode='r+')
+        self.start_date = start_date
+        self.num_days += shift
+
+    def update(self, dates, skus, quantities, window_start=None, window_end=None, scope=None, fetched_at=None):
+        """
+        Replace the sales of every day between window_start and window_end with the given line items.
+        dates are datetime.date values, skus the line item SKUs and quantities the units sold.
+        The window defaults to the first and last date in dates.
+        With scope, a list of SKUs, only the sales of those SKUs are replaced; line items
+        of other SKUs are ignored and the rest of the cube is left as it is.
+        fetched_at is when the line items were fetched. Line items fetched before the data already
+        in the cube (e.g. from a cache) only replace the days before the day they were fetched,
+        so they never wipe the newer days.
+        """
+        if len(dates) == 0 and window_start is None:
+            return
+
+        window_start = window_start or min(dates)
+        window_end = window_end or (max(dates) if len(dates) else window_start)
+        if fetched_at is not None and self.fetched_at is not None and fetched_at < self.fetched_at:
+            window_end = min(window_end, fetched_at.date() - timedelta(days=1))
+            print(f"Sales fetched at {fetched_at:%Y-%m-%d %H:%M} are older than the sales cube, keeping its days from {fetched_at:%Y-%m-%d}")
+        if window_end < window_start:
+            return
+        codes = self.skus.encode(list(skus))
+        scope_codes = self.skus.encode(list(scope)) if scope is not None else None
+
+        start_date = min(self.start_date, window_start) if self.start_date else window_start
+        num_days = max(self.num_days + ((self.start_date - start_date).days if self.start_date else 0), (window_end - start_date).days + 1)
+        self.reallocate(start_date, num_days, len(self.skus))
+        self.num_days = num_days
+
+        first_day = (window_start - self.start_date).days
+        last_day = (window_end - self.start_date).days
+        day_index = np.fromiter(((date - self.start_date).days for date in dates), dtype=np.int64, count=len(dates))
+        in_window = (day_index >= first_day) & (day_index <= last_day)
+
+        if scope_codes is None:
+            self.data[first_day:last_day + 1] = 0
+        else:
+            in_window &= np.isin(codes, scope_codes)
+            self.data[first_day:last_day + 1, scope_codes] = 0
+        np.add.at(self.data, (day_index[in_window], codes[in_window]), np.asarray(quantities, dtype=np.int32)[in_window])
+        self.data.flush()
+        if fetched_at is not None and (self.fetched_at is None or fetched_at > self.fetched_at):
+            self.fetched_at = fetched_at
+        self.save_index()
+
+    def window(self, end_date, days):
+        """Return a days-by-SKU array of daily sales ending on end_date (inclusive)."""
+        result = np.zeros((days, len(self.skus)), dtype=np.int32)
+        if self.data is None:
+            return result
+        first_day = (end_date - self.start_date).days - days + 1
+        source_start = max(first_day, 0)
+        source_end = min(first_day + days, self.num_days)
+        if source_end > source_start:
+            result[source_start - first_day:source_end - first_day] = self.data[source_start:source_end, :len(self.skus)]
+        return result
+
+    def daily_sales(self, days, end_date=None):
+        """Return a DataFrame with one row per SKU that sold in the window and one column per day."""
+        end_date = end_date or most_recent_sunday()
+        sales = self.window(end_date, days)
+        labels = [f"sales_{(end_date - timedelta(days=i)).strftime('%Y%m%d')}" for i in range(days - 1, -1, -1)]
+        return self.to_frame(sales.T, labels)
+
+    def weekly_sales(self, weeks=8, end_date=None):
+        """
+        Return a DataFrame with one row per SKU that sold in the window and one
+        sales_N_weeks_ago_MonDD column per complete week, most recent week first.
+        """
+        end_date = end_date or most_recent_sunday()
+        sales = self.window(end_date, weeks * 7).reshape(weeks, 7, -1).sum(axis=1)
+        labels = []
+        for weeks_ago in range(weeks, 0, -1):
+            week_start = end_date - timedelta(days=(weeks_ago - 1) * 7 + 6)
+            labels.append(f"sales_{weeks_ago}_weeks_ago_{week_start.strftime('%b%d')}")
+        sales_df = self.to_frame(sales.T, labels)
+        return sales_df[['sku'] + labels[::-1]]
+
+    def to_frame(self, sales, labels):
+        sold = sales.any(axis=1)
+        sales_df = pd.DataFrame(sales[sold], columns=labels)
+        sales_df.insert(0, 'sku', np.asarray(self.skus.skus, dtype=object)[sold])
+        return sales_df
@@ -0,0 +1,218 @@
+import os, json, sqlite3, threading
+import pandas as pd
+from datetime import datetime, timedelta
+from bulk_jsonl import gid_type
+from sales_cube import most_recent_sunday
+from sku_dictionary import normalize_sku
+
+SALES_HISTORY_FILE = 'cache/sales_history.db'
+
+# Line items written to the store per executemany call
+INGEST_BATCH_SIZE = 10000
+
+# Complete calendar months returned as sales_month_YYYY_MM columns
+HISTORY_MONTHS = 12
+
+# Weeks of last year's sales compared with the weekly sales columns
+COMPARISON_WEEKS = 8
+
+# Weeks fetched per bulk operation when backfilling the history
+BACKFILL_SLICE_WEEKS = 13
+
+def line_item_rows(rows):
+    """
+    Yield (line_item_id, order_date, sku, quantity) for the line items of Shopify bulk sales output,
+    streaming over the rows. SKUs are normalized, so the aggregates have one row per SKU as it is
+    joined on. Line items without a SKU or whose order was not emitted are skipped.
+    """
+    order_dates = {}
+    for row in rows:
+        if isinstance(row, str):
+            row = json.loads(row)
+        resource_type = gid_type(row.get("id"))
+        if resource_type == 'Order':
+            order_dates[row["id"]] = row['createdAt'][:10]
+        elif resource_type == 'LineItem':
+            order_date = order_dates.get(row.get("__parentId"))
+            sku = normalize_sku(row.get('sku'))
+            if order_date is not None and sku:
+                yield row["id"], order_date, sku, row['quantity']
+
+class SalesHistory:
+    """
+    On-disk store of every Shopify line item ingested, in SQLite, for aggregates over a longer
+    history than the sales cube keeps in memory. Aggregates are computed in SQL, so only
+    their per-SKU results are loaded into pandas.
+    """
+
+    def __init__(self, path=SALES_HISTORY_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS line_items (
+                    line_item_id TEXT PRIMARY KEY,
+                    order_date TEXT NOT NULL,
+                    sku TEXT NOT NULL,
+                    quantity INTEGER NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS line_items_order_date ON line_items (order_date, sku)")
+            connection.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT)")
+            if connection.execute("PRAGMA user_version").fetchone()[0] < 1:
+                # Stores created before SKUs were normalized at ingest
+                connection.execute("UPDATE line_items SET sku = trim(sku) WHERE sku != trim(sku)")
+                connection.execute("PRAGMA user_version = 1")
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def ingest(self, rows, window_start=None, window_end=None, scope=None):
+        """
+        Replace the line items ordered between window_start and window_end with those of the bulk
+        sales output rows, in one transaction; line items of orders cancelled or excluded since an
+        earlier ingest are dropped with them. The window defaults to the one the fetch recorded on
+        rows (see BulkOutput), else to the first and last order date of the ingested line items.
+        Rows fetched before the data already in the store (e.g. from a cache) only replace the days
+        before the day they were fetched, so they never wipe the newer days.
+        With scope, a list of SKUs, only the line items of those SKUs are replaced.
+        Returns the number of line items ingested; rows of None (a failed fetch) ingest nothing.
+        """
+        if rows is None:
+            print("No sales data to ingest into the sales history")
+            return 0
+        window_start = window_start or getattr(rows, 'window_start', None)
+        window_end = window_end or getattr(rows, 'window_end', None)
+        fetched_at = getattr(rows, 'fetched_at', None)
+
+        with self.lock, self.connect() as connection:
+            connection.execute("CREATE TEMP TABLE IF NOT EXISTS ingest_line_items AS SELECT * FROM line_items WHERE 0")
+            connection.execute("DELETE FROM ingest_line_items")
+            batch = []
+            for line_item in line_item_rows(rows):
+                batch.append(line_item)
+                if len(batch) >= INGEST_BATCH_SIZE:
+                    connection.executemany("INSERT INTO ingest_line_items VALUES (?, ?, ?, ?)", batch)
+                    batch = []
+            connection.executemany("INSERT INTO ingest_line_items VALUES (?, ?, ?, ?)", batch)
+
+            first_order_date, last_order_date = connection.execute("SELECT MIN(order_date), MAX(order_date) FROM ingest_line_items").fetchone()
+            first_date = window_start.strftime("%Y-%m-%d") if window_start else first_order_date
+            last_date = window_end.strftime("%Y-%m-%d") if window_end else last_order_date
+            stored_fetched_at = connection.execute("SELECT value FROM metadata WHERE key = 'fetched_at'").fetchone()
+            stored_fetched_at = datetime.fromisoformat(stored_fetched_at[0]) if stored_fetched_at else None
+            if fetched_at is not None and stored_fetched_at is not None and fetched_at < stored_fetched_at and last_date is not None:
+                last_date = min(last_date, (fetched_at.date() - timedelta(days=1)).strftime("%Y-%m-%d"))
+                print(f"Sales fetched at {fetched_at:%Y-%m-%d %H:%M} are older than the sales history, keeping its days from {fetched_at:%Y-%m-%d}")
+
+            if first_date is None or last_date is None or last_date < first_date:
+                connection.execute("DELETE FROM ingest_line_items")
+            else:
+                # Line items outside the window would overwrite newer data or were not replaced
+                connection.execute("DELETE FROM ingest_line_items WHERE order_date NOT BETWEEN ? AND ?", (first_date, last_date))
+                if scope is None:
+                    connection.execute("DELETE FROM line_items WHERE order_date BETWEEN ? AND ?", (first_date, last_date))
+                else:
+                    connection.execute("CREATE TEMP TABLE IF NOT EXISTS ingest_scope (sku TEXT PRIMARY KEY)")
+                    connection.execute("DELETE FROM ingest_scope")
+                    connection.executemany("INSERT OR IGNORE INTO ingest_scope VALUES (?)", [(normalize_sku(sku),) for sku in scope])
+                    connection.execute("DELETE FROM line_items WHERE order_date BETWEEN ? AND ? AND sku IN (SELECT sku FROM ingest_scope)", (first_date, last_date))
+                    connection.execute("DELETE FROM ingest_line_items WHERE sku NOT IN (SELECT sku FROM ingest_scope)")
+            ingested = connection.execute("SELECT COUNT(*) FROM ingest_line_items").fetchone()[0]
+            connection.execute("INSERT OR REPLACE INTO line_items SELECT * FROM ingest_line_items")
+            connection.execute("DELETE FROM ingest_line_items")
+            if fetched_at is not None and (stored_fetched_at is None or fetched_at > stored_fetched_at):
+                connection.execute("INSERT OR REPLACE INTO metadata VALUES ('fetched_at', ?)", (fetched_at.isoformat(),))
+        print(f"Ingested {ingested} line items into the sales history")
+        return ingested
+
+    def date_range(self):
+        """First and last order date in the store, as YYYY-MM-DD strings (None when empty)."""
+        with self.lock, self.connect() as connection:
+            return connection.execute("SELECT MIN(order_date), MAX(order_date) FROM line_items").fetchone()
+
+    def query(self, sql, params=()):
+        with self.lock, self.connect() as connection:
+            return pd.read_sql_query(sql, connection, params=params)
+
+    def monthly_sales(self, months=HISTORY_MONTHS, end_date=None):
+        """
+        Return a DataFrame with one row per SKU that sold in the window and one sales_month_YYYY_MM
+        column per complete calendar month before end_date (default: today), most recent first.
+        """
+        end_date = end_date or datetime.now().date()
+        month_starts = [end_date.replace(day=1)]
+        for _ in range(months):
+            month_starts.append((month_starts[-1] - timedelta(days=1)).replace(day=1))
+        labels = [f"sales_month_{month_start.strftime('%Y_%m')}" for month_start in month_starts[1:]]
+
+        monthly_df = self.query("""
+            SELECT sku, 'sales_month_' || replace(substr(order_date, 1, 7), '-', '_') AS month, SUM(quantity) AS quantity
+            FROM line_items
+            WHERE order_date >= ? AND order_date < ?
+            GROUP BY sku, month
+        """, (month_starts[-1].strftime("%Y-%m-%d"), month_starts[0].strftime("%Y-%m-%d")))
+        monthly_df = monthly_df.pivot(index='sku', columns='month', values='quantity')
+        return monthly_df.reindex(columns=labels).fillna(0).astype('int32').reset_index()
+
+    def year_over_year_sales(self, weeks=COMPARISON_WEEKS, end_date=None):
+        """
+        Return a DataFrame with one row per SKU that sold in the past year or in last year's window:
+          sales_last_52_weeks          - units sold in the 52 complete weeks ending on end_date
+          sales_<weeks>_weeks_last_year  - units sold in the same weeks 52 weeks earlier
+          sales_next_<weeks>_weeks_last_year - units sold in the weeks that followed them last year
+        end_date defaults to the end of the most recent complete sales week.
+        """
+        end_date = end_date or most_recent_sunday()
+        year_ago = end_date - timedelta(weeks=52)
+        windows = {
+            'sales_last_52_weeks': (year_ago + timedelta(days=1), end_date),
+            f"sales_{weeks}_weeks_last_year": (year_ago - timedelta(weeks=weeks) + timedelta(days=1), year_ago),
+            f"sales_next_{weeks}_weeks_last_year": (year_ago + timedelta(days=1), year_ago + timedelta(weeks=weeks))
+        }
+        window_sums = ",\n".join(f"SUM(CASE WHEN order_date BETWEEN ? AND ? THEN quantity ELSE 0 END) AS {column}" for column in windows)
+        params = [date.strftime("%Y-%m-%d") for window in windows.values() for date in window]
+        first_date = min(start for start, _ in windows.values()).strftime("%Y-%m-%d")
+
+        year_over_year_df = self.query(f"""
+            SELECT sku, {window_sums}
+            FROM line_items
+            WHERE order_date BETWEEN ? AND ?
+            GROUP BY sku
+        """, params + [first_date, end_date.strftime("%Y-%m-%d")])
+        return year_over_year_df.astype({column: 'int32' for column in windows})
+
+    def history_sales(self, months=HISTORY_MONTHS, weeks=COMPARISON_WEEKS, end_date=None):
+        """Year-over-year and monthly sales per SKU, merged into one DataFrame for prepare_merged_replenishment_df."""
+        history_sales_df = self.year_over_year_sales(weeks=weeks, end_date=end_date)
+        history_sales_df = history_sales_df.merge(self.monthly_sales(months=months, end_date=end_date), on='sku', how='outer')
+        sales_columns = [column for column in history_sales_df.columns if column != 'sku']
+        history_sales_df[sales_columns] = history_sales_df[sales_columns].fillna(0).astype('int32')
+        return history_sales_df
+
+def backfill_sales_history(weeks=104, until=None, sales_history=None):
+    """
+    Fetch and ingest `weeks` weeks of Shopify sales up to the date until (default: today), one bulk
+    operation of BACKFILL_SLICE_WEEKS weeks at a time so only one slice is held in memory.
+    """
+    from fetch_data import fetch_shopify_sales_data
+
+    sales_history = sales_history or SalesHistory()
+    slice_end = datetime.combine(until or datetime.now().date() + timedelta(days=1), datetime.min.time())
+    remaining = weeks
+    while remaining > 0:
+        slice_weeks = min(BACKFILL_SLICE_WEEKS, remaining)
+        slice_start = slice_end - timedelta(weeks=slice_weeks)
+        print(f"Backfilling sales from {slice_start:%Y-%m-%d} to {slice_end:%Y-%m-%d}")
+        sales_data = fetch_shopify_sales_data(weeks=slice_weeks, until=slice_end)
+        if sales_data is None:
+            print(f"Stopping the backfill; resume it with until={slice_end:%Y-%m-%d} and the remaining {remaining} weeks")
+            return
+        sales_history.ingest(sales_data, window_start=slice_start.date(), window_end=(slice_end - timedelta(days=1)).date())
+        del sales_data
+        slice_end = slice_start
+        remaining -= slice_weeks
+
+if __name__ == "__main__":
+    backfill_sales_history()
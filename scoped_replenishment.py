@@ -0,0 +1,72 @@
+# scoped_replenishment.py
+import itertools
+from datetime import datetime, timedelta
+from fetch_data import chunked, airtable_in_formula, fetch_airtable_product_metadata, fetch_shiphero_stock_levels_for_skus, fetch_airtable_incoming_stock, fetch_shopify_inventory_data, fetch_shopify_sales_data
+from transform_data import transform_stock_levels, transform_sales_data, transform_product_metadata
+from prepare_merged_replenishment_df import prepare_merged_replenishment_df
+from export_sheets_replenishment import patch_sheets_replenishment
+from stock_history import in_stock_days
+from sales_history import SalesHistory
+from sku_dictionary import normalize_sku
+
+# Weeks of Shopify orders refetched for the scoped SKUs, as in a full run
+SCOPED_SALES_WEEKS = 9
+
+def scope_formulas(supplier=None, product_nums=None, skus=None):
+    """
+    Airtable formulas selecting the variants of a supplier, a set of product numbers or a list of SKUs,
+    each matching at most FILTER_CHUNK_SIZE product numbers and SKUs. Together they select the scope.
+    """
+    conditions = []
+    if supplier:
+        conditions.append([airtable_in_formula('Supplier (Plain Text)', [supplier])])
+    if product_nums:
+        conditions.append([airtable_in_formula('Product Number', chunk) for chunk in chunked(product_nums)])
+    if skus:
+        conditions.append([airtable_in_formula('SKU', chunk) for chunk in chunked(skus)])
+    if not conditions:
+        raise ValueError("A supplier, product numbers or SKUs are required for a scoped refresh")
+    return [chunk_conditions[0] if len(chunk_conditions) == 1 else f"AND({', '.join(chunk_conditions)})" for chunk_conditions in itertools.product(*conditions)]
+
+def prepare_replenishment_scoped(supplier=None, product_nums=None, skus=None):
+    """
+    Recompute the replenishment rows of one supplier, a set of product numbers or a list of SKUs
+    and patch only those rows of the replenishment sheet.
+    The scope is resolved to SKUs from the Airtable variants first; stock, incoming stock, committed
+    stock and sales are then fetched for those SKUs only. The stock history, the full-run caches and
+    the replenishment snapshots are left untouched.
+    """
+
+    product_metadata = []
+    for formula in scope_formulas(supplier, product_nums, skus):
+        formula_metadata = fetch_airtable_product_metadata(formula=formula)
+        if formula_metadata is None:
+            print("Failed to fetch the scoped variants from Airtable")
+            return []
+        product_metadata.extend(formula_metadata)
+    product_metadata_df = transform_product_metadata(product_metadata)
+    if product_metadata_df is None:
+        print("No variants match the scope, nothing to refresh")
+        return []
+
+    scoped_skus = sorted(set(product_metadata_df['SKU'].map(normalize_sku)) - {''})
+    print(f"Refreshing replenishment for {len(scoped_skus)} SKUs")
+
+    stock_levels_data = fetch_shiphero_stock_levels_for_skus(scoped_skus)
+    incoming_stock_data = fetch_airtable_incoming_stock(skus=scoped_skus)
+    committed_stock_data = fetch_shopify_inventory_data(skus=scoped_skus)
+    sales_data = fetch_shopify_sales_data(weeks=SCOPED_SALES_WEEKS, skus=scoped_skus)
+
+    stock_levels_df = transform_stock_levels(stock_levels_data, incoming_stock_data, committed_stock_data)
+    sales_window_start = (datetime.now() - timedelta(weeks=SCOPED_SALES_WEEKS)).date()
+    sales_df = transform_sales_data(sales_data, skus=scoped_skus, window_start=sales_window_start)
+    sales_history = SalesHistory()
+    sales_history.ingest(sales_data, window_start=sales_window_start, scope=scoped_skus)
+    history_sales_df = sales_history.history_sales()
+    history_sales_df = history_sales_df[history_sales_df['sku'].isin(scoped_skus)]
+
+    in_stock_days_df = in_stock_days()
+    in_stock_days_df = in_stock_days_df[in_stock_days_df['sku'].isin(scoped_skus)]
+
+    replenishment_df = prepare_merged_replenishment_df(stock_levels_df, sales_df, product_metadata_df, in_stock_days_df, history_sales_df)
+    return patch_sheets_replenishment(replenishment_df)
@@ -0,0 +1,143 @@
+import functools, heapq, itertools, threading, time
+from contextlib import contextmanager
+
+# Request priorities: lower runs first
+PRIORITY_INTERACTIVE = 0  # e.g. pushing POs to ShipHero
+PRIORITY_NORMAL = 1       # e.g. stock level fetches for a replenishment run
+PRIORITY_BACKGROUND = 2   # e.g. PO syncs
+
+# ShipHero credit bucket defaults, corrected from each response's user_quota
+DEFAULT_MAX_CREDITS = 4004
+DEFAULT_INCREMENT_RATE = 60  # credits per second
+DEFAULT_REQUEST_COST = 101
+MAX_CONCURRENT_REQUESTS = 4
+
+_priority = threading.local()
+
+@contextmanager
+def shiphero_priority(priority):
+    """Run the ShipHero requests made by the current thread inside the block at the given priority."""
+    previous = getattr(_priority, 'value', PRIORITY_NORMAL)
+    _priority.value = priority
+    try:
+        yield
+    finally:
+        _priority.value = previous
+
+def runs_at_shiphero_priority(priority):
+    """Decorator running every ShipHero request made by the decorated job at the given priority."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with shiphero_priority(priority):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def current_priority():
+    return getattr(_priority, 'value', PRIORITY_NORMAL)
+
+class ShipheroCreditScheduler:
+    """
+    Process-wide scheduler for ShipHero API calls.
+    Models the account's credit bucket (credits refill at increment_rate per second up to
+    max_credits) and grants requests in priority order once the bucket holds their expected cost.
+    The expected cost of a query is the cost ShipHero last reported for it.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.queue = []
+        self.counter = itertools.count()
+        self.max_credits = DEFAULT_MAX_CREDITS
+        self.increment_rate = DEFAULT_INCREMENT_RATE
+        self.credits = DEFAULT_MAX_CREDITS
+        self.updated_at = time.monotonic()
+        self.paused_until = 0
+        self.in_flight = 0
+        self.reserved = 0
+        self.costs = {}
+
+    def refill(self):
+        now = time.monotonic()
+        self.credits = min(self.max_credits, self.credits + (now - self.updated_at) * self.increment_rate)
+        self.updated_at = now
+
+    def expected_cost(self, query):
+        return self.costs.get(query, DEFAULT_REQUEST_COST)
+
+    def acquire(self, query, priority=None):
+        """Block until the request may be sent, then reserve its expected cost."""
+        priority = current_priority() if priority is None else priority
+        cost = self.expected_cost(query)
+        with self.condition:
+            ticket = (priority, next(self.counter))
+            heapq.heappush(self.queue, ticket)
+            try:
+                while True:
+                    self.refill()
+                    wait_time = 0.5
+                    if self.queue[0] == ticket and self.in_flight < MAX_CONCURRENT_REQUESTS:
+                        now = time.monotonic()
+                        if now < self.paused_until:
+                            wait_time = self.paused_until - now
+                        elif self.credits >= min(cost, self.max_credits):
+                            self.credits -= cost
+                            self.in_flight += 1
+                            self.reserved += cost
+                            return cost
+                        else:
+                            wait_time = (min(cost, self.max_credits) - self.credits) / self.increment_rate
+                    self.condition.wait(timeout=max(wait_time, 0.01))
+            finally:
+                self.remove(ticket)
+                self.condition.notify_all()
+
+    def remove(self, ticket):
+        if self.queue and self.queue[0] == ticket:
+            heapq.heappop(self.queue)
+        elif ticket in self.queue:
+            self.queue.remove(ticket)
+            heapq.heapify(self.queue)
+
+    def release(self, query, reserved_cost, result=None, throttled_for=None):
+        """
+        Feed a response back into the credit model: the actual cost and remaining credits from
+        extensions.throttling, or a pause when ShipHero throttled the request.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            self.reserved -= reserved_cost
+            self.refill()
+            throttling = ((result or {}).get('extensions') or {}).get('throttling') or {}
+            quota = throttling.get('user_quota') or {}
+            if throttling.get('cost') is not None:
+                self.costs[query] = throttling['cost']
+            if quota.get('max_available'):
+                self.max_credits = quota['max_available']
+            if quota.get('increment_rate'):
+                self.increment_rate = quota['increment_rate']
+            if quota.get('credits_remaining') is not None:
+                # Requests still in flight have not been charged in the reported balance yet
+                self.credits = quota['credits_remaining'] - self.reserved
+            elif throttling.get('cost') is not None:
+                self.credits += reserved_cost - throttling['cost']
+            if throttled_for:
+                self.credits = 0
+                self.paused_until = max(self.paused_until, time.monotonic() + throttled_for)
+            self.condition.notify_all()
+
+    @contextmanager
+    def request(self, query, priority=None):
+        """
+        Reserve credits for one request. The block receives a dict; set its 'result' to the
+        response JSON and 'throttled_for' to the seconds ShipHero asked to wait, if any.
+        """
+        reserved_cost = self.acquire(query, priority)
+        outcome = {}
+        try:
+            yield outcome
+        finally:
+            self.release(query, reserved_cost, outcome.get('result'), outcome.get('throttled_for'))
+
+scheduler = ShipheroCreditScheduler()
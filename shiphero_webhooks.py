@@ -0,0 +1,230 @@
+import os, json, hmac, hashlib, base64, sqlite3, threading, time
+from datetime import datetime, timezone
+from clients import get_airtable_table
+import config
+from fetch_data import fetch_purchase_order_from_shiphero
+from sync_shiphero import shiphero_po_updates
+from utils import airtable_string
+
+WEBHOOK_QUEUE_FILE = 'cache/shiphero_webhook_queue.db'
+
+# Seconds the worker waits after an event so bursts of updates are synced as one batch
+COALESCE_SECONDS = 2
+
+# Events are dropped after this many failed sync attempts
+MAX_ATTEMPTS = 5
+
+# Airtable accepts at most 10 records per batch request and formulas have a length limit
+AIRTABLE_BATCH_SIZE = 10
+
+def verify_shiphero_signature(body, signature):
+    """
+    Verify the X-Shiphero-Hmac-Sha256 header of a webhook request: the base64 encoded
+    HMAC-SHA256 of the raw request body, keyed with config.SHIPHERO_WEBHOOK_SECRET.
+    Requests are rejected when no secret is configured.
+    """
+    secret = getattr(config, 'SHIPHERO_WEBHOOK_SECRET', None)
+    if not secret or not signature:
+        return False
+    expected = base64.b64encode(hmac.new(secret.encode(), body, hashlib.sha256).digest()).decode()
+    return hmac.compare_digest(expected, signature)
+
+def parse_po_update(payload):
+    """Return (po_id, po_number) from a ShipHero PO Update webhook payload."""
+    purchase_order = payload.get('purchase_order') or payload
+    po_id = purchase_order.get('po_id') or purchase_order.get('id')
+    po_number = purchase_order.get('po_number')
+    return (str(po_id) if po_id else None), (str(po_number) if po_number else None)
+
+class WebhookQueue:
+    """
+    Durable SQLite queue of pending PO updates, keyed by ShipHero PO id.
+    A PO that is updated several times before the worker runs is stored once.
+    """
+
+    def __init__(self, path=WEBHOOK_QUEUE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS po_events (
+                    po_id TEXT PRIMARY KEY,
+                    po_number TEXT,
+                    received_at TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def put(self, po_id, po_number):
+        with self.lock, self.connect() as connection:
+            connection.execute("""
+                INSERT INTO po_events (po_id, po_number, received_at) VALUES (?, ?, ?)
+                ON CONFLICT(po_id) DO UPDATE SET po_number = excluded.po_number, received_at = excluded.received_at
+            """, (po_id, po_number, datetime.now(timezone.utc).isoformat()))
+
+    def pending(self):
+        with self.lock, self.connect() as connection:
+            return connection.execute("SELECT po_id, po_number, received_at FROM po_events ORDER BY received_at").fetchall()
+
+    def done(self, events):
+        """Remove events that were synced, unless the PO was updated again since they were read."""
+        with self.lock, self.connect() as connection:
+            connection.executemany("DELETE FROM po_events WHERE po_id = ? AND received_at = ?", [(po_id, received_at) for po_id, _, received_at in events])
+
+    def failed(self, events):
+        with self.lock, self.connect() as connection:
+            connection.executemany("UPDATE po_events SET attempts = attempts + 1 WHERE po_id = ?", [(po_id,) for po_id, _, _ in events])
+            dropped = connection.execute("SELECT po_id, po_number FROM po_events WHERE attempts >= ?", (MAX_ATTEMPTS,)).fetchall()
+            connection.execute("DELETE FROM po_events WHERE attempts >= ?", (MAX_ATTEMPTS,))
+        if dropped:
+            print(f"Dropped ShipHero PO updates after {MAX_ATTEMPTS} failed attempts; run a sync to pick them up: {', '.join(po_number or po_id for po_id, po_number in dropped)}")
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def sync_purchase_orders_by_id(events):
+    """
+    Sync the given queued (po_id, po_number, received_at) events from ShipHero to Airtable.
+    Airtable records are read and updated in batches across all events. Events of the same PO
+    number (e.g. queued under different ids) are synced once and all share its outcome.
+    Returns the events that were synced and those that failed.
+    """
+    purchase_orders_table = get_airtable_table("Purchase Orders")
+    line_items_table = get_airtable_table("Line Items")
+
+    # Fetch the updated purchase orders from ShipHero
+    shiphero_pos = {}
+    synced, failed = [], []
+    for event in events:
+        po_id = event[0]
+        try:
+            shiphero_po = fetch_purchase_order_from_shiphero(po_id)
+        except Exception as e:
+            print(f"Failed to fetch purchase order {po_id} from ShipHero. Error: {e}")
+            failed.append(event)
+            continue
+        if not shiphero_po:
+            print(f"Purchase order {po_id} not found in ShipHero.")
+            synced.append(event)
+            continue
+        po_events, _ = shiphero_pos.setdefault(shiphero_po['po_number'], ([], shiphero_po))
+        po_events.append(event)
+
+    # Fetch the matching Airtable purchase orders and their line items in batches
+    po_numbers = list(shiphero_pos)
+    airtable_pos = {}
+    line_items_by_po = {}
+    for batch in chunks(po_numbers, AIRTABLE_BATCH_SIZE):
+        formula = "OR(" + ", ".join(f"{{PO #}} = {airtable_string(po_number)}" for po_number in batch) + ")"
+        for po_record in purchase_orders_table.all(formula=formula):
+            airtable_pos[po_record['fields']['PO #']] = po_record
+        for line_item in line_items_table.all(formula=formula):
+            po_number = line_item['fields'].get('PO #')
+            po_number = po_number[0] if isinstance(po_number, list) else po_number
+            line_items_by_po.setdefault(str(po_number), []).append(line_item)
+
+    # Coalesce the updates of every purchase order into batch updates
+    po_updates, line_item_updates, batched = [], [], []
+    for po_number, (po_events, shiphero_po) in shiphero_pos.items():
+        airtable_po_record = airtable_pos.get(po_number)
+        if not airtable_po_record:
+            print(f"Warning: Purchase order {po_number} was not found in Airtable.")
+            synced.extend(po_events)
+            continue
+        airtable_po_record['line_items'] = line_items_by_po.get(po_number, [])
+        po_update, po_line_item_updates = shiphero_po_updates(airtable_po_record, shiphero_po)
+        po_updates.append(po_update)
+        line_item_updates.extend(po_line_item_updates)
+        batched.extend(po_events)
+
+    try:
+        if po_updates:
+            purchase_orders_table.batch_update(po_updates)
+        if line_item_updates:
+            line_items_table.batch_update(line_item_updates)
+        synced.extend(batched)
+        print(f"Synced {len(po_updates)} purchase orders and {len(line_item_updates)} line items from ShipHero webhooks.")
+    except Exception as e:
+        print(f"Failed to update Airtable from ShipHero webhooks. Error: {e}")
+        failed.extend(batched)
+
+    return synced, failed
+
+class WebhookWorker:
+    """Background thread draining the webhook queue into Airtable."""
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def notify(self):
+        self.start()
+        self.wakeup.set()
+
+    def run(self):
+        while True:
+            # Also wake up periodically to retry failed events and events queued before a restart
+            self.wakeup.wait(timeout=60)
+            self.wakeup.clear()
+            time.sleep(COALESCE_SECONDS)
+
+            events = self.queue.pending()
+            if not events:
+                continue
+            try:
+                synced, failed = sync_purchase_orders_by_id(events)
+            except Exception as e:
+                print(f"Failed to sync ShipHero webhook events. Error: {e}")
+                synced, failed = [], events
+            self.queue.done(synced)
+            self.queue.failed(failed)
+
+_queue = None
+_worker = None
+_init_lock = threading.Lock()
+
+def get_webhook_worker():
+    """Return the process-wide webhook worker, creating the queue and starting the thread on first use."""
+    global _queue, _worker
+    with _init_lock:
+        if _worker is None:
+            _queue = WebhookQueue()
+            _worker = WebhookWorker(_queue)
+            _worker.start()
+        return _worker
+
+def handle_po_update_webhook(body, signature):
+    """
+    Verify and enqueue a ShipHero PO Update webhook.
+    Returns a (response, status code) pair for the Flask route.
+    """
+    if not verify_shiphero_signature(body, signature):
+        return {"code": "401", "Status": "Invalid signature"}, 401
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return {"code": "400", "Status": "Invalid JSON"}, 400
+
+    po_id, po_number = parse_po_update(payload)
+    if not po_id:
+        return {"code": "400", "Status": "Missing purchase order id"}, 400
+
+    worker = get_webhook_worker()
+    worker.queue.put(po_id, po_number)
+    worker.notify()
+    print(f"Queued ShipHero PO update for purchase order {po_number or po_id}")
+    return {"code": "200", "Status": "Success"}, 200
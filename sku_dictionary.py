@@ -0,0 +1,156 @@
+import os, pickle, threading
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import take
+
+SKU_DICTIONARY_FILE = 'cache/sku_dictionary.pkl'
+
+def normalize_sku(value):
+    """
+    Normalize a SKU as returned by any of the sources.
+    Airtable lookups return one-element lists, missing values become an empty string
+    and surrounding whitespace is dropped.
+    """
+    if isinstance(value, list):
+        value = value[0] if value else ''
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        value = str(value)
+    return value.strip()
+
+def normalized_skus(values):
+    """
+    Normalize a column or list of SKUs as normalize_sku does. String columns are stripped in one
+    vectorized call; other columns (e.g. holding Airtable lookup lists) are normalized value by value.
+    """
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    if values.dtype != object and pd.api.types.is_string_dtype(values):
+        return values.str.strip().fillna('')
+    return values.map(normalize_sku).astype('str')
+
+class SkuDictionary:
+    """
+    Maps normalized SKUs to stable integer codes.
+    Codes are assigned in order of first appearance and never reused, so a dictionary
+    saved to disk gives the same code to the same SKU on every run.
+    """
+
+    def __init__(self, skus=None):
+        self.skus = list(skus or [])
+        self.index = None
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.skus)
+
+    def unique_values(self, values):
+        """
+        Factorize values into (inverse, normalized uniques), so SKUs are looked up once per
+        distinct value instead of once per row.
+        """
+        inverse, uniques = pd.factorize(normalized_skus(values))
+        return inverse, uniques.tolist()
+
+    def unique_codes(self, skus):
+        """Codes of distinct normalized SKUs, with -1 for unknown SKUs. The caller holds the lock."""
+        if self.index is None:
+            self.index = pd.Index(self.skus, dtype='str')
+        return self.index.get_indexer(skus).astype(np.int32)
+
+    def encode(self, values):
+        """Return the int32 codes for the given SKUs, assigning codes to new SKUs in order of first appearance."""
+        inverse, skus = self.unique_values(values)
+        with self.lock:
+            codes = self.unique_codes(skus)
+            for i in np.flatnonzero(codes < 0):
+                code = len(self.skus)
+                self.skus.append(skus[i])
+                self.index = None
+                self.dirty = True
+                codes[i] = code
+        return codes[inverse]
+
+    def lookup(self, values):
+        """Return the int32 codes for the given SKUs, with -1 for unknown SKUs."""
+        inverse, skus = self.unique_values(values)
+        with self.lock:
+            codes = self.unique_codes(skus)
+        return codes[inverse]
+
+    def decode(self, codes):
+        """Return the SKUs for the given codes."""
+        skus = np.asarray(self.skus, dtype=object)
+        return skus[np.asarray(codes, dtype=np.int64)]
+
+    def save(self, path=SKU_DICTIONARY_FILE):
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                pickle.dump(self.skus, f)
+            self.dirty = False
+
+def load_sku_dictionary(path=SKU_DICTIONARY_FILE):
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return SkuDictionary(pickle.load(f))
+    return SkuDictionary()
+
+_shared_dictionary = None
+_shared_dictionary_lock = threading.Lock()
+
+def get_sku_dictionary():
+    """Return the process-wide SKU dictionary, loading it from disk on first use."""
+    global _shared_dictionary
+    with _shared_dictionary_lock:
+        if _shared_dictionary is None:
+            _shared_dictionary = load_sku_dictionary()
+        return _shared_dictionary
+
+def row_positions(left_codes, right_codes):
+    """
+    For each left code, return the row position of the same code in right_codes, or -1.
+    SKUs are expected to be unique on the right side; the first occurrence wins otherwise.
+    """
+    size = int(max(left_codes.max(initial=-1), right_codes.max(initial=-1))) + 1
+    positions = np.full(size, -1, dtype=np.int64)
+    codes, first_rows = np.unique(right_codes, return_index=True)
+    positions[codes] = first_rows
+    return positions[left_codes]
+
+def join_on_sku(left_df, right_df, how='left', left_on='sku', right_on='sku'):
+    """
+    Join right_df onto left_df by SKU using integer codes instead of a string merge.
+    Supports 'left' and 'inner' joins. Row order of left_df is preserved and right-hand
+    columns missing for a SKU are filled with NaN, as with DataFrame.merge.
+    right_df should have one row per normalized SKU. A merge would repeat the left rows for
+    each duplicate, which this join cannot; the first row of a duplicated SKU is kept instead
+    and a warning names the duplicates.
+    """
+    sku_dictionary = get_sku_dictionary()
+    left_codes = sku_dictionary.encode(left_df[left_on])
+    right_codes = sku_dictionary.encode(right_df[right_on])
+    sku_dictionary.save()
+
+    duplicated = pd.Series(right_codes).duplicated().to_numpy()
+    if duplicated.any():
+        duplicates = pd.unique(sku_dictionary.decode(right_codes[duplicated]))
+        print(f"Warning: {len(duplicates)} SKUs occur more than once in the {right_on} column joined on, keeping their first row, e.g. {', '.join(duplicates[:5])}")
+
+    positions = row_positions(left_codes, right_codes)
+    if how == 'inner':
+        matched = positions >= 0
+        left_df = left_df[matched]
+        positions = positions[matched]
+    elif how != 'left':
+        raise ValueError(f"Unsupported join type: {how}")
+
+    joined_df = left_df.reset_index(drop=True)
+    for column in right_df.columns:
+        if column == right_on and left_on == right_on:
+            continue
+        joined_df[column] = take(right_df[column].to_numpy(), positions, allow_fill=True)
+    return joined_df
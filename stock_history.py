@@ -0,0 +1,76 @@
+import os, glob
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from sku_dictionary import get_sku_dictionary
+from sales_cube import most_recent_sunday
+
+STOCK_HISTORY_DIR = 'cache/stock_history'
+
+def append_stock_snapshot(stock_levels_df, taken_at=None, history_dir=STOCK_HISTORY_DIR):
+    """
+    Append a compact snapshot of stock_levels_df (as returned by transform_stock_levels)
+    to the stock history. Snapshots are stored column by column in one .npz file per run,
+    under a date=YYYY-MM-DD partition directory.
+    """
+    taken_at = taken_at or datetime.now()
+    sku_dictionary = get_sku_dictionary()
+    sku_codes = sku_dictionary.encode(stock_levels_df['SKU'].tolist())
+    sku_dictionary.save()
+
+    partition_dir = os.path.join(history_dir, f"date={taken_at.strftime('%Y-%m-%d')}")
+    os.makedirs(partition_dir, exist_ok=True)
+    snapshot_path = os.path.join(partition_dir, f"snapshot_{taken_at.strftime('%H%M%S')}.npz")
+    np.savez_compressed(
+        snapshot_path,
+        sku_code=sku_codes,
+        on_hand=stock_levels_df['On Hand'].fillna(0).to_numpy(dtype=np.int32),
+        committed=stock_levels_df['committed'].fillna(0).to_numpy(dtype=np.int32),
+        incoming=stock_levels_df['Incoming Stock'].fillna(0).to_numpy(dtype=np.int32)
+    )
+    print(f"Stock snapshot saved to {snapshot_path}")
+    return snapshot_path
+
+def in_stock_matrix(start_date, days, num_skus, history_dir=STOCK_HISTORY_DIR):
+    """
+    Return a days-by-SKU boolean matrix of in-stock days starting on start_date.
+    A SKU is in stock on a day when any snapshot of that day shows available stock
+    (on_hand - committed > 0). A SKU missing from every snapshot of a day, and every SKU on
+    a day without snapshots, is unknown for that day and counts as in stock.
+    """
+    in_stock = np.ones((days, num_skus), dtype=bool)
+    for day in range(days):
+        date = start_date + timedelta(days=day)
+        snapshot_paths = glob.glob(os.path.join(history_dir, f"date={date.strftime('%Y-%m-%d')}", "*.npz"))
+        if not snapshot_paths:
+            continue
+        seen = np.zeros(num_skus, dtype=bool)
+        day_in_stock = np.zeros(num_skus, dtype=bool)
+        for snapshot_path in snapshot_paths:
+            with np.load(snapshot_path) as snapshot:
+                sku_codes = snapshot['sku_code']
+                known = sku_codes < num_skus
+                available = snapshot['on_hand'] - snapshot['committed']
+                seen[sku_codes[known]] = True
+                day_in_stock[sku_codes[known]] |= available[known] > 0
+        in_stock[day] = day_in_stock | ~seen
+    return in_stock
+
+def in_stock_days(weeks=8, end_date=None, history_dir=STOCK_HISTORY_DIR):
+    """
+    Return a DataFrame with one row per known SKU and one in_stock_days_N_weeks_ago column
+    per complete week, matching the weeks of the sales_N_weeks_ago_* columns.
+    """
+    end_date = end_date or most_recent_sunday()
+    start_date = end_date - timedelta(days=weeks * 7 - 1)
+    sku_dictionary = get_sku_dictionary()
+
+    in_stock = in_stock_matrix(start_date, weeks * 7, len(sku_dictionary), history_dir)
+    days_per_week = in_stock.reshape(weeks, 7, -1).sum(axis=1).astype(np.int8)
+
+    in_stock_days_df = pd.DataFrame(
+        days_per_week[::-1].T,
+        columns=[f"in_stock_days_{weeks_ago}_weeks_ago" for weeks_ago in range(1, weeks + 1)]
+    )
+    in_stock_days_df.insert(0, 'sku', sku_dictionary.skus)
+    return in_stock_days_df
@@ -0,0 +1,48 @@
+import config
+
+# Stock locations: the ShipHero warehouse whose on-hand stock is counted, paired with the Shopify
+# location whose committed quantities are deducted from it. Override with STOCK_LOCATIONS in config.py.
+DEFAULT_STOCK_LOCATIONS = [
+    {
+        'name': 'main',
+        'shiphero_warehouse_id': "V2FyZWhvdXNlOjEwMTU4Mw==",
+        'shopify_location_id': "gid://shopify/Location/71392264438"
+    }
+]
+
+# Stock counts broken down per location when more than one location is configured
+LOCATION_STOCK_FIELDS = ['on_hand', 'committed', 'available']
+
+# Keys every configured stock location needs
+STOCK_LOCATION_KEYS = ['name', 'shiphero_warehouse_id', 'shopify_location_id']
+
+def get_stock_locations():
+    """
+    Return the configured stock locations.
+    Raises ValueError when STOCK_LOCATIONS is empty, a location lacks one of STOCK_LOCATION_KEYS
+    or two locations share a value of one of them: the per-location columns are named after the
+    locations, and a warehouse or Shopify location listed twice would be counted twice.
+    """
+    locations = getattr(config, 'STOCK_LOCATIONS', DEFAULT_STOCK_LOCATIONS)
+    if not locations:
+        raise ValueError("STOCK_LOCATIONS in config.py is empty; configure at least one stock location or remove it to use the main warehouse")
+    for location in locations:
+        missing = [key for key in STOCK_LOCATION_KEYS if not location.get(key)]
+        if missing:
+            raise ValueError(f"Stock location {location.get('name') or location} in STOCK_LOCATIONS is missing {', '.join(missing)}")
+    for key in STOCK_LOCATION_KEYS:
+        values = [location[key] for location in locations]
+        duplicates = sorted({value for value in values if values.count(value) > 1})
+        if duplicates:
+            raise ValueError(f"Each {key} in STOCK_LOCATIONS must be unique; duplicated: {', '.join(duplicates)}")
+    return locations
+
+def location_stock_columns(locations=None):
+    """
+    Names of the per-location stock columns, e.g. on_hand_main, committed_main, available_main.
+    Empty with a single location, whose counts are the totals.
+    """
+    locations = locations or get_stock_locations()
+    if len(locations) < 2:
+        return []
+    return [f"{field}_{location['name']}" for location in locations for field in LOCATION_STOCK_FIELDS]
@@ -1,10 +1,22 @@
-import requests
-from pyairtable import Table
+import requests, os
+from datetime import datetime, timedelta, timezone
+from clients import get_airtable_table
 import config
 import json
 from fetch_data import fetch_purchase_orders_from_shiphero
+from sku_dictionary import normalize_sku
+from write_journal import WriteJournal, StepInDoubt
+from shiphero_scheduler import scheduler, runs_at_shiphero_priority, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
 import config
 
+PO_SYNC_WATERMARK_FILE = 'cache/shiphero_po_sync_watermark.json'
+
+# Routine syncs fetch POs updated since the watermark; a full sweep runs at least this often
+PO_SYNC_FULL_SWEEP_INTERVAL = timedelta(days=7)
+
+# Overlap applied to the watermark so updates landing during the previous sync are not missed
+PO_SYNC_WATERMARK_OVERLAP = timedelta(minutes=10)
+
 def prepare_graphql_query_to_create_purchase_orders(po_record):
     """Prepare the GraphQL query for the purchase_order_create mutation."""
     po_number = po_record['fields']['PO #']
@@ -13,7 +25,7 @@ def prepare_graphql_query_to_create_purchase_orders(po_record):
 
     line_items_data = [
         {
-            "sku": item['fields']['sku'][0] if isinstance(item['fields']['sku'], list) else item['fields']['sku'],
+            "sku": normalize_sku(item['fields']['sku']),
             "quantity": item['fields']['Quantity Ordered'],
             "price": f"{item['fields']['Total Unit Cost (active)']:.2f}",
             "expected_weight_in_lbs": "0.0" # Placeholder for now
@@ -76,39 +88,98 @@ def execute_shiphero_graphql_query(query):
     }
     print("Executing GraphQL query:")
     print(query)
-    response = requests.post(url, json=query, headers=headers)
+    with scheduler.request(query['query']) as outcome:
+        response = requests.post(url, json=query, headers=headers)
+        if response.ok:
+            outcome['result'] = response.json()
     print("Response status code:", response.status_code)
     print("Response content:", response.content)
     response.raise_for_status()
     return response.json()
 
-def sync_shiphero_to_airtable(purchase_orders_table, line_items_table, airtable_po_record, shiphero_po):
-    """Update Airtable with ShipHero Purchase Order data."""
-    airtable_po_id = airtable_po_record['id']
-    purchase_orders_table.update(airtable_po_id, {
-        "shiphero_id": shiphero_po['id'],
-        "Status (ShipHero)": shiphero_po['fulfillment_status']
-    })
+class ShipheroRejected(Exception):
+    """ShipHero rejected a write outright (a 4xx response or GraphQL errors), so it had no effect."""
+
+def create_purchase_order_in_shiphero(po_record):
+    """
+    Create the purchase order in ShipHero and return the created purchase order.
+    Raises ShipheroRejected when ShipHero refused it; timeouts, connection errors and 5xx responses
+    raise requests exceptions, as the purchase order may or may not have been created then.
+    """
+    po_number = po_record['fields']['PO #']
+    query = prepare_graphql_query_to_create_purchase_orders(po_record)
+    try:
+        response = execute_shiphero_graphql_query(query)
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and 400 <= e.response.status_code < 500:
+            raise ShipheroRejected(f"ShipHero rejected purchase order {po_number} with status {e.response.status_code}") from e
+        raise
+
+    purchase_order = (((response or {}).get('data') or {}).get('purchase_order_create') or {}).get('purchase_order')
+    if purchase_order is None:
+        raise ShipheroRejected(f"ShipHero rejected purchase order {po_number}: {(response or {}).get('errors')}")
+    print(f"Successfully synced purchase order: {po_number} to ShipHero.")
+    return purchase_order
+
+def find_shiphero_purchase_order(payload):
+    """
+    Recover the create step of a push that died or timed out: look the purchase order up by its
+    PO number among those created in ShipHero since the day before the create was sent.
+    Returns the purchase order, or None when it was not created.
+    """
+    po_number = payload['po_number']
+    if not payload.get('sent_on'):
+        raise StepInDoubt(f"purchase order {po_number} was journaled without its send date")
+    created_from = (datetime.strptime(payload['sent_on'], "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+    try:
+        purchase_orders = fetch_purchase_orders_from_shiphero(created_from=created_from)
+    except Exception as e:
+        raise StepInDoubt(f"purchase order {po_number} could not be looked up in ShipHero: {e}") from e
+    return next((edge['node'] for edge in purchase_orders if str(edge['node']['po_number']) == str(po_number)), None)
 
+def shiphero_po_updates(airtable_po_record, shiphero_po):
+    """
+    Build the Airtable updates for a ShipHero Purchase Order.
+    Returns the Purchase Orders update and the list of Line Items updates as {"id", "fields"} records.
+    """
+    po_update = {
+        "id": airtable_po_record['id'],
+        "fields": {
+            "shiphero_id": shiphero_po['id'],
+            "Status (ShipHero)": shiphero_po['fulfillment_status']
+        }
+    }
+
+    line_item_updates = []
     for airtable_line_item in airtable_po_record['line_items']:
-        airtable_sku = airtable_line_item['fields']['sku'][0] if isinstance(airtable_line_item['fields']['sku'], list) else airtable_line_item['fields']['sku']
-        shiphero_line_item = next((item['node'] for item in shiphero_po['line_items']['edges'] if item['node']['sku'] == airtable_sku), None)
+        airtable_sku = normalize_sku(airtable_line_item['fields']['sku'])
+        shiphero_line_item = next((item['node'] for item in shiphero_po['line_items']['edges'] if normalize_sku(item['node']['sku']) == airtable_sku), None)
         if shiphero_line_item:
-            shiphero_line_item_id = shiphero_line_item['id']
-            quantity_received = shiphero_line_item.get('quantity_received', 0)
-            airtable_line_item_id = airtable_line_item['id']
-            line_items_table.update(airtable_line_item_id, {
-                "shiphero_id": shiphero_line_item_id,
-                "Quantity Received": quantity_received
+            line_item_updates.append({
+                "id": airtable_line_item['id'],
+                "fields": {
+                    "shiphero_id": shiphero_line_item['id'],
+                    "Quantity Received": shiphero_line_item.get('quantity_received', 0)
+                }
             })
 
+    return po_update, line_item_updates
+
+def sync_shiphero_to_airtable(purchase_orders_table, line_items_table, airtable_po_record, shiphero_po):
+    """Update Airtable with ShipHero Purchase Order data."""
+    po_update, line_item_updates = shiphero_po_updates(airtable_po_record, shiphero_po)
+    purchase_orders_table.update(po_update['id'], po_update['fields'])
+    if line_item_updates:
+        line_items_table.batch_update(line_item_updates)
+
+@runs_at_shiphero_priority(PRIORITY_INTERACTIVE)
 def push_pos_to_shiphero():
     """
     Fetch purchase orders with ShipHero Sync Status = 'Queued' and their associated line items.
     Then push enqueued purchase orders to ShipHero.
     """
-    purchase_orders_table = Table(config.AIRTABLE_API_KEY, config.AIRTABLE_PRODUCTION_DEV_BASE_ID, "Purchase Orders")
-    line_items_table = Table(config.AIRTABLE_API_KEY, config.AIRTABLE_PRODUCTION_DEV_BASE_ID, "Line Items")
+    purchase_orders_table = get_airtable_table("Purchase Orders")
+    line_items_table = get_airtable_table("Line Items")
 
     print("Fetching purchase orders to sync...")
     purchase_orders = purchase_orders_table.all(formula="{ShipHero Sync Status} = 'Queued'")
@@ -126,50 +197,110 @@ def push_pos_to_shiphero():
         print(f"Fetched {len(line_items)} line items for purchase order number: {po_number}.")
         po_record['line_items'] = line_items
 
+    # Purchase orders created in ShipHero by a run that died or timed out before updating Airtable
+    # are looked up by their PO number instead of being created again
+    journal = WriteJournal('push_pos_to_shiphero')
+    unfinished = False
+
     for po_record in purchase_orders:
         po_id = po_record['id']
         po_number = po_record['fields']['PO #']
 
-        try:
-            # Execute the GraphQL query
-            query = prepare_graphql_query_to_create_purchase_orders(po_record)
-            response = execute_shiphero_graphql_query(query)
-            print(f"Successfully synced purchase order: {po_number} to ShipHero.")
-            print(response)
-
-            # Extract ShipHero Purchase Order ID and Line Item IDs
-            shiphero_po = response['data']['purchase_order_create']['purchase_order']
-            # shiphero_line_items = response['data']['purchase_order_create']['purchase_order']['line_items']['edges']
-
+        def update_airtable():
             # Sync ShipHero Purchase Order ID and Line Item IDs to Airtable
             sync_shiphero_to_airtable(purchase_orders_table, line_items_table, po_record, shiphero_po)
 
             # Update Airtable status to "Synced"
             purchase_orders_table.update(po_id, {"ShipHero Sync Status": "Synced"})
-        except requests.exceptions.RequestException as e:
+            return True
+
+        try:
+            shiphero_po = journal.run_step(
+                f"create:{po_id}",
+                lambda: create_purchase_order_in_shiphero(po_record),
+                payload={'po_number': po_number, 'sent_on': datetime.now(timezone.utc).strftime("%Y-%m-%d")},
+                recover=find_shiphero_purchase_order
+            )
+        except StepInDoubt as e:
+            unfinished = True
+            print(f"Purchase order {po_number} may already exist in ShipHero from an interrupted run: {e}. "
+                  f"Check ShipHero, then run WriteJournal('push_pos_to_shiphero').forget('create:{po_id}') to push it again.")
+            continue
+        except ShipheroRejected as e:
             print(f"Failed to sync purchase order: {po_number} to ShipHero. Error: {e}")
+            # The create request was rejected, so a requeued PO is pushed again
+            journal.forget(f"create:{po_id}")
             # Update Airtable status to "Failed"
             purchase_orders_table.update(po_id, {"ShipHero Sync Status": "Failed"})
+            continue
+        except requests.exceptions.RequestException as e:
+            # The create may have landed; the step stays in doubt and the next run looks the PO up
+            unfinished = True
+            print(f"Could not confirm that purchase order {po_number} was created in ShipHero. Error: {e}. "
+                  f"The next run checks ShipHero for it before pushing it again.")
+            continue
 
-def sync_shiphero_purchase_orders_to_airtable(created_from: str = None):
+        try:
+            # Airtable updates are idempotent, so an unconfirmed one is simply sent again
+            journal.run_step(f"airtable:{po_id}", update_airtable, payload={'po_number': po_number}, recover=lambda payload: None)
+        except requests.exceptions.RequestException as e:
+            # The PO exists in ShipHero; the next run only retries the Airtable update
+            unfinished = True
+            print(f"Created purchase order: {po_number} in ShipHero but failed to update Airtable. Error: {e}")
+
+    # Keep the run open while a purchase order is unfinished, so it is not pushed twice
+    if not unfinished:
+        journal.complete()
+
+def load_po_sync_watermark():
+    """Load the PO sync watermark: the start time of the last successful sync and of the last full sweep."""
+    if not os.path.exists(PO_SYNC_WATERMARK_FILE):
+        return {}
+    with open(PO_SYNC_WATERMARK_FILE, 'r') as f:
+        watermark = json.load(f)
+    watermark = {key: datetime.fromisoformat(value) for key, value in watermark.items()}
+    # Watermarks saved before they were timezone-aware are in UTC
+    return {key: value if value.tzinfo else value.replace(tzinfo=timezone.utc) for key, value in watermark.items()}
+
+def save_po_sync_watermark(watermark):
+    os.makedirs(os.path.dirname(PO_SYNC_WATERMARK_FILE), exist_ok=True)
+    tmp_path = f"{PO_SYNC_WATERMARK_FILE}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({key: value.isoformat() for key, value in watermark.items()}, f)
+    os.replace(tmp_path, PO_SYNC_WATERMARK_FILE)
+
+@runs_at_shiphero_priority(PRIORITY_BACKGROUND)
+def sync_shiphero_purchase_orders_to_airtable(created_from: str = None, full_sweep: bool = False):
     """
     Syncs purchase orders from ShipHero to Airtable.
     This function performs the following steps:
     1. Fetches purchase orders from Airtable with Status Internal = "Open".
-    2. Determines the oldest date created of these open purchase orders.
-    3. Fetches purchase orders from ShipHero created after the oldest date created.
-    4. Populates the following fields in Airtable for each matching PO in ShipHero:
+    2. Fetches purchase orders from ShipHero:
+       - routinely, only those updated since the sync watermark (the start of the last successful sync);
+       - on a full sweep, those created after the oldest date created of the open purchase orders.
+       A full sweep runs when created_from or full_sweep is given, when there is no watermark yet,
+       and at least every PO_SYNC_FULL_SWEEP_INTERVAL as a safety net. A sweep from an explicit
+       created_from misses older open POs, so it does not advance the watermark.
+    3. Populates the following fields in Airtable for each matching PO in ShipHero:
        - ShipHero PO ID
        - ShipHero Line Item IDs
        - ShipHero Status
        - ShipHero Quantity Received
-    5. Prints the number of purchase orders synced.
-    6. If any purchase orders were not found in Airtable, prints a warning with the PO numbers.
+    4. Prints the number of purchase orders synced and advances the watermark, after a full sweep
+       or a fetch of the POs updated since the watermark.
+    5. If any purchase orders were not found in Airtable, prints a warning with the PO numbers.
     Note: Uses Airtable automation to verify whether Status Internal can be updated to "Closed" after syncing.
     """
+    sync_started_at = datetime.now(timezone.utc)
+    partial_sweep = bool(created_from)
+    watermark = load_po_sync_watermark()
+    last_full_sweep = watermark.get('last_full_sweep')
+    if not created_from and not full_sweep:
+        full_sweep = 'updated_from' not in watermark or not last_full_sweep or sync_started_at - last_full_sweep >= PO_SYNC_FULL_SWEEP_INTERVAL
+
     # Fetch purchase orders from Airtable with Status Internal = "Open"
-    purchase_orders_table = Table(config.AIRTABLE_API_KEY, config.AIRTABLE_PRODUCTION_DEV_BASE_ID, "Purchase Orders")
-    line_items_table = Table(config.AIRTABLE_API_KEY, config.AIRTABLE_PRODUCTION_DEV_BASE_ID, "Line Items")
+    purchase_orders_table = get_airtable_table("Purchase Orders")
+    line_items_table = get_airtable_table("Line Items")
     
     print("Fetching open purchase orders from Airtable...")
     purchase_orders = purchase_orders_table.all(formula="{Status Internal} = 'Open'")
@@ -179,40 +310,39 @@ def sync_shiphero_purchase_orders_to_airtable(created_from: str = None):
         print("No open purchase orders found in Airtable.")
         return
 
-    for po_record in purchase_orders:
-        po_number = po_record['fields']['PO #']
-        print(f"Fetching line items for purchase order number: {po_number}...")
-        line_items = line_items_table.all(formula=f"{{PO #}} = '{po_number}'")
-        print(f"Fetched {len(line_items)} line items for purchase order number: {po_number}.")
-        po_record['line_items'] = line_items
-
-    # Get the oldest date created of purchase orders in Airtable with Status Internal = "Open"
-    if not created_from:
-        oldest_date_created = min(po['fields']['Date Created'] for po in purchase_orders)
-        print(f"Oldest date created for open purchase orders: {oldest_date_created}")
-        created_from = oldest_date_created
-
-    # Fetch purchase orders from ShipHero created after the oldest date created
-    shiphero_purchase_orders = fetch_purchase_orders_from_shiphero(created_from=created_from)
+    if created_from or full_sweep:
+        # Get the oldest date created of purchase orders in Airtable with Status Internal = "Open"
+        if not created_from:
+            oldest_date_created = min(po['fields']['Date Created'] for po in purchase_orders)
+            print(f"Oldest date created for open purchase orders: {oldest_date_created}")
+            created_from = oldest_date_created
 
-    if not shiphero_purchase_orders:
-        print("No new purchase orders found in ShipHero.")
-        return
+        # Fetch purchase orders from ShipHero created after the oldest date created
+        print(f"Running a full sweep of ShipHero purchase orders created from {created_from}...")
+        shiphero_purchase_orders = fetch_purchase_orders_from_shiphero(created_from=created_from, parallel=True)
+    else:
+        # Fetch only the purchase orders updated since the last successful sync, with a small overlap
+        updated_from = watermark['updated_from'] - PO_SYNC_WATERMARK_OVERLAP
+        print(f"Fetching ShipHero purchase orders updated since {updated_from.isoformat()}...")
+        shiphero_purchase_orders = fetch_purchase_orders_from_shiphero(updated_from=updated_from)
 
     # Sync ShipHero purchase orders to Airtable
     synced_count = 0
+    failed_count = 0
     not_found_po_numbers = []
+    purchase_orders_by_number = {po['fields']['PO #']: po for po in purchase_orders}
 
     # Iterate over each purchase order fetched from ShipHero
-    for shiphero_po in shiphero_purchase_orders:
+    for shiphero_po in shiphero_purchase_orders or []:
         po_number = shiphero_po['node']['po_number']
         
         # Find the matching purchase order in Airtable by PO number
-        airtable_po_record = next((po for po in purchase_orders if po['fields']['PO #'] == po_number), None)
+        airtable_po_record = purchase_orders_by_number.get(po_number)
         
         if airtable_po_record:
             try:
                 # Fetch line items for the purchase order
+                print(f"Fetching line items for purchase order number: {po_number}...")
                 line_items = line_items_table.all(formula=f"{{PO #}} = '{po_number}'")
                 airtable_po_record['line_items'] = line_items
 
@@ -221,6 +351,7 @@ def sync_shiphero_purchase_orders_to_airtable(created_from: str = None):
                 synced_count += 1
                 print(f"Successfully synced purchase order: {po_number} to Airtable.")
             except Exception as e:
+                failed_count += 1
                 print(f"Failed to sync purchase order: {po_number} to Airtable. Error: {e}")
         else:
             not_found_po_numbers.append(po_number)
@@ -229,3 +360,18 @@ def sync_shiphero_purchase_orders_to_airtable(created_from: str = None):
     
     if not_found_po_numbers:
         print(f"Warning: The following purchase orders were not found in Airtable: {', '.join(not_found_po_numbers)}")
+
+    # Advance the watermark only when every matching purchase order was synced
+    if failed_count:
+        print(f"Failed to sync {failed_count} purchase orders; the sync watermark was not advanced.")
+        return
+
+    if partial_sweep:
+        print(f"The sweep only covered purchase orders created from {created_from}; the sync watermark was not advanced.")
+        return
+
+    watermark['updated_from'] = sync_started_at
+    if full_sweep:
+        watermark['last_full_sweep'] = sync_started_at
+    save_po_sync_watermark(watermark)
+    print(f"Sync watermark advanced to {sync_started_at.isoformat()}")
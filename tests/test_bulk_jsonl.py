@@ -0,0 +1,64 @@
+import sys
+import os
+import json
+
+# Add the project directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bulk_jsonl import gid_type, row_id, normalize_bulk_jsonl
+
+SPECS = {
+    'Order': {
+        'columns': {'order_date': lambda row: row['createdAt'][:10]}
+    },
+    'LineItem': {
+        'columns': {'sku': 'sku', 'quantity': 'quantity'},
+        'parent': 'Order',
+        'parent_columns': {'order_date': 'order_date'},
+        'require_parent': True,
+        'dtypes': {'quantity': 'int32'}
+    }
+}
+
+def test_gid_type():
+    assert gid_type('gid://shopify/LineItem/1') == 'LineItem'
+    assert gid_type(None) is None
+    assert gid_type('123') is None
+
+def test_row_id_of_dicts_and_lines():
+    assert row_id({'id': 'gid://shopify/Order/1'}) == 'gid://shopify/Order/1'
+    assert row_id('{"id":"gid://shopify/LineItem/2","sku":"A"}') == 'gid://shopify/LineItem/2'
+    # Lines that do not start with the id are parsed
+    assert row_id('{"sku": "A", "id": "gid://shopify/LineItem/3"}') == 'gid://shopify/LineItem/3'
+    assert row_id('{"sku":"A"}') is None
+
+def test_children_are_joined_to_their_parents():
+    rows = [
+        {'id': 'gid://shopify/Order/1', 'createdAt': '2024-01-01T10:00:00Z'},
+        {'id': 'gid://shopify/LineItem/1', 'sku': 'A', 'quantity': 2, '__parentId': 'gid://shopify/Order/1'},
+        json.dumps({'id': 'gid://shopify/Order/2', 'createdAt': '2024-01-02T10:00:00Z'}),
+        json.dumps({'id': 'gid://shopify/LineItem/2', 'sku': 'B', 'quantity': 3, '__parentId': 'gid://shopify/Order/2'}),
+    ]
+    tables = normalize_bulk_jsonl(rows, SPECS)
+    assert tables['Order']['order_date'].tolist() == ['2024-01-01', '2024-01-02']
+    line_items_df = tables['LineItem']
+    assert line_items_df['sku'].tolist() == ['A', 'B']
+    assert line_items_df['order_date'].tolist() == ['2024-01-01', '2024-01-02']
+    assert line_items_df['quantity'].dtype == 'int32'
+
+def test_orphans_and_unknown_types_are_skipped():
+    rows = [
+        {'id': 'gid://shopify/LineItem/1', 'sku': 'A', 'quantity': 1, '__parentId': 'gid://shopify/Order/9'},
+        {'id': 'gid://shopify/Customer/1'},
+        # Rows without a GID, e.g. cached from a query that did not select the id, are not routed
+        {'sku': 'B', 'quantity': 1, '__parentId': 'gid://shopify/Order/9'},
+    ]
+    tables = normalize_bulk_jsonl(rows, SPECS)
+    assert tables['LineItem'].empty
+    assert list(tables['LineItem'].columns) == ['sku', 'quantity', 'order_date']
+
+def test_optional_parent_fills_missing_values():
+    specs = {'LineItem': dict(SPECS['LineItem'], require_parent=False)}
+    rows = [{'id': 'gid://shopify/LineItem/1', 'sku': 'A', 'quantity': 1, '__parentId': 'gid://shopify/Order/9'}]
+    line_items_df = normalize_bulk_jsonl(rows, specs)['LineItem']
+    assert line_items_df['order_date'].tolist() == [None]
@@ -0,0 +1,60 @@
+import sys
+import os
+import numpy as np
+import pandas as pd
+
+# Add the project directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sku_dictionary import SkuDictionary
+from forecast import order_sales_columns, moving_average, ewma_velocity, weeks_of_cover, suggested_order_qty, add_reorder_columns, add_stockout_adjusted_velocity
+
+SALES_COLUMNS = ['sales_1_weeks_ago_Mar04', 'sales_3_weeks_ago_Feb19', 'sales_2_weeks_ago_Feb26']
+
+def replenishment_frame():
+    return pd.DataFrame({
+        'sku': ['A', 'B', 'C'],
+        'sales_1_weeks_ago_Mar04': [30, 0, 7],
+        'sales_2_weeks_ago_Feb26': [20, 0, 7],
+        'sales_3_weeks_ago_Feb19': [10, 0, 7],
+        'available': [5, 10, 0],
+        'incoming': [5, 0, 0]
+    })
+
+def test_order_sales_columns_oldest_week_first():
+    assert [column for _, column in order_sales_columns(SALES_COLUMNS)] == ['sales_3_weeks_ago_Feb19', 'sales_2_weeks_ago_Feb26', 'sales_1_weeks_ago_Mar04']
+
+def test_moving_average_and_ewma():
+    sales = np.array([[10.0, 20.0, 30.0], [7.0, 7.0, 7.0]])
+    assert moving_average(sales, 2).tolist() == [25.0, 7.0]
+    assert moving_average(sales, 8).tolist() == [20.0, 7.0]
+    velocity = ewma_velocity(sales, alpha=0.5)
+    assert np.allclose(velocity, [(10 * 0.125 + 20 * 0.25 + 30 * 0.5) / 0.875, 7.0])
+
+def test_weeks_of_cover_and_suggested_order_qty():
+    stock = np.array([10.0, 10.0, 0.0])
+    velocity = np.array([2.0, 0.0, 1.5])
+    cover = weeks_of_cover(stock, velocity)
+    assert cover[0] == 5.0 and np.isnan(cover[1]) and cover[2] == 0.0
+    assert suggested_order_qty(stock, velocity, target_weeks_of_cover=8).tolist() == [6, 0, 12]
+
+def test_add_reorder_columns():
+    replenishment_df = add_reorder_columns(replenishment_frame(), SALES_COLUMNS, target_weeks_of_cover=2, alpha=0.5)
+    assert replenishment_df['sales_avg_4_weeks'].tolist() == [20.0, 0.0, 7.0]
+    assert replenishment_df['velocity_ewma'][2] == 7.0
+    assert replenishment_df['suggested_order_qty'].tolist()[1:] == [0, 14]
+    assert np.isnan(replenishment_df['weeks_of_cover'][1])
+
+def test_stockout_adjusted_velocity_scales_by_in_stock_days(tmp_path, monkeypatch):
+    # The in-stock days are joined through the shared SKU dictionary, which is saved under cache/
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('sku_dictionary._shared_dictionary', SkuDictionary())
+    in_stock_days_df = pd.DataFrame({
+        'sku': ['A', 'C'],
+        'in_stock_days_1_weeks_ago': [7, 0],
+        'in_stock_days_2_weeks_ago': [7, 0],
+        'in_stock_days_3_weeks_ago': [7, 7]
+    })
+    replenishment_df = add_stockout_adjusted_velocity(replenishment_frame(), SALES_COLUMNS, in_stock_days_df)
+    # A sold 60 units in 21 days, B has no history (every day counts), C sold 21 units in 7 days
+    assert replenishment_df['velocity_stockout_adjusted'].tolist() == [20.0, 0.0, 21.0]
@@ -0,0 +1,71 @@
+import sys
+import os
+import types
+import importlib
+import functools
+import pytest
+
+# Add the project directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from write_journal import WriteJournal
+
+CONFIG_NAMES = [
+    'AIRTABLE_API_KEY', 'AIRTABLE_PRODUCTION_DEV_BASE_ID',
+    'SHIPHERO_API_TOKEN', 'SHIPHERO_REFRESH_TOKEN', 'SHIPHERO_REFRESH_ENDPOINT', 'SHIPHERO_GRAPHQL_ENDPOINT', 'SHIPHERO_TOKEN_EXPIRATION',
+    'SHOPIFY_API_TOKEN', 'SHOPIFY_GRAPHQL_ENDPOINT',
+]
+
+class AirtableDown(Exception):
+    pass
+
+class FakeTable:
+    """In-memory Airtable table; the first all() of the tables named in fail_once raises."""
+
+    def __init__(self, tables, fail_once, name):
+        self.name = name
+        self.records = tables.setdefault(name, [])
+        self.fail_once = fail_once
+
+    def all(self, view=None, formula=None):
+        if self.name in self.fail_once:
+            self.fail_once.remove(self.name)
+            raise AirtableDown(self.name)
+        return list(self.records)
+
+    def batch_create(self, records):
+        created = [{'id': f"{self.name}:{len(self.records) + i}", 'fields': fields} for i, fields in enumerate(records)]
+        self.records.extend(created)
+        return created
+
+def fake_gspread_client(rows):
+    worksheet = types.SimpleNamespace(get_all_records=lambda expected_headers: rows)
+    spreadsheet = types.SimpleNamespace(worksheet=lambda name: worksheet)
+    return types.SimpleNamespace(open_by_key=lambda file_id: spreadsheet)
+
+def test_failed_lookups_are_fetched_again_by_the_next_run(tmp_path, monkeypatch):
+    config = types.ModuleType('config')
+    for name in CONFIG_NAMES:
+        setattr(config, name, name.lower())
+    monkeypatch.setitem(sys.modules, 'config', config)
+    for module in ('utils', 'populate_production'):
+        monkeypatch.delitem(sys.modules, module, raising=False)
+    populate_production = importlib.import_module('populate_production')
+
+    tables = {
+        'Purchase Orders': [{'id': 'po', 'fields': {'PO #': '7'}}],
+        'Variants': [{'id': 'variant', 'fields': {'SKU': 'A-1'}}],
+        'Products': [{'id': 'product', 'fields': {'Product Number': 'A'}}],
+    }
+    fail_once = {'Purchase Orders'}
+    rows = [{'product_num': 'A', 'sku': 'A-1', 'To Order Qty': 5, 'Total Units to Order for this Product': 5}]
+    monkeypatch.setattr(populate_production, 'get_airtable_table', lambda name: FakeTable(tables, fail_once, name))
+    monkeypatch.setattr(populate_production, 'get_gspread_client', lambda: fake_gspread_client(rows))
+    monkeypatch.setattr(populate_production, 'WriteJournal', functools.partial(WriteJournal, path=str(tmp_path / 'journal.db')))
+
+    with pytest.raises(AirtableDown):
+        populate_production.populate_production()
+    populate_production.populate_production()
+
+    assert [record['fields']['PO #'] for record in tables['Purchase Orders']] == ['7', '8']
+    assert tables['Line Items'][0]['fields']['Variant'] == ['variant']
@@ -0,0 +1,28 @@
+import sys
+import os
+import pandas as pd
+
+# Add the project directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import replenishment_api
+from replenishment_api import get_replenishment_index
+from replenishment_snapshots import save_replenishment_snapshot
+
+def test_index_reloads_snapshots_saved_by_other_processes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(replenishment_api, '_current_index', None)
+    assert get_replenishment_index() is None
+
+    first_path = save_replenishment_snapshot(pd.DataFrame({'sku': ['A'], 'on_hand': [1]}))
+    index = get_replenishment_index()
+    assert index.query()['rows'] == [{'sku': 'A', 'on_hand': 1}]
+    assert get_replenishment_index() is index
+
+    # A run in another process saves a newer snapshot, possibly within the same second
+    second_path = save_replenishment_snapshot(pd.DataFrame({'sku': ['A', 'B'], 'on_hand': [2, 3]}))
+    if second_path == first_path:
+        os.utime(second_path, ns=(os.stat(second_path).st_mtime_ns + 10**9,) * 2)
+    reloaded = get_replenishment_index()
+    assert reloaded.query()['total'] == 2
+    assert reloaded.etag != index.etag
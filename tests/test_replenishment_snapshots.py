@@ -0,0 +1,47 @@
+import sys
+import os
+from datetime import datetime
+import pandas as pd
+
+# Add the project directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import replenishment_snapshots
+from replenishment_snapshots import save_replenishment_snapshot, load_replenishment_snapshot, read_snapshot_metadata, diff_snapshots, list_snapshots, snapshot_path
+
+def replenishment_df():
+    return pd.DataFrame({'sku': ['A', 'B'], 'on_hand': pd.array([1, 2], dtype='int32')})
+
+def test_snapshot_round_trip(tmp_path):
+    path = save_replenishment_snapshot(replenishment_df(), snapshot_dir=str(tmp_path))
+    assert path.endswith('.parquet')
+    pd.testing.assert_frame_equal(load_replenishment_snapshot(snapshot_dir=str(tmp_path)), replenishment_df())
+    assert read_snapshot_metadata(path)['rows'] == 2
+
+def test_snapshot_falls_back_to_pickle_without_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setattr(replenishment_snapshots, 'pa', None)
+    path = save_replenishment_snapshot(replenishment_df(), snapshot_dir=str(tmp_path))
+    assert path.endswith('.pkl')
+    loaded_df = load_replenishment_snapshot(snapshot_dir=str(tmp_path))
+    pd.testing.assert_frame_equal(loaded_df, replenishment_df())
+    assert read_snapshot_metadata(path)['columns'] == {'sku': 'str', 'on_hand': 'int32'}
+
+def test_snapshots_past_retention_are_pruned(tmp_path):
+    # Snapshots of earlier runs, moved to the names they would have had then
+    for created_at in (datetime(2020, 1, 1), datetime.now().replace(microsecond=0)):
+        path = save_replenishment_snapshot(replenishment_df(), snapshot_dir=str(tmp_path))
+        os.replace(path, snapshot_path('replenishment', created_at, str(tmp_path)))
+    other_label = save_replenishment_snapshot(replenishment_df(), label='other', snapshot_dir=str(tmp_path))
+    os.replace(other_label, snapshot_path('other', datetime(2020, 1, 1), str(tmp_path)))
+
+    latest_path = save_replenishment_snapshot(replenishment_df(), snapshot_dir=str(tmp_path), retention_days=30)
+    snapshots = list_snapshots(snapshot_dir=str(tmp_path))
+    assert datetime(2020, 1, 1) not in [created_at for created_at, path in snapshots]
+    assert snapshots[-1][1] == latest_path
+    # Snapshots of other labels are left alone
+    assert len(list_snapshots('other', str(tmp_path))) == 1
+
+def test_diff_snapshots():
+    new_df = pd.DataFrame({'sku': ['B', 'C'], 'on_hand': pd.array([5, 3], dtype='int32')})
+    differences = diff_snapshots(replenishment_df(), new_df)
+    assert sorted(zip(differences['sku'], differences['column'])) == [('A', '<removed>'), ('B', 'on_hand'), ('C', '<added>')]
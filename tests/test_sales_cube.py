@@ -0,0 +1,58 @@
+import sys
+import os
+import numpy as np
+from datetime import date, datetime, timedelta, timezone
+
+# Add the project directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sales_cube import SalesCube, most_recent_sunday
+
+def open_cube(tmp_path):
+    return SalesCube(path=str(tmp_path / 'sales_cube.npy'), index_path=str(tmp_path / 'sales_cube_index.json'))
+
+def test_update_replaces_the_window_and_sums_line_items(tmp_path):
+    cube = open_cube(tmp_path)
+    monday = date(2024, 1, 1)
+    cube.update([monday, monday, monday + timedelta(days=1)], ['A', 'A', 'B'], [1, 2, 5])
+    cube.update([monday + timedelta(days=1)], ['A'], [4], window_start=monday + timedelta(days=1), window_end=monday + timedelta(days=1))
+
+    daily = cube.window(monday + timedelta(days=1), 2)
+    assert daily[:, cube.skus.lookup(['A', 'B'])].tolist() == [[3, 0], [4, 0]]
+
+def test_update_with_scope_leaves_other_skus(tmp_path):
+    cube = open_cube(tmp_path)
+    day = date(2024, 1, 1)
+    cube.update([day, day], ['A', 'B'], [1, 2])
+    cube.update([day, day], ['A', 'B'], [7, 9], window_start=day, window_end=day, scope=['A'])
+    assert cube.window(day, 1)[0, cube.skus.lookup(['A', 'B'])].tolist() == [7, 2]
+
+def test_older_fetch_keeps_newer_days(tmp_path):
+    today = date(2024, 3, 10)
+    fresh_at = datetime(2024, 3, 10, 12, tzinfo=timezone.utc)
+    stale_at = datetime(2024, 3, 6, 12, tzinfo=timezone.utc)
+    window_start = date(2024, 3, 1)
+
+    # A fresh fetch covering up to today
+    cube = open_cube(tmp_path)
+    fresh_days = [window_start + timedelta(days=i) for i in range(10)]
+    cube.update(fresh_days, ['A'] * 10, [1] * 10, window_start=window_start, window_end=today, fetched_at=fresh_at)
+
+    # An older cached fetch, taken on the 6th, must not wipe the 6th onwards
+    cube = open_cube(tmp_path)
+    stale_days = [window_start + timedelta(days=i) for i in range(6)]
+    cube.update(stale_days, ['A'] * 6, [2] * 6, window_start=window_start, window_end=stale_at.date(), fetched_at=stale_at)
+
+    sales = open_cube(tmp_path).window(today, 10)[:, cube.skus.lookup(['A'])[0]]
+    assert sales.tolist() == [2] * 5 + [1] * 5
+    assert open_cube(tmp_path).fetched_at == fresh_at
+
+def test_weekly_sales_labels_and_totals(tmp_path):
+    cube = open_cube(tmp_path)
+    end_date = most_recent_sunday(date(2024, 3, 13))
+    assert end_date == date(2024, 3, 10)
+    cube.update([end_date, end_date - timedelta(days=7)], ['A', 'A'], [3, 4])
+    sales_df = cube.weekly_sales(weeks=2, end_date=end_date)
+    assert list(sales_df.columns) == ['sku', 'sales_1_weeks_ago_Mar04', 'sales_2_weeks_ago_Feb26']
+    assert sales_df.iloc[0].tolist() == ['A', 3, 4]
+    assert np.issubdtype(sales_df['sales_1_weeks_ago_Mar04'].dtype, np.integer)
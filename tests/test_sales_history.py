@@ -0,0 +1,85 @@
+import sys
+import os
+import types
+from datetime import date, datetime, timezone
+
+# Add the project directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bulk_jsonl import BulkOutput
+from sales_history import SalesHistory, backfill_sales_history
+
+def sales_rows(line_items):
+    """Bulk sales output with one order per (line item id, order date, sku, quantity)."""
+    rows = []
+    for line_item_id, order_date, sku, quantity in line_items:
+        order_id = f"gid://shopify/Order/{line_item_id}"
+        rows.append({'id': order_id, 'createdAt': f"{order_date}T12:00:00Z"})
+        rows.append({'id': f"gid://shopify/LineItem/{line_item_id}", 'sku': sku, 'quantity': quantity, '__parentId': order_id})
+    return rows
+
+def stored(sales_history):
+    return sales_history.query("SELECT line_item_id, order_date, sku, quantity FROM line_items ORDER BY line_item_id").values.tolist()
+
+def test_ingest_replaces_only_the_fetch_window(tmp_path):
+    sales_history = SalesHistory(path=str(tmp_path / 'history.db'))
+    sales_history.ingest(sales_rows([(1, '2024-01-01', 'A', 1), (2, '2024-01-10', 'A', 2), (3, '2024-01-20', 'B', 3)]))
+
+    # Line item 2 was cancelled; the fetch covered the 5th to the 15th only
+    fetched_at = datetime(2024, 1, 25, tzinfo=timezone.utc)
+    rows = BulkOutput(sales_rows([(4, '2024-01-12', ' B ', 4)]), window_start=date(2024, 1, 5), window_end=date(2024, 1, 15), fetched_at=fetched_at)
+    assert sales_history.ingest(rows) == 1
+    assert stored(sales_history) == [
+        ['gid://shopify/LineItem/1', '2024-01-01', 'A', 1],
+        ['gid://shopify/LineItem/3', '2024-01-20', 'B', 3],
+        ['gid://shopify/LineItem/4', '2024-01-12', 'B', 4],
+    ]
+
+def test_older_fetch_keeps_newer_days(tmp_path):
+    sales_history = SalesHistory(path=str(tmp_path / 'history.db'))
+    newer = BulkOutput(sales_rows([(1, '2024-01-10', 'A', 1), (2, '2024-01-20', 'A', 2)]),
+                       window_start=date(2024, 1, 1), window_end=date(2024, 1, 21), fetched_at=datetime(2024, 1, 21, tzinfo=timezone.utc))
+    sales_history.ingest(newer)
+
+    # A cached output fetched on the 15th only replaces the days before it
+    older = BulkOutput(sales_rows([(1, '2024-01-10', 'A', 5)]),
+                       window_start=date(2024, 1, 1), window_end=date(2024, 1, 15), fetched_at=datetime(2024, 1, 15, tzinfo=timezone.utc))
+    assert sales_history.ingest(older) == 1
+    assert stored(sales_history) == [
+        ['gid://shopify/LineItem/1', '2024-01-10', 'A', 5],
+        ['gid://shopify/LineItem/2', '2024-01-20', 'A', 2],
+    ]
+
+def test_scoped_ingest_keeps_other_skus(tmp_path):
+    sales_history = SalesHistory(path=str(tmp_path / 'history.db'))
+    sales_history.ingest(sales_rows([(1, '2024-01-10', 'A', 1), (2, '2024-01-10', 'B', 2)]))
+    sales_history.ingest(sales_rows([(3, '2024-01-10', 'A', 3), (4, '2024-01-10', 'B', 4)]), window_start=date(2024, 1, 1), scope=['A'])
+    assert [row[0] for row in stored(sales_history)] == ['gid://shopify/LineItem/2', 'gid://shopify/LineItem/3']
+
+def test_failed_fetch_ingests_nothing(tmp_path, monkeypatch):
+    sales_history = SalesHistory(path=str(tmp_path / 'history.db'))
+    sales_history.ingest(sales_rows([(1, '2024-01-10', 'A', 1)]))
+    assert sales_history.ingest(None) == 0
+
+    fetch_data = types.ModuleType('fetch_data')
+    fetch_data.fetch_shopify_sales_data = lambda weeks, until: None
+    monkeypatch.setitem(sys.modules, 'fetch_data', fetch_data)
+    backfill_sales_history(weeks=26, until=date(2024, 2, 1), sales_history=sales_history)
+    assert len(stored(sales_history)) == 1
+
+def test_history_sales_aggregates(tmp_path):
+    sales_history = SalesHistory(path=str(tmp_path / 'history.db'))
+    sales_history.ingest(sales_rows([
+        (1, '2022-12-20', 'A', 1),   # in the weeks before the same week last year
+        (2, '2023-02-10', 'A', 2),   # in the weeks after it, and in the past 52 weeks
+        (3, '2023-12-20', 'A', 4),   # in the past 52 weeks
+        (4, '2023-12-20', 'B', 8),
+    ]))
+    end_date = date(2024, 1, 7)
+    history_sales_df = sales_history.history_sales(months=2, weeks=8, end_date=end_date).set_index('sku')
+    assert history_sales_df.loc['A', 'sales_last_52_weeks'] == 6
+    assert history_sales_df.loc['A', 'sales_8_weeks_last_year'] == 1
+    assert history_sales_df.loc['A', 'sales_next_8_weeks_last_year'] == 2
+    assert history_sales_df.loc['B', 'sales_last_52_weeks'] == 8
+    assert history_sales_df.loc['A', 'sales_month_2023_12'] == 4
+    assert history_sales_df.loc['A', 'sales_month_2023_11'] == 0
@@ -0,0 +1,65 @@
+import sys
+import os
+import threading
+import time
+
+# Add the project directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from shiphero_scheduler import ShipheroCreditScheduler, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND, DEFAULT_REQUEST_COST
+
+def throttling(cost, credits_remaining, max_available=4004, increment_rate=60):
+    return {'extensions': {'throttling': {'cost': cost, 'user_quota': {
+        'credits_remaining': credits_remaining, 'max_available': max_available, 'increment_rate': increment_rate}}}}
+
+def test_release_learns_query_cost_and_quota():
+    scheduler = ShipheroCreditScheduler()
+    assert scheduler.expected_cost('stock') == DEFAULT_REQUEST_COST
+    with scheduler.request('stock') as outcome:
+        outcome['result'] = throttling(cost=250, credits_remaining=3000, max_available=2002, increment_rate=30)
+    assert scheduler.expected_cost('stock') == 250
+    assert scheduler.max_credits == 2002
+    assert scheduler.increment_rate == 30
+    assert scheduler.in_flight == 0 and scheduler.reserved == 0
+    assert 3000 <= scheduler.credits < 3001
+
+def test_reported_balance_excludes_requests_in_flight():
+    scheduler = ShipheroCreditScheduler()
+    first_cost = scheduler.acquire('a')
+    second_cost = scheduler.acquire('b')
+    scheduler.release('a', first_cost, throttling(cost=100, credits_remaining=1000))
+    # The second request has not been charged in the reported balance yet
+    assert 1000 - second_cost <= scheduler.credits < 1000 - second_cost + 1
+    scheduler.release('b', second_cost)
+    assert scheduler.in_flight == 0 and scheduler.reserved == 0
+
+def test_throttled_request_pauses_the_bucket():
+    scheduler = ShipheroCreditScheduler()
+    with scheduler.request('stock') as outcome:
+        outcome['throttled_for'] = 30
+    assert scheduler.credits == 0
+    assert scheduler.paused_until > time.monotonic() + 29
+
+def test_requests_are_granted_in_priority_order():
+    scheduler = ShipheroCreditScheduler()
+    scheduler.increment_rate = 200
+    scheduler.credits = 0
+    granted = []
+
+    def request(name, priority):
+        with scheduler.request(name, priority):
+            granted.append(name)
+
+    # Queue a background request before an interactive one while the bucket is empty
+    threads = [threading.Thread(target=request, args=('background', PRIORITY_BACKGROUND))]
+    threads[0].start()
+    while not scheduler.queue:
+        time.sleep(0.001)
+    with scheduler.condition:
+        threads.append(threading.Thread(target=request, args=('interactive', PRIORITY_INTERACTIVE)))
+        threads[1].start()
+        while len(scheduler.queue) < 2:
+            scheduler.condition.wait(timeout=0.01)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert granted == ['interactive', 'background']
@@ -0,0 +1,55 @@
+import sys
+import os
+import types
+import importlib
+import pytest
+
+# Add the project directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+CONFIG_NAMES = [
+    'AIRTABLE_API_KEY', 'AIRTABLE_VARIANTS_ENDPOINT', 'AIRTABLE_PRODUCTION_DEV_BASE_ID', 'SHIPHERO_WAREHOUSE_ID',
+    'SHIPHERO_API_TOKEN', 'SHIPHERO_REFRESH_TOKEN', 'SHIPHERO_REFRESH_ENDPOINT', 'SHIPHERO_GRAPHQL_ENDPOINT', 'SHIPHERO_TOKEN_EXPIRATION',
+    'SHOPIFY_API_TOKEN', 'SHOPIFY_GRAPHQL_ENDPOINT',
+]
+
+class FakeTable:
+    def __init__(self, records):
+        self.records = records
+        self.updates = []
+
+    def all(self, formula=None):
+        return self.records
+
+    def batch_update(self, records):
+        self.updates.extend(records)
+
+@pytest.fixture
+def shiphero_webhooks(monkeypatch):
+    config = types.ModuleType('config')
+    for name in CONFIG_NAMES:
+        setattr(config, name, name.lower())
+    monkeypatch.setitem(sys.modules, 'config', config)
+    for module in ('utils', 'stock_locations', 'transform_data', 'fetch_data', 'sync_shiphero', 'shiphero_webhooks'):
+        monkeypatch.delitem(sys.modules, module, raising=False)
+    return importlib.import_module('shiphero_webhooks')
+
+def test_events_sharing_a_po_number_are_all_synced(shiphero_webhooks, tmp_path, monkeypatch):
+    tables = {
+        'Purchase Orders': FakeTable([{'id': 'rec1', 'fields': {'PO #': '1001'}}]),
+        'Line Items': FakeTable([]),
+    }
+    monkeypatch.setattr(shiphero_webhooks, 'get_airtable_table', lambda name: tables[name])
+    monkeypatch.setattr(shiphero_webhooks, 'fetch_purchase_order_from_shiphero', lambda po_id: {'po_number': '1001'})
+    monkeypatch.setattr(shiphero_webhooks, 'shiphero_po_updates', lambda airtable_po, shiphero_po: ({'id': airtable_po['id'], 'fields': {}}, []))
+
+    # The same PO queued under its legacy and its current id
+    queue = shiphero_webhooks.WebhookQueue(path=str(tmp_path / 'queue.db'))
+    queue.put('123', '1001')
+    queue.put('UHVyY2hhc2VPcmRlcjoxMjM=', '1001')
+    synced, failed = shiphero_webhooks.sync_purchase_orders_by_id(queue.pending())
+    assert len(synced) == 2 and failed == []
+    assert len(tables['Purchase Orders'].updates) == 1
+
+    queue.done(synced)
+    assert queue.pending() == []
@@ -0,0 +1,35 @@
+import sys
+import os
+import types
+import importlib
+import json
+import pytest
+
+# Add the project directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+CONFIG_NAMES = [
+    'AIRTABLE_API_KEY', 'AIRTABLE_VARIANTS_ENDPOINT', 'AIRTABLE_PRODUCTION_DEV_BASE_ID', 'SHIPHERO_WAREHOUSE_ID',
+    'SHIPHERO_API_TOKEN', 'SHIPHERO_REFRESH_TOKEN', 'SHIPHERO_REFRESH_ENDPOINT', 'SHIPHERO_GRAPHQL_ENDPOINT', 'SHIPHERO_TOKEN_EXPIRATION',
+    'SHOPIFY_API_TOKEN', 'SHOPIFY_GRAPHQL_ENDPOINT',
+]
+
+@pytest.fixture
+def fetch_data(monkeypatch):
+    config = types.ModuleType('config')
+    for name in CONFIG_NAMES:
+        setattr(config, name, name.lower())
+    monkeypatch.setitem(sys.modules, 'config', config)
+    for module in ('utils', 'stock_locations', 'transform_data', 'fetch_data'):
+        monkeypatch.delitem(sys.modules, module, raising=False)
+    return importlib.import_module('fetch_data')
+
+def test_plain_skus_are_quoted(fetch_data):
+    assert fetch_data.shopify_sku_filter(['A-1', 'B 2']) == "(sku:'A-1' OR sku:'B 2')"
+
+def test_quotes_and_backslashes_in_skus_are_escaped(fetch_data):
+    sku_filter = fetch_data.shopify_sku_filter(["O'Neil", 'A\\B', 'say "hi" OR sku:*'])
+    # The filter replaces SKU_FILTER inside a double-quoted GraphQL string; decoding that string
+    # gives the search query Shopify sees, with every SKU one escaped single-quoted term
+    search_query = json.loads('"' + sku_filter + '"')
+    assert search_query == "(sku:'O\\'Neil' OR sku:'A\\\\B' OR sku:'say \"hi\" OR sku:*')"
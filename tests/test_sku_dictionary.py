@@ -0,0 +1,57 @@
+import sys
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+# Add the project directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sku_dictionary import SkuDictionary, join_on_sku, normalized_skus
+
+@pytest.fixture(autouse=True)
+def shared_dictionary(tmp_path, monkeypatch):
+    # join_on_sku encodes through the shared dictionary and saves it under cache/
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('sku_dictionary._shared_dictionary', SkuDictionary())
+
+def test_encode_assigns_codes_in_order_of_first_appearance():
+    sku_dictionary = SkuDictionary(['A'])
+    codes = sku_dictionary.encode(['B', ' A ', 'C', 'B', ['C'], None])
+    assert codes.tolist() == [1, 0, 2, 1, 2, 3]
+    assert sku_dictionary.skus == ['A', 'B', 'C', '']
+    assert sku_dictionary.dirty
+
+def test_lookup_returns_minus_one_for_unknown_skus():
+    sku_dictionary = SkuDictionary(['A', 'B'])
+    assert sku_dictionary.lookup(['B', 'X', 'A ']).tolist() == [1, -1, 0]
+    assert len(sku_dictionary) == 2
+
+def test_normalized_skus_matches_normalize_sku():
+    assert normalized_skus(pd.Series([' A', 'B ', None])).tolist() == ['A', 'B', '']
+    assert normalized_skus([['A'], [], 12, None]).tolist() == ['A', '', '12', '']
+
+def test_join_on_sku_matches_merge():
+    left_df = pd.DataFrame({'sku': ['C', 'A', 'X', 'B'], 'on_hand': [3, 1, 9, 2]})
+    right_df = pd.DataFrame({'sku': ['A', 'B', 'C'], 'sales': [10, 20, 30]})
+    joined_df = join_on_sku(left_df, right_df, how='left')
+    merged_df = left_df.merge(right_df, on='sku', how='left')
+    assert joined_df['sku'].tolist() == merged_df['sku'].tolist()
+    assert np.array_equal(joined_df['sales'].to_numpy(), merged_df['sales'].to_numpy(), equal_nan=True)
+
+    inner_df = join_on_sku(left_df, right_df, how='inner')
+    assert inner_df['sku'].tolist() == ['C', 'A', 'B']
+    assert inner_df['sales'].tolist() == [30, 10, 20]
+
+def test_join_on_sku_normalizes_keys():
+    left_df = pd.DataFrame({'SKU': [' A ', 'B']})
+    right_df = pd.DataFrame({'sku': [['A'], 'B '], 'incoming': [5, 6]})
+    joined_df = join_on_sku(left_df, right_df, left_on='SKU', right_on='sku')
+    assert joined_df['incoming'].tolist() == [5, 6]
+
+def test_join_on_sku_keeps_the_first_duplicate_right_sku(capsys):
+    left_df = pd.DataFrame({'sku': ['B', 'A']})
+    right_df = pd.DataFrame({'sku': ['A', 'B', 'A '], 'sales': [1, 2, 3]})
+    joined_df = join_on_sku(left_df, right_df)
+    assert joined_df['sales'].tolist() == [2, 1]
+    assert "1 SKUs occur more than once" in capsys.readouterr().out
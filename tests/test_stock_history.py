@@ -0,0 +1,32 @@
+import sys
+import os
+import numpy as np
+from datetime import date
+
+# Add the project directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from stock_history import in_stock_matrix
+
+def write_snapshot(history_dir, day, name, sku_codes, on_hand, committed):
+    partition_dir = history_dir / f"date={day.strftime('%Y-%m-%d')}"
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(
+        partition_dir / f"snapshot_{name}.npz",
+        sku_code=np.array(sku_codes, dtype=np.int32),
+        on_hand=np.array(on_hand, dtype=np.int32),
+        committed=np.array(committed, dtype=np.int32),
+        incoming=np.zeros(len(sku_codes), dtype=np.int32)
+    )
+
+def test_in_stock_when_any_snapshot_of_the_day_has_available_stock(tmp_path):
+    write_snapshot(tmp_path, date(2024, 3, 1), '090000', [0, 1], [0, 5], [0, 5])
+    write_snapshot(tmp_path, date(2024, 3, 1), '150000', [0, 1], [3, 5], [0, 5])
+    in_stock = in_stock_matrix(date(2024, 3, 1), 1, 2, history_dir=str(tmp_path))
+    assert in_stock.tolist() == [[True, False]]
+
+def test_days_and_skus_without_snapshots_count_as_in_stock(tmp_path):
+    # SKU 2 is missing from the snapshot of the 2nd (e.g. a scoped or partial fetch), the 3rd has no snapshot
+    write_snapshot(tmp_path, date(2024, 3, 2), '090000', [0, 1], [0, 1], [0, 0])
+    in_stock = in_stock_matrix(date(2024, 3, 1), 3, 3, history_dir=str(tmp_path))
+    assert in_stock.tolist() == [[True, True, True], [False, True, True], [True, True, True]]
@@ -0,0 +1,33 @@
+import sys
+import os
+import types
+import importlib
+import pytest
+
+# Add the project directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+def stock_locations_with(monkeypatch, locations):
+    monkeypatch.setitem(sys.modules, 'config', types.SimpleNamespace(STOCK_LOCATIONS=locations))
+    monkeypatch.delitem(sys.modules, 'stock_locations', raising=False)
+    return importlib.import_module('stock_locations')
+
+def location(name, warehouse_id, shopify_location_id):
+    return {'name': name, 'shiphero_warehouse_id': warehouse_id, 'shopify_location_id': shopify_location_id}
+
+def test_locations_are_validated(monkeypatch):
+    locations = [location('main', 'W1', 'L1'), location('east', 'W2', 'L2')]
+    stock_locations = stock_locations_with(monkeypatch, locations)
+    assert stock_locations.get_stock_locations() == locations
+    assert stock_locations.location_stock_columns()[:3] == ['on_hand_main', 'committed_main', 'available_main']
+
+@pytest.mark.parametrize('locations, message', [
+    ([], 'is empty'),
+    ([{'name': 'main', 'shiphero_warehouse_id': 'W1'}], 'missing shopify_location_id'),
+    ([location('main', 'W1', 'L1'), location('main', 'W2', 'L2')], 'name'),
+    ([location('main', 'W1', 'L1'), location('east', 'W1', 'L2')], 'shiphero_warehouse_id'),
+])
+def test_invalid_locations_are_rejected(monkeypatch, locations, message):
+    stock_locations = stock_locations_with(monkeypatch, locations)
+    with pytest.raises(ValueError, match=message):
+        stock_locations.get_stock_locations()
@@ -0,0 +1,68 @@
+import sys
+import os
+import pytest
+
+# Add the project directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from write_journal import WriteJournal, StepInDoubt
+
+class Crash(Exception):
+    pass
+
+def crash():
+    raise Crash()
+
+def test_done_steps_are_skipped_by_the_resumed_run(tmp_path):
+    path = str(tmp_path / 'journal.db')
+    journal = WriteJournal('job', path=path)
+    assert journal.run_step('a', lambda: {'id': 1}) == {'id': 1}
+
+    resumed = WriteJournal('job', path=path)
+    assert resumed.resumed and resumed.run_id == journal.run_id
+    assert resumed.run_step('a', crash) == {'id': 1}
+
+def test_completed_runs_are_not_resumed(tmp_path):
+    path = str(tmp_path / 'journal.db')
+    journal = WriteJournal('job', path=path)
+    journal.run_step('a', lambda: 1)
+    journal.complete()
+
+    next_journal = WriteJournal('job', path=path)
+    assert not next_journal.resumed
+    assert next_journal.run_step('a', lambda: 2) == 2
+
+def test_planned_step_without_recover_is_in_doubt(tmp_path):
+    path = str(tmp_path / 'journal.db')
+    with pytest.raises(Crash):
+        WriteJournal('job', path=path).run_step('a', crash)
+
+    resumed = WriteJournal('job', path=path)
+    with pytest.raises(StepInDoubt):
+        resumed.run_step('a', lambda: 1)
+
+    # Once checked by hand, a forgotten step is sent again
+    resumed.forget('a')
+    assert resumed.run_step('a', lambda: 1) == 1
+
+def test_planned_step_is_recovered_or_sent_again(tmp_path):
+    path = str(tmp_path / 'journal.db')
+    journal = WriteJournal('job', path=path)
+    for step in ('landed', 'lost'):
+        with pytest.raises(Crash):
+            journal.run_step(step, crash, payload={'po_number': step})
+
+    resumed = WriteJournal('job', path=path)
+    recover = lambda payload: {'id': payload['po_number']} if payload['po_number'] == 'landed' else None
+    assert resumed.run_step('landed', crash, recover=recover) == {'id': 'landed'}
+    assert resumed.run_step('lost', lambda: {'id': 'sent'}, recover=recover) == {'id': 'sent'}
+    assert resumed.lookup('lost')[0] == 'done'
+
+def test_run_with_another_plan_is_abandoned(tmp_path):
+    path = str(tmp_path / 'journal.db')
+    journal = WriteJournal('job', plan_key='plan-1', path=path)
+    journal.run_step('a', lambda: 1)
+
+    other = WriteJournal('job', plan_key='plan-2', path=path)
+    assert not other.resumed and other.run_id != journal.run_id
+    assert WriteJournal('job', plan_key='plan-1', path=path).run_id != journal.run_id
@@ -1,162 +1,311 @@
+import os, multiprocessing
+from collections import deque
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-
-def transform_stock_levels(stock_levels_data, incoming_stock_data, committed_stock_data):
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import config
+from sku_dictionary import join_on_sku, get_sku_dictionary, row_positions
+from stock_locations import get_stock_locations
+from sales_cube import SalesCube
+from bulk_jsonl import normalize_bulk_jsonl, gid_type, row_id
+from arrow_batches import is_arrow_table
+
+# Airtable "Variants" fields fetched for the PO Builder, with how each one is normalized:
+#   text   - plain text; lookups/arrays are joined into one comma separated string
+#   number - numeric; single-value lookups are flattened to their value
+AIRTABLE_VARIANT_FIELDS = {
+    'SKU': 'text',
+    'Product Number': 'text',
+    'Product Name': 'text',
+    'Option1 Value': 'text',
+    'Position': 'text',
+    'Supplier (Plain Text)': 'text',
+    'Status Shopify (Shopify)': 'text',
+    'Stocked Status': 'text',
+    'Decoration Group (Plain Text)': 'text',
+    'Artwork (Title)': 'text',
+    'Cost-Production: Total': 'number',
+    'Category': 'text',
+    'Subcategory': 'text',
+    'Product Type (Internal)': 'text',
+    'Component Brand': 'text',
+    'Component Style Number': 'text',
+    'Component Style Name': 'text',
+    'Component Color': 'text',
+    'Blank Preferred Supplier': 'text',
+    'Blank Backup Supplier(s)': 'text'
+}
+
+# Bulk output specs for normalize_bulk_jsonl
+COMMITTED_BULK_SPECS = {
+    'ProductVariant': {
+        'columns': {'sku': 'sku'}
+    },
+    'InventoryLevel': {
+        'columns': {
+            'location_id': lambda row: row['location']['id'],
+            'committed': lambda row: next((q["quantity"] for q in row["quantities"] if q["name"] == "committed"), 0)
+        },
+        'parent': 'ProductVariant',
+        'parent_columns': {'sku': 'sku'},
+        'dtypes': {'committed': 'int32'}
+    }
+}
+
+SALES_BULK_SPECS = {
+    'Order': {
+        'columns': {'order_date': lambda row: datetime.strptime(row['createdAt'], "%Y-%m-%dT%H:%M:%SZ").date()}
+    },
+    'LineItem': {
+        'columns': {'sku': 'sku', 'quantity': 'quantity'},
+        'parent': 'Order',
+        'parent_columns': {'order_date': 'order_date'},
+        'require_parent': True,
+        'dtypes': {'quantity': 'int32'}
+    }
+}
+
+def transform_stock_levels(stock_levels_data, incoming_stock_data, committed_stock_data, locations=None):
     """
     Transform stock levels data into a DataFrame
-    """
-
-    # Convert stock_levels_data to a DataFrame with only SKU and On Hand
-    stock_levels_df = pd.DataFrame([{
-        "SKU": product["node"]["sku"],
-        "On Hand": product["node"]["on_hand"]
-    } for product in stock_levels_data])
 
-    # Merge stock_levels_df with incoming_stock_data on SKU
-    stock_levels = stock_levels_df.merge(incoming_stock_data, how="left", left_on="SKU", right_on="sku")
+    On-hand stock of every configured warehouse and committed stock of every configured
+    Shopify location are summed into location-by-SKU matrices in one pass, giving one row
+    per SKU with total On Hand, committed, Available and Backorder, and with more than one
+    location, on_hand_<name>, committed_<name> and available_<name> columns per location.
+    """
 
-    # Fill NaN values in the 'incoming' column with 0
+    locations = locations or get_stock_locations()
+    warehouse_index = {location['shiphero_warehouse_id']: i for i, location in enumerate(locations)}
+    location_index = {location['shopify_location_id']: i for i, location in enumerate(locations)}
+
+    # ShipHero stock as flat columns; stock cached before warehouses were tagged belongs to the first location
+    if is_arrow_table(stock_levels_data):
+        stock_skus = stock_levels_data.column("sku").to_pylist()
+        on_hand = stock_levels_data.column("on_hand").to_numpy(zero_copy_only=False)
+        warehouse_ids = stock_levels_data.column("warehouse_id").to_pylist() if "warehouse_id" in stock_levels_data.column_names else [None] * len(stock_skus)
+    else:
+        nodes = [product["node"] for product in stock_levels_data]
+        stock_skus = [node["sku"] for node in nodes]
+        on_hand = np.array([node["on_hand"] or 0 for node in nodes], dtype=np.int64)
+        warehouse_ids = [node.get("warehouse_id") for node in nodes]
+    stock_locations = np.array([warehouse_index.get(warehouse_id, 0 if warehouse_id is None else -1) for warehouse_id in warehouse_ids], dtype=np.int64)
+
+    # Normalize variants and their inventory levels in one pass, keeping the configured locations
+    committed_df = normalize_bulk_jsonl(committed_stock_data, COMMITTED_BULK_SPECS)['InventoryLevel']
+    committed_df = committed_df[committed_df["location_id"].isin(location_index)]
+
+    # One row per SKU with ShipHero stock, in order of first appearance
+    sku_dictionary = get_sku_dictionary()
+    stock_codes = sku_dictionary.encode(stock_skus)
+    committed_codes = sku_dictionary.encode(committed_df["sku"].tolist())
+    sku_dictionary.save()
+    _, first_rows = np.unique(stock_codes, return_index=True)
+    sku_codes = stock_codes[np.sort(first_rows)]
+
+    # Location-by-SKU matrices of on-hand and committed stock
+    on_hand_matrix = np.zeros((len(locations), len(sku_codes)), dtype=np.int64)
+    stock_rows = row_positions(stock_codes, sku_codes)
+    known = stock_locations >= 0
+    np.add.at(on_hand_matrix, (stock_locations[known], stock_rows[known]), np.nan_to_num(on_hand[known]).astype(np.int64))
+
+    committed_matrix = np.zeros((len(locations), len(sku_codes)), dtype=np.int64)
+    committed_rows = row_positions(committed_codes, sku_codes)
+    committed_locations = committed_df["location_id"].map(location_index).to_numpy(dtype=np.int64)
+    stocked = committed_rows >= 0
+    np.add.at(committed_matrix, (committed_locations[stocked], committed_rows[stocked]), committed_df["committed"].to_numpy(dtype=np.int64)[stocked])
+
+    stock_levels = pd.DataFrame({
+        "SKU": sku_dictionary.decode(sku_codes),
+        "On Hand": on_hand_matrix.sum(axis=0)
+    })
+
+    # Join incoming_stock_data onto stock_levels by SKU code
+    stock_levels = join_on_sku(stock_levels, incoming_stock_data, how="left", left_on="SKU", right_on="sku")
     stock_levels = stock_levels.assign(incoming=stock_levels["incoming"].fillna(0))
-
-    # Rename the 'incoming' column to 'Incoming Stock'
     stock_levels.rename(columns={"incoming": "Incoming Stock"}, inplace=True)
-
-    # Drop the redundant 'sku' column
     stock_levels.drop(columns=["sku"], inplace=True)
 
-    # Create DataFrame from committed_stock_data with "id" and "sku"
-    sku_df = pd.DataFrame([{
-        "id": item["id"],
-        "sku": item["sku"]
-    } for item in committed_stock_data if "sku" in item])
-
-    # Create DataFrame from committed_stock_data with "__parentId" and "committed"
-    committed_df = pd.DataFrame([{
-        "__parentId": item["__parentId"],
-        "committed": next((q["quantity"] for q in item["quantities"] if q["name"] == "committed"), 0)
-    } for item in committed_stock_data if "quantities" in item and item["location"]["id"] == "gid://shopify/Location/71392264438"])
-
-    # Merge the two DataFrames on "id" and "__parentId"
-    merged_df = committed_df.merge(sku_df, how="left", left_on="__parentId", right_on="id")
-
-    # Create a DataFrame with "sku" and "committed"
-    final_committed_df = merged_df[["sku", "committed"]]
+    # Totals: available is what is left after committed stock, backorder what is missing for it
+    net = on_hand_matrix.sum(axis=0) - committed_matrix.sum(axis=0)
+    stock_levels["committed"] = committed_matrix.sum(axis=0)
+    stock_levels["Available"] = np.clip(net, 0, None)
+    stock_levels["Backorder"] = np.clip(net, None, 0)
 
-    # Merge final_committed_df with stock_levels on SKU
-    stock_levels = stock_levels.merge(final_committed_df, how="left", left_on="SKU", right_on="sku")
+    # Per-location counts
+    if len(locations) > 1:
+        available_matrix = np.clip(on_hand_matrix - committed_matrix, 0, None)
+        for i, location in enumerate(locations):
+            stock_levels[f"on_hand_{location['name']}"] = on_hand_matrix[i]
+            stock_levels[f"committed_{location['name']}"] = committed_matrix[i]
+            stock_levels[f"available_{location['name']}"] = available_matrix[i]
 
-    # Fill NaN values in the 'committed' column with 0
-    stock_levels = stock_levels.assign(committed=stock_levels["committed"].fillna(0))
-
-    # Drop the redundant 'sku' column
-    stock_levels.drop(columns=["sku"], inplace=True)
-
-    # Create columns for 'Available'
-    stock_levels["Available"] = stock_levels.apply(lambda row: max(0, row["On Hand"] - row["committed"]), axis=1)
+    return stock_levels
 
-    #  Create columns for 'Backorder'
-    stock_levels["Backorder"] = stock_levels.apply(lambda row: min(0, row["On Hand"] - row["committed"]), axis=1)
+def normalize_airtable_column(values, kind):
+    """
+    Normalize the values of one Airtable field according to its kind
+    """
 
-    return stock_levels
+    if kind == 'number':
+        values = [value[0] if isinstance(value, list) and len(value) == 1 else value for value in values]
+        return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce')
+
+    normalized = []
+    for value in values:
+        if value is None:
+            normalized.append('')
+        elif isinstance(value, list):
+            normalized.append(', '.join(str(item) for item in value))
+        elif isinstance(value, str):
+            normalized.append(value)
+        else:
+            normalized.append(str(value))
+    return pd.Series(normalized, dtype=object)
 
 def transform_product_metadata(product_metadata):
     """
     Transform product metadata into a DataFrame
+
+    Columns are built one field at a time from AIRTABLE_VARIANT_FIELDS, so lookup and
+    array fields are flattened once per column instead of stringified cell by cell.
+    product_metadata may also be a pyarrow.Table from fetch_airtable_product_metadata(as_arrow=True).
     """
 
+    if is_arrow_table(product_metadata):
+        # Columns were already normalized page by page while fetching
+        product_metadata_df = product_metadata.to_pandas()
+        print("Product metadata transformed successfully")
+        return product_metadata_df
+
     if not product_metadata:
         print("No product metadata to transform")
         return None
 
-    product_metadata_df = pd.DataFrame(product_metadata)
+    # Keep fields that are not in the schema, normalized as text
+    field_kinds = dict(AIRTABLE_VARIANT_FIELDS)
+    for record in product_metadata:
+        for field in record:
+            field_kinds.setdefault(field, 'text')
+
+    columns = {
+        field: normalize_airtable_column([record.get(field) for record in product_metadata], kind)
+        for field, kind in field_kinds.items()
+    }
+    product_metadata_df = pd.DataFrame(columns)
     print("Product metadata transformed successfully")
 
-    # Convert all lists to strings
-    product_metadata_df = product_metadata_df.applymap(lambda x: str(x) if isinstance(x, list) else x)
-
     return product_metadata_df
 
-def transform_sales_data(sales_data):
+# Bulk sales output with at least this many rows is summed in a process pool
+PARALLEL_SALES_MIN_ROWS = 200000
+
+# Orders per chunk handed to a sales worker process
+SALES_CHUNK_ORDERS = 20000
+
+def sales_workers():
+    """Number of worker processes used to sum large sales outputs; override with SALES_PROCESS_WORKERS in config.py."""
+    workers = getattr(config, 'SALES_PROCESS_WORKERS', os.cpu_count() or 1)
+    if not isinstance(workers, int) or workers < 1:
+        raise ValueError(f"SALES_PROCESS_WORKERS in config.py must be a whole number of at least 1, not {workers!r}")
+    return workers
+
+def sales_process_context():
     """
-    Transform Shopify sales data into a time series DataFrame
+    Start method of the sales worker processes. They are not forked from the app, whose threads
+    (web server, cache warmer, schedulers) may hold locks that a forked child would inherit held.
     """
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(method)
 
+def sum_daily_sales(sales_data):
+    """
+    Normalize bulk sales rows and sum the quantities of their line items per order date and SKU.
+    Returns the sums, in order of first appearance, with the first and last order date (None without orders).
+    """
+    # Normalize orders and their line items in one pass over the bulk output
+    tables = normalize_bulk_jsonl(sales_data, SALES_BULK_SPECS)
+    orders_df = tables['Order']
+    line_items_df = tables['LineItem']
+    line_items_df = line_items_df[line_items_df['sku'].notna() & (line_items_df['sku'] != '')]
+
+    daily_sales_df = line_items_df.groupby(['order_date', 'sku'], sort=False)['quantity'].sum().reset_index()
+    if orders_df.empty:
+        return daily_sales_df, None, None
+    return daily_sales_df, orders_df['order_date'].min(), orders_df['order_date'].max()
+
+def order_chunks(sales_data, chunk_orders=SALES_CHUNK_ORDERS):
+    """
+    Split bulk sales rows into slices of chunk_orders orders. Shopify writes the line items of an
+    order right after it, so a chunk never separates an order from its line items.
+    """
+    start = 0
+    orders = 0
+    for i, row in enumerate(sales_data):
+        if gid_type(row_id(row)) == 'Order':
+            if orders == chunk_orders:
+                yield sales_data[start:i]
+                start = i
+                orders = 0
+            orders += 1
+    if start < len(sales_data):
+        yield sales_data[start:]
+
+def sum_daily_sales_parallel(sales_data, workers):
+    """
+    sum_daily_sales over chunks of orders in a process pool, with the same result.
+    At most two chunks per worker are in flight, so only a bounded slice of the output is
+    being copied to the workers at a time. The partial sums are concatenated in chunk order,
+    which keeps the SKUs in order of first appearance; sums of a date and SKU split across
+    chunks are added up when they are written to the sales cube.
+    """
+    partials = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=sales_process_context()) as executor:
+        futures = deque()
+        for chunk in order_chunks(sales_data):
+            if len(futures) >= workers * 2:
+                partials.append(futures.popleft().result())
+            futures.append(executor.submit(sum_daily_sales, chunk))
+        partials.extend(future.result() for future in futures)
+
+    daily_sales_df = pd.concat([partial_df for partial_df, _, _ in partials], ignore_index=True)
+    order_dates = [date for _, first, last in partials for date in (first, last) if date is not None]
+    return daily_sales_df, min(order_dates, default=None), max(order_dates, default=None)
+
+def transform_sales_data(sales_data, weeks=8, sales_cube=None, skus=None, window_start=None, workers=None):
+    """
+    Transform Shopify sales data into a time series DataFrame
 
-    # Separate orders and line items
-    orders = [item for item in sales_data if '__parentId' not in item]
-    line_items = [item for item in sales_data if '__parentId' in item]
-
-    # Process orders
-    for order in orders:
-        order['order_tags'] = ', '.join(order['tags'])
-        order['order_date'] = datetime.strptime(order['createdAt'], "%Y-%m-%dT%H:%M:%SZ").strftime("%Y-%m-%d")
-        del order['tags']
-        del order['createdAt']
-
-    # Create past week intervals
-    past_week_intervals = []
-    today = datetime.now()
-    most_recent_sunday = today - timedelta(days=today.weekday() + 1)
-
-    # Adjust for the case when today is Sunday
-    if today.weekday() == 6:
-        most_recent_sunday = today
-
-    # Generate intervals for the past 8 complete weeks
-    for i in range(0, 8):
-        week_end = most_recent_sunday - timedelta(days=i * 7)
-        week_start = week_end - timedelta(days=6)
-        past_week_intervals.append((week_start.strftime("%Y-%m-%d"), week_end.strftime("%Y-%m-%d"), i + 1))
-
-    # Debugging: Print past week intervals
-    print("Past Week Intervals:")
-    for interval in past_week_intervals:
-        print(interval)
-
-    # Assign weeks_ago to orders
-    for order in orders:
-        order_date = datetime.strptime(order['order_date'], "%Y-%m-%d")
-        order['weeks_ago'] = None  # Default to None
-        for week_start, week_end, weeks_ago in past_week_intervals:
-            if week_start <= order_date.strftime("%Y-%m-%d") <= week_end:
-                # Find the Sunday of the week interval
-                week_start_date = datetime.strptime(week_start, "%Y-%m-%d")
-                sunday_date = week_start_date.strftime("%b%d")
-                order['weeks_ago_string'] = f"sales_{weeks_ago}_weeks_ago_{sunday_date}"
-                break
-
-    # Convert orders and line items to DataFrames
-    orders_df = pd.DataFrame(orders)
-    line_items_df = pd.DataFrame(line_items)
-
-    # Convert quantity to integer
-    line_items_df['quantity'] = line_items_df['quantity'].astype(int)
-
-    # Rename columns
-    orders_df.rename(columns={'name': 'order_number'}, inplace=True)
-
-    # Merge orders and line items
-    line_items_and_orders = pd.merge(line_items_df, orders_df, left_on='__parentId', right_on='id', suffixes=('_line', '_order'))
-
-    # Create time series DataFrame
-    sales_df = line_items_and_orders.pivot_table(
-        index='sku',
-        columns='weeks_ago_string',
-        values='quantity',
-        aggfunc='sum',
-        fill_value=0
-    )
-
-    # Filter columns to keep only the past 8 complete weeks
-    sales_columns = [f"sales_{i}_weeks_ago_" for i in range(1, 9)]
-    sales_df = sales_df[[col for col in sales_df.columns if any(col.startswith(prefix) for prefix in sales_columns)]]
-
-    print(sales_df)
+    Line items are written day by day into the persistent sales cube, replacing the
+    days covered by sales_data (the window its fetch recorded, see BulkOutput), and the
+    sales_N_weeks_ago_* columns for the past `weeks` complete weeks are sliced from the cube.
+    With skus, only the sales of those SKUs are replaced from window_start (default: the
+    start of the fetch's window) and only their rows are returned.
+    Outputs of PARALLEL_SALES_MIN_ROWS rows or more are summed by `workers` processes
+    (default: sales_workers()); workers=1 sums in-process.
+    """
 
-    # Reset index to keep SKU as a column
-    sales_df.reset_index(inplace=True)
+    workers = workers or sales_workers()
+    if workers > 1 and len(sales_data) >= PARALLEL_SALES_MIN_ROWS:
+        print(f"Summing {len(sales_data)} sales rows in {workers} processes")
+        daily_sales_df, first_order_date, last_order_date = sum_daily_sales_parallel(sales_data, workers)
+    else:
+        daily_sales_df, first_order_date, last_order_date = sum_daily_sales(sales_data)
+
+    # Replace the days the fetch covered in the sales cube; outputs without a recorded window
+    # cover the days from their first to their last order
+    sales_cube = sales_cube or SalesCube()
+    window_start = window_start or getattr(sales_data, 'window_start', None) or first_order_date
+    window_end = getattr(sales_data, 'window_end', None) or last_order_date
+    if window_start is not None:
+        sales_cube.update(daily_sales_df['order_date'].tolist(), daily_sales_df['sku'].tolist(), daily_sales_df['quantity'].to_numpy(), window_start=window_start, window_end=window_end, scope=skus, fetched_at=getattr(sales_data, 'fetched_at', None))
+
+    # Slice the weekly time series from the cube
+    sales_df = sales_cube.weekly_sales(weeks=weeks)
+    if skus is not None:
+        sales_df = sales_df[sales_df['sku'].isin(skus)].reset_index(drop=True)
 
-    # Sort columns in descending order (most recent week first)
-    sales_df = sales_df.reindex(sorted(sales_df.columns, reverse=True), axis=1)
+    print(sales_df)
 
-    return sales_df
\ No newline at end of file
+    return sales_df
@@ -1,12 +1,14 @@
-import requests, os, time, json
+import requests, os, time, json, threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from config import SHIPHERO_API_TOKEN, SHIPHERO_REFRESH_TOKEN, SHIPHERO_REFRESH_ENDPOINT, SHIPHERO_GRAPHQL_ENDPOINT, SHIPHERO_TOKEN_EXPIRATION
 from config import SHOPIFY_API_TOKEN, SHOPIFY_GRAPHQL_ENDPOINT
+from shiphero_scheduler import scheduler
 
 # General purpose
 
 def export_df(df, label):
-    timestamp = datetime.now().strftime("%Y-%d-%m %H-%M-%S")
+    timestamp = datetime.now().strftime("%Y-%m-%d %H-%M-%S")
     output_dir = "output"
     output_path = os.path.join(output_dir, f"{label}_{timestamp}.csv")
     
@@ -21,7 +23,7 @@ def export_df(df, label):
     print(f"{label} saved to {output_path}")
 
 def export_json(data, label):
-    timestamp = datetime.now().strftime("%Y-%d-%m %H-%M-%S")
+    timestamp = datetime.now().strftime("%Y-%m-%d %H-%M-%S")
     output_dir = "output"
     output_path = os.path.join(output_dir, f"{label}_{timestamp}.json")
     
@@ -37,6 +39,13 @@ def export_json(data, label):
     
     print(f"{label} saved to {output_path}")
 
+# Airtable utility functions
+
+def airtable_string(value):
+    """Quoted Airtable formula string literal of value, with backslashes and quotes escaped."""
+    escaped = str(value).replace("\\", "\\\\").replace("'", "\\'")
+    return f"'{escaped}'"
+
 # Shiphero API utility functions
 
 def refresh_shiphero_token():
@@ -77,16 +86,19 @@ def is_token_expired():
     expiration_time = datetime.fromisoformat(SHIPHERO_TOKEN_EXPIRATION)
     return datetime.now() >= expiration_time
 
+shiphero_token_lock = threading.Lock()
+
 def fetch_shiphero_with_throttling(query, variables):
     global SHIPHERO_API_TOKEN, SHIPHERO_TOKEN_EXPIRATION
 
-    if is_token_expired():
-        print("Token is expired. Refreshing token...")
-        new_token, new_expiration = refresh_shiphero_token()
-        if not new_token:
-            raise Exception("Failed to refresh ShipHero API token.")
-        SHIPHERO_API_TOKEN = new_token
-        SHIPHERO_TOKEN_EXPIRATION = new_expiration.isoformat()
+    with shiphero_token_lock:
+        if is_token_expired():
+            print("Token is expired. Refreshing token...")
+            new_token, new_expiration = refresh_shiphero_token()
+            if not new_token:
+                raise Exception("Failed to refresh ShipHero API token.")
+            SHIPHERO_API_TOKEN = new_token
+            SHIPHERO_TOKEN_EXPIRATION = new_expiration.isoformat()
     
     headers = {
         "Authorization": f"Bearer {SHIPHERO_API_TOKEN}",
@@ -94,28 +106,37 @@ def fetch_shiphero_with_throttling(query, variables):
     }
     
     while True:
-        response = requests.post(SHIPHERO_GRAPHQL_ENDPOINT, json={"query": query, "variables": variables}, headers=headers)
+        # Wait for the shared credit scheduler before sending, and report the response back to it
+        with scheduler.request(query) as outcome:
+            response = requests.post(SHIPHERO_GRAPHQL_ENDPOINT, json={"query": query, "variables": variables}, headers=headers)
+            result = response.json() if response.status_code == 200 else None
+            outcome['result'] = result
+
+            throttle_error = next((error for error in (result or {}).get("errors", []) if error.get("code") == 30), None)
+            if throttle_error:
+                wait_time_str = throttle_error["time_remaining"]
+                wait_time = int(wait_time_str.split()[0])
+                outcome['throttled_for'] = wait_time
         
         if response.status_code == 200:
-            result = response.json()
             # Print the result for debugging purposes
             print(result)
             
-            if "errors" in result:
-                error = result["errors"][0]
-                if error["code"] == 30:
-                    wait_time_str = error["time_remaining"]
-                    wait_time = int(wait_time_str.split()[0])
-                    print(f"Throttling detected. Waiting for {wait_time} seconds before retrying...")
-                    time.sleep(wait_time)
-                    continue
+            if throttle_error:
+                print(f"Throttling detected. Waiting for {wait_time} seconds before retrying...")
+                continue
             return result
         else:
             print("Failed to fetch data")
             print(response.text)
             raise Exception("Failed to fetch data from ShipHero API")
 
-def fetch_shiphero_paginated_data(query, variables, data_key):
+def fetch_shiphero_paginated_data(query, variables, data_key, page_handler=None):
+    """
+    Fetch every page of a paginated ShipHero query and return the edges of all pages.
+    With page_handler, each page's edges are passed to it as they arrive and the list of
+    its return values is returned instead, so the raw pages need not be kept.
+    """
     data_list = []
     has_next_page = True
     after_cursor = None
@@ -128,7 +149,10 @@ def fetch_shiphero_paginated_data(query, variables, data_key):
         if result:
             data = result.get("data", {}).get(data_key, {}).get("data", {})
             if data and "edges" in data:
-                data_list.extend(data["edges"])
+                if page_handler:
+                    data_list.append(page_handler(data["edges"]))
+                else:
+                    data_list.extend(data["edges"])
                 page_info = result.get("data", {}).get(data_key, {}).get("data", {}).get("pageInfo")
                 if page_info:
                     has_next_page = page_info.get("hasNextPage", False)
@@ -200,18 +224,20 @@ def start_bulk_operation(inner_query):
         print(response.text)
         return None
 
-def check_bulk_operation_status():
+def check_bulk_operation_status(operation_id):
     query = """
-    {
-      currentBulkOperation {
-        id
-        status
-        errorCode
-        createdAt
-        completedAt
-        objectCount
-        fileSize
-        url
+    query ($id: ID!) {
+      node(id: $id) {
+        ... on BulkOperation {
+          id
+          status
+          errorCode
+          createdAt
+          completedAt
+          objectCount
+          fileSize
+          url
+        }
       }
     }
     """
@@ -221,7 +247,7 @@ def check_bulk_operation_status():
         "Content-Type": "application/json"
     }
     
-    response = requests.post(SHOPIFY_GRAPHQL_ENDPOINT, json={"query": query}, headers=headers)
+    response = requests.post(SHOPIFY_GRAPHQL_ENDPOINT, json={"query": query, "variables": {"id": operation_id}}, headers=headers)
     
     if response.status_code == 200:
         result = response.json()
@@ -232,40 +258,107 @@ def check_bulk_operation_status():
         return None
 
 def download_bulk_operation_results(url):
-    response = requests.get(url)
+    """
+    Download the JSONL result file of a bulk operation and return its lines, unparsed.
+    The body is streamed line by line and each row is kept as its JSON text, about a quarter of
+    the memory of a parsed dict. Consumers such as bulk_jsonl.normalize_bulk_jsonl parse one
+    row at a time as they iterate, so the parsed rows are never all held at once.
+    """
+    response = requests.get(url, stream=True)
     
     if response.status_code == 200:
-        data = response.text.splitlines()
-        return [json.loads(line) for line in data]
+        return [line.decode('utf-8') for line in response.iter_lines() if line]
     else:
         print("Failed to download bulk operation results")
         print(response.text)
         return None
 
-def fetch_shopify_bulk_operation(inner_query):
-    start_result = start_bulk_operation(inner_query)
-    if not start_result:
-        return None
-    
+# Bulk operation polling: the interval starts at the minimum, grows by the backoff factor
+# on every poll and is at least one second per BULK_POLL_OBJECTS_PER_SECOND objects already
+# processed, so large operations are polled less often
+BULK_POLL_MIN_INTERVAL = 1
+BULK_POLL_MAX_INTERVAL = 30
+BULK_POLL_BACKOFF = 1.5
+BULK_POLL_OBJECTS_PER_SECOND = 5000
+
+# How long to wait for the app's bulk query slot to free up before giving up on a bulk operation
+BULK_START_MAX_WAIT = 15 * 60
+
+def run_bulk_operation(inner_query):
+    """
+    Start a bulk operation, poll it by its ID until it finishes and return its downloaded results.
+    Returns None when the operation fails, or when another bulk operation of this app still holds
+    the slot after BULK_START_MAX_WAIT seconds.
+    """
+    start_deadline = time.monotonic() + BULK_START_MAX_WAIT
+    while True:
+        start_result = start_bulk_operation(inner_query)
+        if not start_result:
+            return None
+
+        run_query = (start_result.get("data") or {}).get("bulkOperationRunQuery") or {}
+        user_errors = run_query.get("userErrors") or []
+        if any("already in progress" in error.get("message", "") for error in user_errors):
+            # Shopify runs one bulk query per app and shop, e.g. another process of this app holds it.
+            # It is not cancelled here, since it may be a run that is still making progress.
+            if time.monotonic() + BULK_POLL_MAX_INTERVAL > start_deadline:
+                print(f"Another bulk operation is still in progress after {BULK_START_MAX_WAIT}s. Giving up.")
+                return None
+            print("Another bulk operation is in progress. Waiting before retrying...")
+            time.sleep(BULK_POLL_MAX_INTERVAL)
+            continue
+        if user_errors or not run_query.get("bulkOperation"):
+            print(f"Failed to start bulk operation: {user_errors}")
+            return None
+        operation_id = run_query["bulkOperation"]["id"]
+        break
+
+    interval = BULK_POLL_MIN_INTERVAL
     while True:
-        status_result = check_bulk_operation_status()
+        time.sleep(interval)
+        status_result = check_bulk_operation_status(operation_id)
         if not status_result:
             return None
         
-        bulk_operation = status_result.get("data", {}).get("currentBulkOperation")
+        bulk_operation = (status_result.get("data") or {}).get("node")
         if not bulk_operation:
-            print("No current bulk operation found")
+            print(f"Bulk operation {operation_id} not found")
             return None
         
         status = bulk_operation.get("status")
+        object_count = int(bulk_operation.get("objectCount") or 0)
         
         if status == "COMPLETED":
-            print("Bulk operation completed")
+            print(f"Bulk operation {operation_id} completed with {object_count} objects")
             url = bulk_operation.get("url")
-            return download_bulk_operation_results(url)
-        elif status == "FAILED":
-            print("Bulk operation failed")
+            # Operations that match no objects complete without a result file
+            return download_bulk_operation_results(url) if url else []
+        elif status in ("FAILED", "CANCELED", "EXPIRED"):
+            print(f"Bulk operation {operation_id} {status.lower()}: {bulk_operation.get('errorCode')}")
             return None
         else:
-            print(f"Bulk operation status: {status}")
-            time.sleep(3)
+            interval = min(BULK_POLL_MAX_INTERVAL, max(interval * BULK_POLL_BACKOFF, object_count / BULK_POLL_OBJECTS_PER_SECOND))
+            print(f"Bulk operation {operation_id} status: {status}, {object_count} objects, next poll in {interval:.1f}s")
+
+class BulkOperationScheduler:
+    """
+    Runs Shopify bulk operations one at a time, since Shopify allows a single bulk query per shop.
+    Operations are submitted from any thread and run in submission order on a worker thread;
+    submit returns a Future so the caller can keep working while the operation runs.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shopify-bulk")
+
+    def submit(self, inner_query):
+        return self.executor.submit(run_bulk_operation, inner_query)
+
+bulk_operation_scheduler = BulkOperationScheduler()
+
+def submit_shopify_bulk_operation(inner_query):
+    """Queue a bulk operation and return a Future resolving to its results."""
+    return bulk_operation_scheduler.submit(inner_query)
+
+def fetch_shopify_bulk_operation(inner_query):
+    """Run a bulk operation through the scheduler and wait for its results."""
+    return submit_shopify_bulk_operation(inner_query).result()
@@ -0,0 +1,109 @@
+import os, json, sqlite3, threading
+from datetime import datetime
+
+WRITE_JOURNAL_FILE = 'cache/write_journal.db'
+
+class StepInDoubt(Exception):
+    """A write was started by an earlier run but never confirmed, and it cannot be checked automatically."""
+
+class WriteJournal:
+    """
+    Write-ahead journal of the API writes of a job, stored in SQLite.
+    Each write is recorded as planned before it is sent and as done, with its result, once it
+    returned. A job that dies is resumed by its next run: steps already done are skipped and
+    return their recorded result, and a step left planned is checked with its recover function
+    before it is sent again.
+    A run is resumed only by a run of the same job with the same plan_key; an open run with a
+    different plan is abandoned.
+    """
+
+    def __init__(self, job, plan_key=None, path=WRITE_JOURNAL_FILE):
+        self.job = job
+        self.plan_key = plan_key
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job TEXT NOT NULL,
+                    plan_key TEXT,
+                    status TEXT NOT NULL,
+                    started_at TEXT NOT NULL,
+                    finished_at TEXT
+                )
+            """)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS steps (
+                    run_id INTEGER NOT NULL,
+                    step TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    payload TEXT,
+                    result TEXT,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (run_id, step)
+                )
+            """)
+        self.run_id, self.resumed = self.open_run()
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def open_run(self):
+        """Return the id of the open run of this job and plan, starting a new run when there is none."""
+        with self.lock, self.connect() as connection:
+            now = datetime.now().isoformat()
+            for run_id, plan_key in connection.execute("SELECT run_id, plan_key FROM runs WHERE job = ? AND status = 'open' ORDER BY run_id DESC", (self.job,)).fetchall():
+                if self.plan_key is None or plan_key == self.plan_key:
+                    print(f"Resuming {self.job} run {run_id}")
+                    return run_id, True
+                print(f"Warning: abandoning unfinished {self.job} run {run_id}, its plan differs from this run's")
+                connection.execute("UPDATE runs SET status = 'abandoned', finished_at = ? WHERE run_id = ?", (now, run_id))
+            cursor = connection.execute("INSERT INTO runs (job, plan_key, status, started_at) VALUES (?, ?, 'open', ?)", (self.job, self.plan_key, now))
+            return cursor.lastrowid, False
+
+    def record(self, step, status, payload=None, result=None):
+        with self.lock, self.connect() as connection:
+            connection.execute("""
+                INSERT INTO steps (run_id, step, status, payload, result, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(run_id, step) DO UPDATE SET status = excluded.status, result = excluded.result, updated_at = excluded.updated_at
+            """, (self.run_id, step, status, json.dumps(payload, default=str), json.dumps(result, default=str), datetime.now().isoformat()))
+
+    def lookup(self, step):
+        with self.lock, self.connect() as connection:
+            return connection.execute("SELECT status, payload, result FROM steps WHERE run_id = ? AND step = ?", (self.run_id, step)).fetchone()
+
+    def run_step(self, step, action, payload=None, recover=None):
+        """
+        Run one write unless it is already done in this run, and return its result.
+        recover(payload) is called for a step left planned by a dead run; it returns the result
+        when the write did land and None when it did not. Without recover, such a step raises StepInDoubt.
+        """
+        row = self.lookup(step)
+        if row is not None:
+            status, recorded_payload, recorded_result = row
+            if status == 'done':
+                print(f"Skipping {step}, already done")
+                return json.loads(recorded_result)
+            if recover is None:
+                raise StepInDoubt(f"{self.job} step {step} was started by an earlier run but not confirmed")
+            result = recover(json.loads(recorded_payload))
+            if result is not None:
+                print(f"Recovered {step} from an earlier run")
+                self.record(step, 'done', payload, result)
+                return result
+
+        self.record(step, 'planned', payload)
+        result = action()
+        self.record(step, 'done', payload, result)
+        return result
+
+    def forget(self, step):
+        """Drop a step from the open run so it is sent again, e.g. after checking a StepInDoubt by hand."""
+        with self.lock, self.connect() as connection:
+            connection.execute("DELETE FROM steps WHERE run_id = ? AND step = ?", (self.run_id, step))
+
+    def complete(self):
+        with self.lock, self.connect() as connection:
+            connection.execute("UPDATE runs SET status = 'completed', finished_at = ? WHERE run_id = ?", (datetime.now().isoformat(), self.run_id))